@@ -6,34 +6,55 @@ Run with:
 """
 
 import os
-
-# Set Paddle environment variables for every run
-os.environ["FLAGS_use_mkldnn"] = "0"
-os.environ["FLAGS_enable_pir_api"] = "0"
 import asyncio
-import json
+import hashlib
 import tempfile
 import shutil
 import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Union
 from datetime import datetime
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
+from cancellation import AnalysisCancelled, CancelToken
+from circuit_breaker import CircuitOpen, breakers
 from config import settings
-from medical_ocr_fast import analyze_document_streaming
+from deadline import Deadline
+from estimator import estimate, inspect_document, profile_from_metadata
+from extraction_store import get_extraction_store
+from medical_ocr_fast import PDF_STRATEGIES, analyze_bundle, analyze_document_streaming
+from metrics import metrics
+from patient_matching import get_patient_index, patient_index_loaded
+from profiling import ProfileBusy, finish, profile_analysis, stage
+from record_merge import diff_extractions, merge_into
+from response_encoding import CompressedStreamingResponse, NegotiatedResponse, dumps_json
+from scheduler import PRIORITY_CLASSES, QueueFull, Saturated, scheduler
+from shared_state import file_sha256, get_shared_state
+from stream_buffer import AnalysisStream, SharedStream, parse_event_id, streams
+from warmup import run_warmup, warmup_state
 
 # =============================================================================
 # FastAPI App
 # =============================================================================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background: liveness (/) answers at once, /ready waits
+    app.state.warmup_task = asyncio.create_task(asyncio.to_thread(run_warmup))
+    yield
+
+
 app = FastAPI(
     title="Medical OCR API",
     description="API for extracting structured medical information from documents using Gemini AI",
     version="1.0.0",
+    lifespan=lifespan,
+    # JSON or MessagePack, compressed by Accept-Encoding (response_encoding.py)
+    default_response_class=NegotiatedResponse,
 )
 
 # CORS configuration from environment
@@ -61,6 +82,80 @@ class OCRResponse(BaseModel):
     model: str
     extraction: dict
     usage: Optional[dict] = None
+    strategy: Optional[str] = None
+    document: Optional[dict] = None
+    timing: Optional[dict] = None
+    estimate: Optional[dict] = None
+    partial: Optional[bool] = None
+    deadline: Optional[dict] = None
+    extraction_id: Optional[int] = None
+    stored: Optional[bool] = None
+    patient_matches: Optional[List[dict]] = None
+    profile: Optional[dict] = None
+    timestamp: str
+
+
+class BundleOCRResponse(BaseModel):
+    success: bool
+    files: List[str]
+    model: str
+    extraction: dict
+    usage: Optional[dict] = None
+    strategy: Optional[List[str]] = None
+    document: Optional[List[dict]] = None
+    timing: Optional[dict] = None
+    partial: Optional[bool] = None
+    deadline: Optional[dict] = None
+    extraction_id: Optional[int] = None
+    stored: Optional[bool] = None
+    patient_matches: Optional[List[dict]] = None
+    timestamp: str
+
+
+class EstimateResponse(BaseModel):
+    model: str
+    document: dict
+    strategies: dict
+    recommended: str
+    latency_weight: float
+    warnings: List[str]
+    timestamp: str
+
+
+class ExtractionSearchResponse(BaseModel):
+    count: int
+    results: List[dict]
+    query_ms: float
+    timestamp: str
+
+
+class PatientMatchRequest(BaseModel):
+    name: Optional[str] = None
+    name_ar: Optional[str] = None
+    phone: Optional[str] = None
+    optional_phone: Optional[str] = None
+    dob: Optional[str] = None
+
+
+class PatientMatchResponse(BaseModel):
+    count: int
+    matches: List[dict]
+    query_ms: float
+    timestamp: str
+
+
+class MergeDiffRequest(BaseModel):
+    existing: dict
+    incoming: Optional[dict] = None
+    extraction_id: Optional[int] = None
+
+
+class MergeDiffResponse(BaseModel):
+    patient: dict
+    lists: dict
+    summary: dict
+    record: Optional[dict] = None
+    diff_ms: float
     timestamp: str
 
 
@@ -70,6 +165,307 @@ class ErrorResponse(BaseModel):
     detail: Optional[str] = None
 
 
+# =============================================================================
+# Helpers
+# =============================================================================
+ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+def validate_extension(filename: str) -> None:
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {file_ext}. Allowed: {', '.join(ALLOWED_EXTENSIONS)}",
+        )
+
+
+def save_upload(file: UploadFile, temp_path: str) -> None:
+    """Stream an upload to `temp_path` in 1 MB blocks, enforcing MAX_UPLOAD_MB.
+
+    The body is never held in memory as a whole; an oversized file is removed
+    again and answered with 413.
+    """
+    limit = settings.MAX_UPLOAD_MB * 1024 * 1024
+    written = 0
+    with open(temp_path, "wb") as buffer:
+        while block := file.file.read(1024 * 1024):
+            written += len(block)
+            if written > limit:
+                break
+            buffer.write(block)
+    if written > limit:
+        os.remove(temp_path)
+        raise HTTPException(
+            status_code=413,
+            detail=f"{file.filename} is larger than {settings.MAX_UPLOAD_MB} MB",
+        )
+
+
+def check_profiling(profile: bool) -> None:
+    if profile and not settings.PROFILING_ENABLED:
+        raise HTTPException(
+            status_code=403, detail="Profiling is disabled. Set PROFILING_ENABLED=true to use it."
+        )
+
+
+def request_deadline(request: Request, deadline_ms: Optional[int]) -> Deadline:
+    """Deadline from the deadline_ms query parameter or the X-Deadline-Ms header."""
+    value = deadline_ms if deadline_ms is not None else request.headers.get("x-deadline-ms")
+    try:
+        milliseconds = int(value) if value is not None else settings.DEFAULT_DEADLINE_MS
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid X-Deadline-Ms header: {value}")
+    if milliseconds < 0:
+        raise HTTPException(status_code=400, detail="Deadline must not be negative")
+    return Deadline.from_ms(milliseconds)
+
+
+def client_identity(request: Request) -> str:
+    """Fair-share key: X-Client-Id (clinic), else the original client address."""
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        return client_id.strip()[:64]
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "anonymous"
+
+
+def queue_full_error(exc: QueueFull) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"})
+
+
+def circuit_open_error(exc: CircuitOpen) -> HTTPException:
+    retry_after = max(1, int(exc.retry_after + 0.5))
+    return HTTPException(
+        status_code=503, detail=str(exc), headers={"Retry-After": str(retry_after)}
+    )
+
+
+def readiness() -> dict:
+    """Ready = warmed up and not saturated; reasons say why not."""
+    saturation = scheduler.saturation()
+    reasons = []
+    if not warmup_state.ready:
+        reasons.append("warming up")
+    if saturation > settings.READY_SATURATION_THRESHOLD:
+        reasons.append(
+            f"saturated ({saturation:.2f} > {settings.READY_SATURATION_THRESHOLD})"
+        )
+    return {
+        "ready": not reasons,
+        "reasons": reasons,
+        "saturation": round(saturation, 3),
+    }
+
+
+def sse_response(
+    stream: Union[AnalysisStream, SharedStream], after_seq: int = 0
+) -> StreamingResponse:
+    """Events of `stream` after `after_seq`, with heartbeats while nothing happens.
+
+    Compressed by Accept-Encoding; every event is flushed as it is sent.
+    """
+
+    async def event_stream():
+        events = stream.subscribe(after_seq)
+        try:
+            async for item in events:
+                if item is None:
+                    # SSE comment: keeps proxies from closing an idle connection
+                    yield ": heartbeat\n\n"
+                    continue
+                yield (
+                    f"id: {stream.event_id(item)}\n"
+                    f"event: {item.event}\n"
+                    f"data: {dumps_json(item.data).decode()}\n\n"
+                )
+        finally:
+            # Runs when the client disconnects, too
+            await events.aclose()
+
+    return CompressedStreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"X-Analysis-Id": stream.analysis_id, "Cache-Control": "no-cache"},
+    )
+
+
+def check_saturation(priority: str) -> None:
+    """Raise Saturated while /ready reports this replica as saturated.
+
+    Rejecting before any work is done lets the load balancer retry the
+    request on another replica (nginx/ocr.conf).
+    """
+    saturation = scheduler.saturation()
+    if saturation > settings.READY_SATURATION_THRESHOLD:
+        metrics.incr(f"scheduler.saturated.{priority}")
+        raise Saturated(priority, saturation)
+
+
+def run_scheduled(
+    fn,
+    priority: str,
+    client_id: str,
+    cancel_token: Optional[CancelToken] = None,
+    progress_cb=None,
+    **kwargs,
+) -> dict:
+    """Run `fn(**kwargs)` once the scheduler grants a slot of `priority`.
+
+    Raises Saturated (a QueueFull) instead of queueing on a saturated replica.
+    """
+    check_saturation(priority)
+
+    def on_queued(position: int) -> None:
+        if progress_cb:
+            progress_cb(3, f"queued (position {position})")
+
+    with scheduler.slot(priority, client_id, cancel_token, on_queued):
+        if progress_cb:
+            kwargs["progress_cb"] = progress_cb
+        return fn(cancel_token=cancel_token, **kwargs)
+
+
+async def watch_disconnect(request: Request, cancel_token: CancelToken) -> None:
+    """Cancel the analysis as soon as the client goes away."""
+    while not cancel_token.cancelled:
+        if await request.is_disconnected():
+            metrics.incr("analysis.client_disconnected")
+            cancel_token.cancel("client disconnected")
+            return
+        await asyncio.sleep(0.5)
+
+
+def stored_result(
+    document_sha256: str, model: str, strategy: Optional[str] = None
+) -> Optional[dict]:
+    """Result dict of the latest stored extraction of a document, if any.
+
+    An explicit `strategy` only accepts extractions that were asked for with it.
+    """
+    if not settings.EXTRACTION_STORE_ENABLED:
+        return None
+    record = get_extraction_store().latest_for_document(document_sha256, model, strategy)
+    if record is None:
+        return None
+    metrics.incr("extraction_store.hit")
+    return {
+        "success": True,
+        "file": record["file_name"] or "",
+        "model": record["model"],
+        # Per file for a bundle
+        "strategy": record.get("file_strategies") or record["strategy"],
+        "extraction": record["extraction"],
+        "extraction_id": record["id"],
+        "stored": True,
+        "timestamp": datetime.fromtimestamp(record["extracted_at"]).isoformat(),
+    }
+
+
+def store_result(
+    result: dict, document_sha256: str, file_name: Optional[str], strategy: Optional[str] = None
+) -> dict:
+    """Save a successful result to the extraction store and tag it with its id.
+
+    `strategy` is the one requested (default PDF_STRATEGY), see stored_result.
+
+    With patient matching on, the result also lists known patients that may
+    be the extracted one (`patient_matches`), and the patient is indexed.
+    """
+    if not (settings.EXTRACTION_STORE_ENABLED and result.get("success")):
+        return result
+    patient = result["extraction"].get("patient") or {}
+    if settings.PATIENT_MATCHING_ENABLED:
+        result["patient_matches"] = get_patient_index().match(patient)
+    result["extraction_id"] = get_extraction_store().save(
+        result, document_sha256, file_name, strategy or settings.PDF_STRATEGY
+    )
+    if settings.PATIENT_MATCHING_ENABLED:
+        # Indexes this patient and whatever other workers saved meanwhile
+        get_patient_index()
+    return result
+
+
+def run_analysis_shared(
+    file_path: str,
+    model: str,
+    progress_cb=None,
+    cancel_token: Optional[CancelToken] = None,
+    strategy: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    priority: str = "interactive_sync",
+    client_id: str = "anonymous",
+    file_name: Optional[str] = None,
+    refresh: bool = False,
+    profile: bool = False,
+) -> dict:
+    """Run the pipeline through the extraction store, the cross-worker result
+    cache and in-flight dedup.
+
+    A document already in the extraction store is answered from it unless
+    `refresh` is set. Identical documents uploaded to different worker
+    processes at the same time result in a single Gemini call. Requests with
+    a deadline use the cache but never wait for another worker, and degraded
+    results are not cached. Only actual analyses take a scheduler slot; cache
+    hits do not. With `profile`, the document is always analyzed and the
+    result carries a profiling report (see profiling.py).
+    """
+    document_sha256 = file_sha256(file_path)
+    if not refresh and not profile:
+        stored = stored_result(document_sha256, model, strategy)
+        if stored is not None:
+            return stored
+
+    def compute() -> dict:
+        result = run_scheduled(
+            analyze_document_streaming,
+            priority,
+            client_id,
+            cancel_token,
+            progress_cb,
+            file_path=file_path,
+            model=model,
+            strategy=strategy,
+            deadline=deadline,
+        )
+        return store_result(result, document_sha256, file_name, strategy)
+
+    if profile:
+        with profile_analysis(file_name or file_path) as active:
+            result = compute()
+            with stage("serialize"):
+                dumps_json(result)
+        result["profile"] = finish(active)
+        return result
+
+    if settings.RESULT_CACHE_TTL_SECONDS <= 0:
+        return compute()
+
+    # Results of different strategies differ (text layer vs images, sections)
+    key = f"{document_sha256}:{model}:{strategy or settings.PDF_STRATEGY}"
+    state = get_shared_state()
+    if deadline is not None and deadline.enabled:
+        cached = state.cache_get(key)
+        if cached is not None:
+            metrics.incr("shared_state.cache_hit")
+            cached["cached"] = True
+            return cached
+        result = compute()
+        if result.get("success") and not result.get("deadline", {}).get("degraded"):
+            state.cache_put(key, result, settings.RESULT_CACHE_TTL_SECONDS)
+        return result
+
+    return state.run_once(
+        key,
+        compute,
+        ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+        lease_seconds=settings.INFLIGHT_LEASE_SECONDS,
+        cancel_token=cancel_token,
+    )
+
+
 # =============================================================================
 # Endpoints
 # =============================================================================
@@ -83,8 +479,228 @@ async def health_check():
     }
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until warm-up has finished and while the replica is saturated."""
+    state = readiness()
+    return JSONResponse(
+        status_code=200 if state["ready"] else 503,
+        content={
+            **state,
+            "warmup": warmup_state.snapshot(),
+            "timestamp": datetime.now().isoformat(),
+        },
+    )
+
+
+@app.get("/status")
+async def replica_status():
+    """Detailed replica state for load balancers and dashboards."""
+    latency_p95 = scheduler.latency_p95()
+    return {
+        **readiness(),
+        "pid": os.getpid(),
+        "timestamp": datetime.now().isoformat(),
+        "warmup": warmup_state.snapshot(),
+        "capacity": {
+            "max_concurrent": scheduler.max_concurrent,
+            "in_flight": scheduler.in_flight(),
+            "queued": scheduler.queue_depth(),
+            "saturation_threshold": settings.READY_SATURATION_THRESHOLD,
+        },
+        "latency_p95_seconds": round(latency_p95, 3) if latency_p95 is not None else None,
+        "circuit_breakers": breakers.snapshot(),
+        "scheduler": scheduler.snapshot(),
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """In-process counters (cancellations, disconnects, ...) and scheduler queues."""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "counters": metrics.snapshot(),
+        "scheduler": scheduler.snapshot(),
+    }
+
+
+@app.post("/estimate", response_model=EstimateResponse)
+async def estimate_document(
+    file: Optional[UploadFile] = File(
+        default=None, description="Document to inspect (omit to estimate from metadata)"
+    ),
+    file_type: Optional[str] = Query(
+        default=None, description="Without a file: extension, e.g. pdf or jpg"
+    ),
+    size_bytes: Optional[int] = Query(default=None, ge=0, description="Without a file: file size"),
+    pages: int = Query(default=1, ge=1, description="Without a file: PDF page count"),
+    model: str = Query(
+        default="gemini-2.5-flash-lite",
+        description="Gemini model to use",
+        enum=[
+            "gemini-3-flash-preview",
+            "gemini-2.5-flash",
+            "gemini-2.5-flash-lite",
+        ],
+    ),
+    latency_weight: Optional[float] = Query(
+        default=None, ge=0, le=1, description="0 = cheapest, 1 = fastest (default from settings)"
+    ),
+):
+    """
+    Predict tokens, cost and latency per strategy without calling Gemini.
+
+    With a file, the document is inspected locally (pages, page sizes, text
+    layer, image size). Without one, `file_type`, `size_bytes` and `pages`
+    give a rough estimate so the UI can warn before uploading.
+    """
+    if file is None:
+        if not file_type or size_bytes is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Send a file, or file_type and size_bytes (plus pages for PDFs).",
+            )
+        validate_extension(f"document.{file_type.lstrip('.')}")
+        profile = profile_from_metadata(file_type, size_bytes, pages)
+        result = await asyncio.to_thread(estimate, profile, model, latency_weight)
+        return {**result, "timestamp": datetime.now().isoformat()}
+
+    validate_extension(file.filename)
+    temp_dir = tempfile.mkdtemp()
+    temp_path = os.path.join(temp_dir, file.filename)
+    try:
+        save_upload(file, temp_path)
+        profile = await asyncio.to_thread(inspect_document, temp_path)
+        result = await asyncio.to_thread(estimate, profile, model, latency_weight)
+        return {**result, "timestamp": datetime.now().isoformat()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not inspect document: {e}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@app.get("/extractions", response_model=ExtractionSearchResponse)
+async def search_extractions(
+    phone: Optional[str] = Query(default=None, description="Patient phone, any format"),
+    name: Optional[str] = Query(default=None, description="Patient name (prefix match)"),
+    name_ar: Optional[str] = Query(default=None, description="Arabic name (prefix match)"),
+    document_sha256: Optional[str] = Query(default=None, description="SHA-256 of the document"),
+    since: Optional[str] = Query(default=None, description="Extracted at or after (ISO date)"),
+    until: Optional[str] = Query(default=None, description="Extracted before (ISO date)"),
+    include_extraction: bool = Query(default=False, description="Include the extracted data"),
+    limit: int = Query(default=20, ge=1, le=200),
+):
+    """Prior extractions from the extraction store, newest first."""
+    if not settings.EXTRACTION_STORE_ENABLED:
+        raise HTTPException(status_code=404, detail="Extraction store is disabled")
+    start = datetime.now()
+    try:
+        results = await asyncio.to_thread(
+            get_extraction_store().search,
+            phone=phone,
+            name=name,
+            name_ar=name_ar,
+            document_sha256=document_sha256,
+            since=since,
+            until=until,
+            include_extraction=include_extraction,
+            limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {e}")
+    return {
+        "count": len(results),
+        "results": results,
+        "query_ms": round((datetime.now() - start).total_seconds() * 1000, 2),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+@app.get("/extractions/{extraction_id}")
+async def get_extraction(extraction_id: int):
+    """One stored extraction, including the extracted data."""
+    if not settings.EXTRACTION_STORE_ENABLED:
+        raise HTTPException(status_code=404, detail="Extraction store is disabled")
+    record = await asyncio.to_thread(get_extraction_store().get, extraction_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Extraction not found")
+    return record
+
+
+@app.delete("/extractions/{extraction_id}")
+async def delete_extraction(extraction_id: int):
+    """Remove a stored extraction (e.g. a wrong patient); the document will be analyzed again."""
+    if not settings.EXTRACTION_STORE_ENABLED:
+        raise HTTPException(status_code=404, detail="Extraction store is disabled")
+    if not await asyncio.to_thread(get_extraction_store().delete, extraction_id):
+        raise HTTPException(status_code=404, detail="Extraction not found")
+    if patient_index_loaded():
+        get_patient_index().remove(extraction_id)
+    return {"success": True, "deleted": extraction_id}
+
+
+@app.post("/patients/match", response_model=PatientMatchResponse)
+async def match_patient(
+    patient: PatientMatchRequest,
+    limit: int = Query(default=5, ge=1, le=50),
+):
+    """Stored patients that may be this one (phone, name, Arabic name, date of birth)."""
+    if not (settings.EXTRACTION_STORE_ENABLED and settings.PATIENT_MATCHING_ENABLED):
+        raise HTTPException(status_code=404, detail="Patient matching is disabled")
+    # Builds the index on first use when warm-up has not done it yet
+    index = await asyncio.to_thread(get_patient_index)
+    start = datetime.now()
+    matches = index.match(patient.model_dump(), limit=limit)
+    return {
+        "count": len(matches),
+        "matches": matches,
+        "query_ms": round((datetime.now() - start).total_seconds() * 1000, 3),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+@app.post("/merge/diff", response_model=MergeDiffResponse)
+async def merge_diff(
+    body: MergeDiffRequest,
+    include_record: bool = Query(default=False, description="Also return the merged record"),
+):
+    """Delta between an existing patient record and a new extraction.
+
+    The extraction is given inline (`incoming`) or as a stored `extraction_id`.
+    List entries are matched by natural keys (condition + onset, drug + start
+    date, test + lab date, study + image date, ...); the response lists only
+    added and updated entries, so the client writes just the delta.
+    """
+    incoming = body.incoming
+    if incoming is None:
+        if body.extraction_id is None:
+            raise HTTPException(status_code=400, detail="Provide incoming or extraction_id")
+        if not settings.EXTRACTION_STORE_ENABLED:
+            raise HTTPException(status_code=404, detail="Extraction store is disabled")
+        record = await asyncio.to_thread(get_extraction_store().get, body.extraction_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Extraction not found")
+        incoming = record["extraction"]
+
+    start = datetime.now()
+    if include_record:
+        merged, diff = merge_into(body.existing, incoming)
+    else:
+        merged, diff = None, diff_extractions(body.existing, incoming)
+    metrics.incr("merge.diffs")
+    return {
+        **diff,
+        "record": merged,
+        "diff_ms": round((datetime.now() - start).total_seconds() * 1000, 3),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
 @app.post("/analyze", response_model=OCRResponse)
 async def analyze_document(
+    request: Request,
     file: UploadFile = File(..., description="Medical document (PDF or image)"),
     model: str = Query(
         default="gemini-2.5-flash-lite",
@@ -98,6 +714,31 @@ async def analyze_document(
     use_schema: bool = Query(
         default=True, description="Enforce JSON schema for structured output"
     ),
+    strategy: Optional[str] = Query(
+        default=None,
+        description="How PDFs are sent: File API upload, rendered images, race both, text layer, chunked, per-section, or auto",
+        enum=list(PDF_STRATEGIES),
+    ),
+
+    deadline_ms: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description="Time budget in ms (or X-Deadline-Ms header); a partial result is returned instead of overrunning",
+    ),
+
+    priority: Optional[str] = Query(
+        default=None,
+        description="Scheduling class (default: interactive_sync); use batch for bulk imports",
+        enum=list(PRIORITY_CLASSES),
+    ),
+    refresh: bool = Query(
+        default=False,
+        description="Analyze again even if this document is in the extraction store",
+    ),
+    profile: bool = Query(
+        default=False,
+        description="Attach a profiling report: stage times, CPU samples, memory (needs PROFILING_ENABLED)",
+    ),
 ):
     """
     Analyze a medical document and extract structured information.
@@ -107,14 +748,9 @@ async def analyze_document(
     medications, vital signs, and more.
     """
     # Validate file type
-    allowed_extensions = {".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp"}
-    file_ext = Path(file.filename).suffix.lower()
-
-    if file_ext not in allowed_extensions:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file type: {file_ext}. Allowed: {', '.join(allowed_extensions)}",
-        )
+    validate_extension(file.filename)
+    check_profiling(profile)
+    deadline = request_deadline(request, deadline_ms)
 
     # Create temp file to store upload
     temp_dir = tempfile.mkdtemp()
@@ -122,14 +758,27 @@ async def analyze_document(
 
     try:
         # Save uploaded file
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        save_upload(file, temp_path)
 
-        # Run analysis (single request, streaming)
-        result = analyze_document_streaming(
-            file_path=temp_path,
-            model=model,
-        )
+        # Run analysis off the event loop so a disconnect can be observed
+        cancel_token = CancelToken()
+        watcher = asyncio.create_task(watch_disconnect(request, cancel_token))
+        try:
+            result = await asyncio.to_thread(
+                run_analysis_shared,
+                file_path=temp_path,
+                model=model,
+                cancel_token=cancel_token,
+                strategy=strategy,
+                deadline=deadline,
+                priority=priority or "interactive_sync",
+                client_id=client_identity(request),
+                file_name=file.filename,
+                refresh=refresh,
+                profile=profile,
+            )
+        finally:
+            watcher.cancel()
 
         if not result.get("success"):
             raise HTTPException(
@@ -143,6 +792,15 @@ async def analyze_document(
 
     except HTTPException:
         raise
+    except QueueFull as e:
+        raise queue_full_error(e)
+    except CircuitOpen as e:
+        raise circuit_open_error(e)
+    except ProfileBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except AnalysisCancelled as e:
+        # 499: client closed request (nobody is listening for the body anyway)
+        raise HTTPException(status_code=499, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
@@ -150,8 +808,125 @@ async def analyze_document(
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
+@app.post("/analyze/bundle", response_model=BundleOCRResponse)
+async def analyze_document_bundle(
+    request: Request,
+    files: List[UploadFile] = File(
+        ..., description="Documents of ONE patient (PDFs and/or images)"
+    ),
+    model: str = Query(
+        default="gemini-2.5-flash-lite",
+        description="Gemini model to use",
+        enum=[
+            "gemini-3-flash-preview",
+            "gemini-2.5-flash",
+            "gemini-2.5-flash-lite",
+        ],
+    ),
+    strategy: Optional[str] = Query(
+        default=None,
+        description="How PDFs are sent: File API upload, rendered images, race both, text layer, chunked, per-section, or auto",
+        enum=list(PDF_STRATEGIES),
+    ),
+
+    deadline_ms: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description="Time budget in ms (or X-Deadline-Ms header); a partial result is returned instead of overrunning",
+    ),
+
+    priority: Optional[str] = Query(
+        default=None,
+        description="Scheduling class (default: interactive_sync); use batch for bulk imports",
+        enum=list(PRIORITY_CLASSES),
+    ),
+    refresh: bool = Query(
+        default=False,
+        description="Analyze again even if this document is in the extraction store",
+    ),
+):
+    """
+    Analyze several documents belonging to the same patient in one model call.
+
+    Returns a single merged extraction instead of one per file.
+    """
+    if len(files) > settings.MAX_BUNDLE_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files: {len(files)}. Maximum per bundle: {settings.MAX_BUNDLE_FILES}",
+        )
+    for file in files:
+        validate_extension(file.filename)
+    deadline = request_deadline(request, deadline_ms)
+
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        # One sub-directory per file so identical filenames don't collide
+        temp_paths = []
+        for idx, file in enumerate(files):
+            file_dir = os.path.join(temp_dir, str(idx))
+            os.makedirs(file_dir)
+            temp_path = os.path.join(file_dir, file.filename)
+            save_upload(file, temp_path)
+            temp_paths.append(temp_path)
+
+        # A bundle is stored under the hash of its documents' hashes
+        file_hashes = await asyncio.to_thread(lambda: [file_sha256(p) for p in temp_paths])
+        bundle_sha256 = hashlib.sha256(":".join(sorted(file_hashes)).encode()).hexdigest()
+        file_names = ", ".join(file.filename for file in files)
+        if not refresh:
+            stored = await asyncio.to_thread(stored_result, bundle_sha256, model, strategy)
+            if stored is not None:
+                stored["files"] = [file.filename for file in files]
+                if not isinstance(stored["strategy"], list):
+                    # Stored before file_strategies was recorded
+                    stored["strategy"] = (stored["strategy"] or "").split(",")
+                return stored
+
+        cancel_token = CancelToken()
+        watcher = asyncio.create_task(watch_disconnect(request, cancel_token))
+        try:
+            result = await asyncio.to_thread(
+                run_scheduled,
+                analyze_bundle,
+                priority or "interactive_sync",
+                client_identity(request),
+                cancel_token,
+                file_paths=temp_paths,
+                model=model,
+                strategy=strategy,
+                deadline=deadline,
+            )
+        finally:
+            watcher.cancel()
+
+        if not result.get("success"):
+            raise HTTPException(
+                status_code=500, detail=result.get("error", "Analysis failed")
+            )
+
+        await asyncio.to_thread(store_result, result, bundle_sha256, file_names, strategy)
+        result["files"] = [file.filename for file in files]
+        return result
+
+    except HTTPException:
+        raise
+    except QueueFull as e:
+        raise queue_full_error(e)
+    except CircuitOpen as e:
+        raise circuit_open_error(e)
+    except AnalysisCancelled as e:
+        raise HTTPException(status_code=499, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
 @app.post("/analyze/stream")
 async def analyze_document_stream(
+    request: Request,
     file: UploadFile = File(..., description="Medical document (PDF or image)"),
     model: str = Query(
         default="gemini-2.5-flash-lite",
@@ -165,27 +940,61 @@ async def analyze_document_stream(
     use_schema: bool = Query(
         default=True, description="Enforce JSON schema for structured output"
     ),
-):
-    allowed_extensions = {".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp"}
-    file_ext = Path(file.filename).suffix.lower()
+    strategy: Optional[str] = Query(
+        default=None,
+        description="How PDFs are sent: File API upload, rendered images, race both, text layer, chunked, per-section, or auto",
+        enum=list(PDF_STRATEGIES),
+    ),
 
-    if file_ext not in allowed_extensions:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file type: {file_ext}. Allowed: {', '.join(allowed_extensions)}",
-        )
+    deadline_ms: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description="Time budget in ms (or X-Deadline-Ms header); a partial result is returned instead of overrunning",
+    ),
+
+    priority: Optional[str] = Query(
+        default=None,
+        description="Scheduling class (default: interactive_stream); use batch for bulk imports",
+        enum=list(PRIORITY_CLASSES),
+    ),
+    refresh: bool = Query(
+        default=False,
+        description="Analyze again even if this document is in the extraction store",
+    ),
+    profile: bool = Query(
+        default=False,
+        description="Attach a profiling report to the result event (needs PROFILING_ENABLED)",
+    ),
+):
+    validate_extension(file.filename)
+    check_profiling(profile)
+    deadline = request_deadline(request, deadline_ms)
+    client_id = client_identity(request)
+    # Once the event stream has started the status code is 200: reject now
+    try:
+        check_saturation(priority or "interactive_stream")
+    except QueueFull as e:
+        raise queue_full_error(e)
 
     temp_dir = tempfile.mkdtemp()
     temp_path = os.path.join(temp_dir, file.filename)
 
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    loop = asyncio.get_running_loop()
-    queue: asyncio.Queue[dict] = asyncio.Queue()
+    try:
+        save_upload(file, temp_path)
+    except HTTPException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
 
-    def push_event(event: str, data: dict) -> None:
-        loop.call_soon_threadsafe(queue.put_nowait, {"event": event, "data": data})
+    cancel_token = CancelToken()
+    stream = streams.create(cancel_token)
+    push_event = stream.publish
+    push_event(
+        "analysis",
+        {
+            "analysis_id": stream.analysis_id,
+            "resume_url": f"/analyze/stream/{stream.analysis_id}",
+        },
+    )
 
     def progress_cb(percent: int, message: str) -> None:
         push_event("progress", {"percent": percent, "message": message})
@@ -193,10 +1002,18 @@ async def analyze_document_stream(
     def run_analysis() -> None:
         try:
             progress_cb(5, "file saved")
-            result = analyze_document_streaming(
+            result = run_analysis_shared(
                 file_path=temp_path,
                 model=model,
                 progress_cb=progress_cb,
+                cancel_token=cancel_token,
+                strategy=strategy,
+                deadline=deadline,
+                priority=priority or "interactive_stream",
+                client_id=client_id,
+                file_name=file.filename,
+                refresh=refresh,
+                profile=profile,
             )
 
             if not result.get("success"):
@@ -210,6 +1027,11 @@ async def analyze_document_stream(
             else:
                 result["file"] = file.filename
                 push_event("result", result)
+        except AnalysisCancelled as exc:
+            # Ends the stream for clients that reconnect after the grace period
+            push_event("error", {"error": "Analysis cancelled", "detail": str(exc)})
+        except (QueueFull, CircuitOpen, ProfileBusy) as exc:
+            push_event("error", {"error": "Service busy", "detail": str(exc)})
         except Exception as exc:
             push_event(
                 "error",
@@ -220,16 +1042,41 @@ async def analyze_document_stream(
 
     threading.Thread(target=run_analysis, daemon=True).start()
 
-    async def event_stream():
-        while True:
-            payload = await queue.get()
-            event = payload["event"]
-            data = payload["data"]
-            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
-            if event in {"result", "error"}:
-                break
+    return sse_response(stream)
+
+
+@app.get("/analyze/stream")
+async def resume_stream_by_event_id(request: Request):
+    """Reconnect of an EventSource: the Last-Event-ID header names the analysis."""
+    analysis_id, seq = parse_event_id(request.headers.get("last-event-id"))
+    if not analysis_id:
+        raise HTTPException(
+            status_code=400, detail="Last-Event-ID header with an analysis id is required"
+        )
+    return await resume_stream(analysis_id, seq)
+
+
+@app.get("/analyze/stream/{analysis_id}")
+async def resume_stream_by_id(
+    request: Request,
+    analysis_id: str,
+    last_event_id: Optional[str] = Query(
+        default=None,
+        description="Last event id received (or Last-Event-ID header); omit to replay everything",
+    ),
+):
+    """Replay missed events of a streamed analysis and follow it to the end."""
+    _, seq = parse_event_id(last_event_id or request.headers.get("last-event-id"))
+    return await resume_stream(analysis_id, seq)
+
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+async def resume_stream(analysis_id: str, seq: int) -> StreamingResponse:
+    """Stream of this worker, else of another worker through the shared state."""
+    stream = await asyncio.to_thread(streams.find, analysis_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired analysis id")
+    metrics.incr("stream.resumed")
+    return sse_response(stream, seq)
 
 
 @app.exception_handler(Exception)
@@ -0,0 +1,425 @@
+"""
+Background ingestion through Gemini batch prediction.
+
+Archive backfills do not need interactive latency. Batch prediction jobs
+are billed at about half the real-time price and do not use the real-time
+quota that doctors waiting at the desk depend on; Gemini answers them
+within 24 hours:
+
+    python medical_ocr_fast.py archive/2023/ --background --output output/migration
+
+Each document is prepared as in real time (File API upload by default, see
+medical_ocr_fast.prepare_request) and the requests are submitted as jobs of
+at most BATCH_MAX_INLINE_MB of request data. Job status is checked every
+BATCH_POLL_SECONDS, a single cheap GET per job. When a job ends, every
+response is validated against MedicalOCR, written as `<stem>_fast.json`
+(as the batch mode of the CLI does) and saved to the extraction store, and
+the uploads are deleted.
+
+Submitted jobs are recorded in `batch_jobs.json` in the output directory. If
+the process stops (Ctrl+C, restart), running the same command again waits
+for those jobs instead of submitting the documents a second time.
+
+`LocalBatchAPI` is an in-process stand-in of `client.batches` that answers
+the requests through `client.models` (see `with_local_batches`).
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.genai import types
+from pydantic import ValidationError
+
+from batch_runner import BatchItem, BatchRunner, is_complete, write_result
+from config import settings
+from extraction_store import get_extraction_store
+from metrics import metrics
+from schema_registry import registry
+from shared_state import file_sha256
+
+MB = 1024 * 1024
+
+TERMINAL_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_PARTIALLY_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
+MANIFEST_NAME = "batch_jobs.json"
+
+
+def _state(job: Any) -> str:
+    state = getattr(job, "state", None)
+    return getattr(state, "value", None) or str(state)
+
+
+def _request_bytes(contents: List[Any]) -> int:
+    """Size of a request's inline data (uploaded files are references)."""
+    size = 0
+    for content in contents:
+        if isinstance(content, str):
+            size += len(content.encode("utf-8"))
+        elif getattr(content, "inline_data", None) is not None:
+            size += len(content.inline_data.data)
+    return size
+
+
+# =============================================================================
+# Local stand-in of the batch API
+# =============================================================================
+class LocalBatchAPI:
+    """`client.batches` for inlined requests, answered through `models`.
+
+    A job is pending on the first `get`, running until `polls` gets have
+    been made, then answered all at once. Responses are real Gen AI types
+    (InlinedResponse with a GenerateContentResponse), errors per request
+    included, so the ingestion code runs unchanged against it.
+    """
+
+    def __init__(self, models: Any, polls: int = 2):
+        self.models = models
+        self.polls = polls
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, model: str, src: List[Any], config: Any = None) -> Any:
+        with self._lock:
+            name = f"batches/local-{len(self._jobs) + 1}"
+            display_name = (config or {}).get("display_name") if isinstance(config, dict) else None
+            self._jobs[name] = {
+                "model": model,
+                "requests": list(src),
+                "display_name": display_name,
+                "gets": 0,
+                "state": "JOB_STATE_PENDING",
+                "responses": None,
+            }
+        return self._job(name)
+
+    def get(self, name: str, config: Any = None) -> Any:
+        with self._lock:
+            job = self._jobs[name]
+            job["gets"] += 1
+            if job["state"] == "JOB_STATE_PENDING":
+                job["state"] = "JOB_STATE_RUNNING"
+            if job["state"] == "JOB_STATE_RUNNING" and job["gets"] > self.polls:
+                job["responses"] = [self._answer(job["model"], request) for request in job["requests"]]
+                job["state"] = "JOB_STATE_SUCCEEDED"
+        return self._job(name)
+
+    def cancel(self, name: str, config: Any = None) -> None:
+        with self._lock:
+            if self._jobs[name]["state"] not in TERMINAL_STATES:
+                self._jobs[name]["state"] = "JOB_STATE_CANCELLED"
+
+    def delete(self, name: str, config: Any = None) -> None:
+        with self._lock:
+            self._jobs.pop(name, None)
+
+    def _answer(self, model: str, request: Dict[str, Any]) -> types.InlinedResponse:
+        metadata = request.get("metadata")
+        try:
+            response = self.models.generate_content(
+                model=model, contents=request["contents"], config=request.get("config")
+            )
+        except Exception as exc:
+            return types.InlinedResponse(metadata=metadata, error=types.JobError(code=500, message=str(exc)))
+        usage = response.usage_metadata
+        return types.InlinedResponse(
+            metadata=metadata,
+            response=types.GenerateContentResponse(
+                candidates=[
+                    types.Candidate(content=types.Content(role="model", parts=[types.Part(text=response.text)]))
+                ],
+                usage_metadata=types.GenerateContentResponseUsageMetadata(
+                    prompt_token_count=getattr(usage, "prompt_token_count", None),
+                    candidates_token_count=getattr(usage, "candidates_token_count", None),
+                ),
+            ),
+        )
+
+    def _job(self, name: str) -> types.BatchJob:
+        job = self._jobs[name]
+        dest = None
+        if job["responses"] is not None:
+            dest = types.BatchJobDestination(inlined_responses=job["responses"])
+        return types.BatchJob(
+            name=name,
+            display_name=job["display_name"],
+            model=job["model"],
+            state=job["state"],
+            dest=dest,
+        )
+
+
+class _LocalBatchClient:
+    def __init__(self, client: Any, polls: int):
+        self.files = client.files
+        self.models = client.models
+        self.batches = LocalBatchAPI(client.models, polls)
+
+
+def with_local_batches(client: Any, polls: int = 2) -> Any:
+    """`client` with its batch API replaced by a LocalBatchAPI."""
+    return _LocalBatchClient(client, polls)
+
+
+# =============================================================================
+# Ingestion
+# =============================================================================
+class BatchPrediction(BatchRunner):
+    """Runs documents as Gemini batch prediction jobs (see module docstring).
+
+    Item statuses: pending -> submitted -> done | failed, or skipped when
+    the output is already complete. The summary is the BatchRunner one.
+    """
+
+    def __init__(
+        self,
+        items: List[BatchItem],
+        model: str,
+        client: Any,
+        output_dir: Path,
+        concurrency: int = 4,
+        selected_pages: Optional[List[int]] = None,
+        strategy: Optional[str] = None,
+        force: bool = False,
+    ) -> None:
+        super().__init__(
+            items,
+            model,
+            concurrency=concurrency,
+            selected_pages=selected_pages,
+            strategy=strategy or "upload",
+            force=force,
+        )
+        self.client = client
+        self.manifest_path = Path(output_dir) / MANIFEST_NAME
+        self.jobs: List[Dict[str, Any]] = []
+
+    # -------------------------------------------------------------------------
+    # Manifest of submitted jobs
+    # -------------------------------------------------------------------------
+    def _load_manifest(self) -> None:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.jobs = json.load(f)["jobs"]
+        except (OSError, ValueError, KeyError):
+            self.jobs = []
+
+    def _save_manifest(self) -> None:
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.manifest_path.with_suffix(".json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "jobs": self.jobs}, f, indent=2, ensure_ascii=False)
+        temp.replace(self.manifest_path)
+
+    def _resume(self) -> None:
+        """Mark items of unfinished jobs as submitted (adding ones not named this run)."""
+        by_output = {str(item.output): item for item in self.items}
+        for job in self.jobs:
+            if job["collected"]:
+                continue
+            for document in job["documents"]:
+                item = by_output.get(document["output"])
+                if item is None:
+                    item = BatchItem(Path(document["file"]), Path(document["output"]))
+                    self.items.append(item)
+                    by_output[document["output"]] = item
+                item.sha256 = document["sha256"]
+                item.status = "submitted"
+        waiting = [job["name"] for job in self.jobs if not job["collected"]]
+        if waiting:
+            print(f"⏳ Resuming {len(waiting)} submitted job(s): {', '.join(waiting)}")
+
+    # -------------------------------------------------------------------------
+    # Prepare and submit
+    # -------------------------------------------------------------------------
+    def _prepare(self, item: BatchItem) -> Optional[Tuple[BatchItem, Dict[str, Any], Dict[str, Any]]]:
+        from medical_ocr_fast import prepare_request
+
+        try:
+            item.sha256 = file_sha256(str(item.path))
+            if not self.force and is_complete(item.output, item.sha256):
+                item.status = "skipped"
+                return None
+            contents, config, used_strategy, uploaded = prepare_request(
+                self.client, str(item.path), self.strategy, self.selected_pages
+            )
+        except Exception as exc:
+            item.status = "failed"
+            item.error = str(exc)
+            return None
+        document = {
+            "file": str(item.path),
+            "output": str(item.output),
+            "sha256": item.sha256,
+            "strategy": used_strategy,
+            "uploaded": uploaded,
+            "bytes": _request_bytes(contents),
+        }
+        return item, {"contents": contents, "config": config}, document
+
+    def _submit(self, prepared: List[Tuple[BatchItem, Dict[str, Any], Dict[str, Any]]]) -> None:
+        """Submit prepared requests as jobs of at most BATCH_MAX_INLINE_MB."""
+        limit = settings.BATCH_MAX_INLINE_MB * MB
+        batches: List[List[Tuple[BatchItem, Dict[str, Any], Dict[str, Any]]]] = []
+        size = limit
+        for entry in prepared:
+            if size + entry[2]["bytes"] > limit and (not batches or batches[-1]):
+                batches.append([])
+                size = 0
+            batches[-1].append(entry)
+            size += entry[2]["bytes"]
+
+        for batch in batches:
+            requests = [
+                {**request, "metadata": {"key": str(index)}}
+                for index, (_, request, _) in enumerate(batch)
+            ]
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            try:
+                job = self.client.batches.create(
+                    model=self.model,
+                    src=requests,
+                    config={"display_name": f"ai-clinic-ocr-{stamp}-{len(self.jobs) + 1}"},
+                )
+            except Exception as exc:
+                for item, _, document in batch:
+                    item.status = "failed"
+                    item.error = f"Batch submission failed: {exc}"
+                    self._delete_uploads(document["uploaded"])
+                continue
+            self.jobs.append(
+                {
+                    "name": job.name,
+                    "state": _state(job),
+                    "submitted_at": datetime.now().isoformat(),
+                    "collected": False,
+                    "documents": [document for _, _, document in batch],
+                }
+            )
+            for item, _, _ in batch:
+                item.status = "submitted"
+            self._save_manifest()
+            metrics.incr("batch_prediction.jobs_submitted")
+            print(f"🚀 Submitted {job.name}: {len(batch)} documents")
+
+    # -------------------------------------------------------------------------
+    # Wait and collect
+    # -------------------------------------------------------------------------
+    def _delete_uploads(self, names: List[str]) -> None:
+        for name in names:
+            try:
+                self.client.files.delete(name=name)
+            except Exception as exc:
+                print(f"   ⚠️ Could not delete remote file {name}: {exc}")
+
+    def _result(self, document: Dict[str, Any], response: Any, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Validated result dict of one response, shaped like a real-time result."""
+        extraction = registry.validate_json("medical_ocr", response.text or "").model_dump(mode="json")
+        usage = response.usage_metadata
+        return {
+            "success": True,
+            "file": document["file"],
+            "strategy": document["strategy"],
+            "model": self.model,
+            "extraction": extraction,
+            "batch": {"job": job["name"], "submitted_at": job["submitted_at"]},
+            "usage": {
+                "prompt_tokens": (usage.prompt_token_count or 0) if usage else 0,
+                "output_tokens": (usage.candidates_token_count or 0) if usage else 0,
+                "cached_tokens": (usage.cached_content_token_count or 0) if usage else 0,
+            },
+            "source_sha256": document["sha256"],
+            "timestamp": datetime.now().isoformat(),
+        }
+
+    def _collect(self, job: Dict[str, Any], remote: Any) -> None:
+        """Validate, write and store the responses of a finished job."""
+        by_output = {str(item.output): item for item in self.items}
+        state = job["state"]
+        responses = list(getattr(getattr(remote, "dest", None), "inlined_responses", None) or [])
+        by_key = {
+            (response.metadata or {}).get("key", str(index)): response
+            for index, response in enumerate(responses)
+        }
+        for index, document in enumerate(job["documents"]):
+            item = by_output[document["output"]]
+            response = by_key.get(str(index))
+            try:
+                if response is None:
+                    raise RuntimeError(f"Batch job ended as {state} without a response")
+                if response.error:
+                    raise RuntimeError(f"Batch request failed: {response.error.message}")
+                result = self._result(document, response.response, job)
+            except (RuntimeError, ValidationError, ValueError) as exc:
+                item.status = "failed"
+                item.error = str(exc)
+                continue
+            write_result(item.output, result)
+            if settings.EXTRACTION_STORE_ENABLED:
+                get_extraction_store().save(
+                    result, document["sha256"], Path(document["file"]).name, self.strategy
+                )
+            item.usage = result["usage"]
+            item.status = "done"
+        for document in job["documents"]:
+            self._delete_uploads(document["uploaded"])
+        job["collected"] = True
+        self._save_manifest()
+        metrics.incr(f"batch_prediction.jobs.{state.lower()}")
+
+    def _wait(self) -> None:
+        """Poll unfinished jobs every BATCH_POLL_SECONDS and collect them as they end."""
+        while True:
+            pending = [job for job in self.jobs if not job["collected"]]
+            if not pending:
+                return
+            for job in pending:
+                remote = self.client.batches.get(name=job["name"])
+                state = _state(remote)
+                if state != job["state"]:
+                    print(f"   • {job['name']}: {state}")
+                    job["state"] = state
+                    self._save_manifest()
+                if state in TERMINAL_STATES:
+                    self._collect(job, remote)
+                    done = sum(1 for d in job["documents"] if self._item_status(d) == "done")
+                    print(f"✅ {job['name']}: {done}/{len(job['documents'])} documents extracted")
+            if any(not job["collected"] for job in self.jobs):
+                time.sleep(settings.BATCH_POLL_SECONDS)
+
+    def _item_status(self, document: Dict[str, Any]) -> str:
+        return next(item.status for item in self.items if str(item.output) == document["output"])
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        started_at = datetime.now().isoformat()
+        self._load_manifest()
+        self._resume()
+        todo = [item for item in self.items if item.status == "pending"]
+        print(f"📦 Background batch: {len(todo)} files, model {self.model}")
+
+        try:
+            # Preparing is mostly File API uploads: run it concurrently
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                prepared = [entry for entry in executor.map(self._prepare, todo) if entry]
+            for item in todo:
+                if item.status == "failed":
+                    print(f"❌ {item.path.name}: {item.error}")
+            if prepared:
+                self._submit(prepared)
+            self._wait()
+        except KeyboardInterrupt:
+            # Jobs keep running at Gemini; the next run with the same output resumes them
+            print(f"\n🛑 Stopped waiting. Submitted jobs keep running; rerun to collect them ({self.manifest_path})")
+
+        return self.summary(time.perf_counter() - start, started_at)
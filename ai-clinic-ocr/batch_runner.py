@@ -0,0 +1,274 @@
+"""
+Batch mode of the medical_ocr_fast CLI.
+
+Processes directories, globs and file lists in one process with a bounded
+number of concurrent analyses:
+
+    python medical_ocr_fast.py archive/2023/ --concurrency 8
+    python medical_ocr_fast.py "scans/**/*.pdf" --output output/migration
+
+Each document is saved as `<stem>_fast.json` (directory structure below an
+input directory is kept) together with the SHA-256 of its content. A rerun
+skips documents whose output already holds a complete result for the same
+content, so an interrupted migration resumes where it stopped. The run ends
+with a summary of throughput, token usage and failures, which is also saved
+as `batch_summary.json`.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from cancellation import AnalysisCancelled, CancelToken
+from deadline import Deadline
+from shared_state import file_sha256
+
+SUPPORTED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+@dataclass
+class BatchItem:
+    path: Path
+    output: Path
+    sha256: str = ""
+    status: str = "pending"  # pending -> done | skipped | failed | cancelled (| submitted)
+    error: Optional[str] = None
+    seconds: float = 0.0
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+def _is_glob(pattern: str) -> bool:
+    return any(ch in pattern for ch in "*?[")
+
+
+def collect_inputs(patterns: List[str]) -> List[Path]:
+    """Files named by `patterns` (files, directories searched recursively, globs), in order."""
+    files: List[Path] = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            matches = sorted(p for p in path.rglob("*") if p.is_file())
+        elif _is_glob(pattern):
+            matches = sorted(Path(p) for p in glob.glob(pattern, recursive=True))
+        else:
+            matches = [path]
+        files.extend(p for p in matches if p.suffix.lower() in SUPPORTED_EXTENSIONS or p == path)
+    # The same file named twice (e.g. by a directory and a glob) is processed once
+    unique = list(dict.fromkeys(p.resolve() for p in files))
+    return [Path(p) for p in unique]
+
+
+def plan_outputs(patterns: List[str], files: List[Path], output_dir: Path) -> List[BatchItem]:
+    """Output path per file: relative location below an input directory is kept."""
+    roots = [Path(p).resolve() for p in patterns if Path(p).is_dir()]
+    items: List[BatchItem] = []
+    taken: Dict[Path, int] = {}
+    for path in files:
+        relative = Path()
+        for root in roots:
+            if root in path.parents:
+                relative = path.parent.relative_to(root)
+                break
+        output = output_dir / relative / f"{path.stem}_fast.json"
+        # Same stem in two flat inputs: number the later ones (stable across runs)
+        count = taken.get(output, 0)
+        taken[output] = count + 1
+        if count:
+            output = output.with_name(f"{path.stem}_{count + 1}_fast.json")
+        items.append(BatchItem(path, output))
+    return items
+
+
+def is_complete(output: Path, sha256: str) -> bool:
+    """Whether `output` holds a complete (successful, not partial) result for this content."""
+    try:
+        with open(output, encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (
+        result.get("success") is True
+        and not result.get("partial")
+        and result.get("source_sha256") == sha256
+    )
+
+
+def write_result(output: Path, result: Dict[str, Any]) -> None:
+    """Write atomically, so a crash never leaves a half-written output behind."""
+    output.parent.mkdir(parents=True, exist_ok=True)
+    temp = output.with_suffix(".json.tmp")
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    os.replace(temp, output)
+
+
+def _error_summary(error: str) -> str:
+    line = (error or "unknown error").strip().splitlines()[0]
+    return line[:100]
+
+
+class BatchRunner:
+    """Runs analyze_document_streaming over many files with bounded concurrency."""
+
+    def __init__(
+        self,
+        items: List[BatchItem],
+        model: str,
+        concurrency: int = 4,
+        selected_pages: Optional[List[int]] = None,
+        strategy: Optional[str] = None,
+        deadline_ms: Optional[int] = None,
+        force: bool = False,
+    ) -> None:
+        self.items = items
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.selected_pages = selected_pages
+        self.strategy = strategy
+        self.deadline_ms = deadline_ms
+        self.force = force
+        self.cancel_token = CancelToken()
+        self._lock = threading.Lock()
+        self._finished = 0
+
+    def _process(self, item: BatchItem) -> BatchItem:
+        from medical_ocr_fast import analyze_document_streaming
+
+        start = time.perf_counter()
+        try:
+            item.sha256 = file_sha256(str(item.path))
+            if not self.force and is_complete(item.output, item.sha256):
+                item.status = "skipped"
+                return item
+
+            result = analyze_document_streaming(
+                str(item.path),
+                model=self.model,
+                selected_pages=self.selected_pages,
+                strategy=self.strategy,
+                cancel_token=self.cancel_token,
+                deadline=Deadline.from_ms(self.deadline_ms),
+            )
+            item.usage = result.get("usage") or {}
+            if result.get("success"):
+                result["source_sha256"] = item.sha256
+                write_result(item.output, result)
+                item.status = "done"
+            else:
+                item.status = "failed"
+                item.error = result.get("error") or "Analysis failed"
+        except AnalysisCancelled as exc:
+            item.status = "cancelled"
+            item.error = str(exc)
+        except Exception as exc:
+            item.status = "failed"
+            item.error = str(exc)
+        finally:
+            item.seconds = time.perf_counter() - start
+        return item
+
+    def _report(self, item: BatchItem) -> None:
+        icons = {"done": "✅", "skipped": "⏭️ ", "failed": "❌", "cancelled": "🛑"}
+        with self._lock:
+            self._finished += 1
+            finished = self._finished
+        detail = f" - {_error_summary(item.error)}" if item.error else ""
+        print(
+            f"{icons.get(item.status, '•')} [{finished}/{len(self.items)}] "
+            f"{item.path.name} ({item.seconds:.1f}s){detail}"
+        )
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        started_at = datetime.now().isoformat()
+        print(f"📦 Batch: {len(self.items)} files, concurrency {self.concurrency}")
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = [executor.submit(self._process, item) for item in self.items]
+            for future in as_completed(futures):
+                self._report(future.result())
+        except KeyboardInterrupt:
+            # Finished outputs are kept; the next run resumes after them
+            print("\n🛑 Interrupted, stopping running analyses...")
+            self.cancel_token.cancel("interrupted")
+            executor.shutdown(wait=True, cancel_futures=True)
+        finally:
+            executor.shutdown(wait=True)
+
+        return self.summary(time.perf_counter() - start, started_at)
+
+    def summary(self, wall_seconds: float, started_at: str) -> Dict[str, Any]:
+        counts: Dict[str, int] = defaultdict(int)
+        usage: Dict[str, int] = defaultdict(int)
+        failures: Dict[str, List[str]] = defaultdict(list)
+        for item in self.items:
+            counts[item.status] += 1
+            for key, value in item.usage.items():
+                usage[key] += value or 0
+            if item.status == "failed":
+                failures[_error_summary(item.error)].append(str(item.path))
+
+        done = counts["done"]
+        return {
+            "started_at": started_at,
+            "finished_at": datetime.now().isoformat(),
+            "model": self.model,
+            "concurrency": self.concurrency,
+            "files": len(self.items),
+            "counts": dict(counts),
+            "wall_seconds": round(wall_seconds, 2),
+            "docs_per_minute": round(done / wall_seconds * 60, 2) if wall_seconds else 0.0,
+            "usage": dict(usage),
+            "failures": [
+                {"error": error, "count": len(paths), "files": paths}
+                for error, paths in sorted(failures.items(), key=lambda kv: -len(kv[1]))
+            ],
+            "items": [
+                {
+                    "file": str(item.path),
+                    "output": str(item.output),
+                    "status": item.status,
+                    "seconds": round(item.seconds, 2),
+                    **({"error": item.error} if item.error else {}),
+                }
+                for item in self.items
+            ],
+        }
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    counts = summary["counts"]
+    usage = summary["usage"]
+    print("\n" + "=" * 60)
+    print("📦 Batch Summary")
+    print("=" * 60)
+    print(
+        f"Files: {summary['files']}  ✅ done {counts.get('done', 0)}  "
+        f"⏭️  skipped {counts.get('skipped', 0)}  ❌ failed {counts.get('failed', 0)}"
+        + (f"  🛑 cancelled {counts['cancelled']}" if counts.get("cancelled") else "")
+        + (f"  ⏸️  not started {counts['pending']}" if counts.get("pending") else "")
+        + (f"  ⏳ waiting in batch jobs {counts['submitted']}" if counts.get("submitted") else "")
+    )
+    print(
+        f"⏱️  Wall time: {summary['wall_seconds']:.1f}s  "
+        f"Throughput: {summary['docs_per_minute']:.1f} docs/min"
+    )
+    print(
+        f"💰 Tokens: In={usage.get('prompt_tokens', 0):,} "
+        f"(cached {usage.get('cached_tokens', 0):,}), Out={usage.get('output_tokens', 0):,}"
+    )
+    if summary["failures"]:
+        print("\n❌ Failures:")
+        for failure in summary["failures"]:
+            files = ", ".join(Path(f).name for f in failure["files"][:3])
+            more = f" +{failure['count'] - 3} more" if failure["count"] > 3 else ""
+            print(f"   {failure['count']}× {failure['error']}\n      {files}{more}")
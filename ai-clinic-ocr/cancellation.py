@@ -0,0 +1,70 @@
+"""
+Cooperative cancellation for long-running document analyses.
+
+A CancelToken is created by the caller (e.g. the SSE endpoint) and handed to
+analyze_document_streaming, which checks it between stages, while polling the
+File API and between rendered pages. Cancelling the token never interrupts a
+thread forcibly - the pipeline notices it at the next checkpoint and raises
+AnalysisCancelled after cleaning up its own resources. A Gemini generation is
+waited on, not run, by the pipeline thread, so it stops waiting at once.
+"""
+
+import threading
+from typing import Callable, List, Optional
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside the pipeline once its cancel token has been triggered."""
+
+    def __init__(self, stage: str, reason: Optional[str] = None, partial: Optional[str] = None):
+        self.stage = stage
+        self.reason = reason
+        # Response text generated before the cancellation, if any
+        self.partial = partial
+        super().__init__(f"Analysis cancelled during {stage}: {reason or 'cancelled'}")
+
+
+class CancelToken:
+    """Thread-safe, one-shot cancellation flag with interruptible sleeps."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Trigger cancellation. Only the first call has any effect."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run callback when the token is cancelled (immediately if it already is)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self, stage: str) -> None:
+        if self._event.is_set():
+            raise AnalysisCancelled(stage, self.reason)
+
+    def sleep(self, seconds: float, stage: str) -> None:
+        """Sleep for up to `seconds`, waking early (and raising) on cancellation."""
+        if self._event.wait(timeout=seconds):
+            raise AnalysisCancelled(stage, self.reason)
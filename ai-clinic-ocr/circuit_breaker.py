@@ -0,0 +1,136 @@
+"""
+Circuit breakers for Gemini calls, one per model.
+
+After BREAKER_FAILURE_THRESHOLD consecutive upstream failures (5xx, 429,
+connection errors) a breaker opens and calls fail fast with CircuitOpen for
+BREAKER_RESET_SECONDS. Then a single trial call is let through (half-open):
+success closes the breaker, failure opens it again. The state of every
+breaker is reported by /status.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from cancellation import AnalysisCancelled
+from config import settings
+from metrics import metrics
+
+UPSTREAM_ERROR_CODES = ("429", "500", "502", "503", "504")
+
+
+class CircuitOpen(Exception):
+    """Gemini calls for this model are failing; the call was not attempted."""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Gemini ({name}) is unavailable, retry in {retry_after:.0f}s")
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Errors that say something about Gemini's health (not about our request)."""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return any(code in str(exc) for code in UPSTREAM_ERROR_CODES)
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` failures -> half_open after `reset_seconds`."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def _retry_after(self) -> float:
+        return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def _before_call(self) -> None:
+        with self._lock:
+            if self.state == "open":
+                if self._retry_after() > 0:
+                    metrics.incr("circuit.rejected")
+                    raise CircuitOpen(self.name, self._retry_after())
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial_running:
+                    metrics.incr("circuit.rejected")
+                    raise CircuitOpen(self.name, 1.0)
+                self._trial_running = True
+
+    def _after_call(self, failed: bool, counts: bool = True) -> None:
+        with self._lock:
+            self._trial_running = False
+            if not counts:
+                return
+            if not failed:
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    metrics.incr("circuit.opened")
+                    print(f"   🔌 Circuit for {self.name} opened after {self.failures} failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    @contextmanager
+    def call(self) -> Iterator[None]:
+        """Guard one Gemini call; raises CircuitOpen instead of calling when open."""
+        self._before_call()
+        try:
+            yield
+        except AnalysisCancelled:
+            self._after_call(failed=False, counts=False)
+            raise
+        except Exception as exc:
+            # Our own bad requests say nothing about Gemini's health
+            self._after_call(failed=True, counts=is_upstream_failure(exc))
+            raise
+        self._after_call(failed=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self.state
+            if state == "open" and self._retry_after() <= 0:
+                state = "half_open"
+            return {
+                "state": state,
+                "failures": self.failures,
+                "retry_after_seconds": round(self._retry_after(), 1) if state == "open" else None,
+            }
+
+
+class BreakerRegistry:
+    """Lazily created breaker per name (model)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(
+                    name, settings.BREAKER_FAILURE_THRESHOLD, settings.BREAKER_RESET_SECONDS
+                )
+            return self._breakers[name]
+
+    def any_open(self) -> bool:
+        return any(b["state"] == "open" for b in self.snapshot().values())
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+breakers = BreakerRegistry()
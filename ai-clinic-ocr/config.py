@@ -12,12 +12,134 @@ class Settings(BaseSettings):
     # Gemini model configuration
     GEMINI_MODEL: str = "gemini-2.5-flash-lite"
     
+    # How PDFs are sent to Gemini: "upload" (File API, render on failure),
+    # "images" (always render pages) or "race" (both concurrently, first wins),
+    # "text" (PDF text layer, scanned pages rendered), "chunked" (page chunks
+    # analyzed concurrently and merged), "sections" (pages classified locally,
+    # each group extracted with only its sections) or "auto" (estimator picks)
+    PDF_STRATEGY: str = "upload"
+    PDF_CHUNK_PAGES: int = 10
+    PDF_CHUNK_CONCURRENCY: int = 4
+    SECTION_MAX_GROUPS: int = 4  # "sections": page groups (requests) per document
+    TEXT_LAYER_MIN_CHARS: int = 50  # pages with less text are rendered instead
+    RENDER_DPI: int = 144  # page images sent to Gemini (zoom = RENDER_DPI / 72)
+
+    # Large PDFs (pdf_split.py): above LARGE_PDF_MB (0 = never), "upload" and
+    # "chunked" send page-range sub-PDFs of about LARGE_PDF_PART_MB, uploaded
+    # concurrently; parts held in memory at once stay under LARGE_PDF_MEMORY_MB
+    LARGE_PDF_MB: int = 20
+    LARGE_PDF_PART_MB: int = 8
+    LARGE_PDF_UPLOAD_CONCURRENCY: int = 4
+    LARGE_PDF_MEMORY_MB: int = 64
+
+    # Largest accepted upload (streamed to disk); keep client_max_body_size in
+    # nginx/*.conf in line with it
+    MAX_UPLOAD_MB: int = 200
+
+    # Response encodings (response_encoding.py): JSON or MessagePack by Accept,
+    # brotli / gzip by Accept-Encoding for bodies of at least the minimum size
+    RESPONSE_COMPRESSION: bool = True
+    RESPONSE_COMPRESS_MIN_BYTES: int = 1024
+    RESPONSE_GZIP_LEVEL: int = 6
+    RESPONSE_BROTLI_QUALITY: int = 5
+
+    # Background ingestion (--background, batch_prediction.py): documents are
+    # sent as Gemini batch prediction jobs of at most BATCH_MAX_INLINE_MB of
+    # request data each, whose status is checked every BATCH_POLL_SECONDS
+    BATCH_POLL_SECONDS: float = 300.0
+    BATCH_MAX_INLINE_MB: int = 20
+
+    # Opt-in profiling of single analyses (profiling.py). The API refuses
+    # profile=true unless enabled: tracemalloc slows the whole process down.
+    # Reports and sampled stacks are saved to PROFILE_DIR
+    PROFILING_ENABLED: bool = False
+    PROFILE_DIR: str = "/tmp/ai-clinic-ocr/profiles"
+    PROFILE_SAMPLE_INTERVAL_MS: int = 5
+    PROFILE_TOP: int = 20
+
+    # Pre-flight estimator (estimator.py): 0 = cheapest strategy, 1 = fastest
+    ESTIMATE_LATENCY_WEIGHT: float = 0.5
+    ESTIMATE_WARN_PAGES: int = 50
+    ESTIMATE_WARN_SECONDS: float = 60.0
+
+    # Per-request deadlines (X-Deadline-Ms / deadline_ms); 0 = no default deadline
+    DEFAULT_DEADLINE_MS: int = 0
+    DEADLINE_SAFETY_FACTOR: float = 0.8  # plan to finish within this share of it
+
+    # Gemini context caching of the static prompt + schema prefix
+    CONTEXT_CACHE_ENABLED: bool = True
+    CONTEXT_CACHE_TTL_SECONDS: int = 3600
+    CONTEXT_CACHE_REFRESH_SECONDS: int = 300  # extend TTL when less remains
+    CONTEXT_CACHE_RETRY_SECONDS: int = 600  # back-off after a failed create
+
+    # Also create the context cache entry during startup warm-up (network call)
+    WARMUP_NETWORK: bool = False
+
+    # Maximum number of files accepted by /analyze/bundle
+    MAX_BUNDLE_FILES: int = 10
+
+    # Legacy OCR engines (requirements-legacy.txt), loaded lazily by engines.py
+    ENABLE_PADDLE_OCR: bool = False
+    ENABLE_DOCUMENT_AI: bool = False
+
     # Server configuration
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     
     # CORS origins (comma-separated)
     CORS_ORIGINS: str = "http://localhost:3000"
+
+    # Multi-process serving (uvicorn also reads WEB_CONCURRENCY for --workers)
+    WEB_CONCURRENCY: int = 1
+    SHARED_STATE_PATH: str = "/tmp/ai-clinic-ocr/shared_state.db"
+    RESULT_CACHE_TTL_SECONDS: int = 3600  # 0 disables the shared result cache
+    # Renewed every third of it during an analysis; frees a dead worker's keys
+    INFLIGHT_LEASE_SECONDS: int = 300
+
+    # Persistent store of validated extractions (extraction_store.py); known
+    # documents are answered from it instead of calling Gemini again
+    EXTRACTION_STORE_ENABLED: bool = True
+    EXTRACTION_STORE_PATH: str = "/tmp/ai-clinic-ocr/extractions.db"
+
+    # Duplicate-patient matching over the stored extractions
+    # (patient_matching.py): blocking keys shared by more patients than
+    # MATCH_MAX_BLOCK are skipped, candidates below MATCH_MIN_SCORE dropped
+    PATIENT_MATCHING_ENABLED: bool = True
+    MATCH_MAX_BLOCK: int = 1000
+    MATCH_MIN_SCORE: float = 0.4
+
+    # Analysis scheduler (scheduler.py), per worker process: concurrent
+    # analyses, slots batch work may never take, and queued analyses per class
+    SCHEDULER_MAX_CONCURRENT: int = 4
+    SCHEDULER_RESERVED_INTERACTIVE: int = 2
+    SCHEDULER_MAX_QUEUE: int = 100
+
+    # Resumable /analyze/stream: events are kept this long after the result,
+    # a disconnected analysis keeps running for the grace period, and an SSE
+    # comment is sent after this many idle seconds
+    STREAM_RETENTION_SECONDS: float = 600.0
+    STREAM_RESUME_GRACE_SECONDS: float = 30.0
+    STREAM_HEARTBEAT_SECONDS: float = 15.0
+
+    # Readiness (/ready): not ready, and new analyses are rejected with 503,
+    # while (in flight + queued) / max concurrent analyses is above this
+    READY_SATURATION_THRESHOLD: float = 2.0
+
+    # Circuit breaker per Gemini model (circuit_breaker.py)
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_SECONDS: float = 30.0
+
+    # Shared Gemini rate budget across all workers (0 = unlimited)
+    GEMINI_REQUESTS_PER_MINUTE: int = 0
+    GEMINI_BURST: int = 5
+
+    # Hedged generation calls (opt-in): fire a second identical request when
+    # the first is slower than HEDGE_PERCENTILE of recent latency for its model
+    HEDGE_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 95.0
+    HEDGE_MIN_SAMPLES: int = 20
+    HEDGE_MAX_RATE: float = 0.1  # max fraction of calls that may be hedged
+    HEDGE_WINDOW_SECONDS: int = 300
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -0,0 +1,246 @@
+"""
+Per-request deadlines with graceful degradation.
+
+A Deadline is created from the caller's time budget (X-Deadline-Ms header or
+deadline_ms query parameter) and handed down the pipeline next to the cancel
+token:
+
+* `plan_for_deadline` degrades the request up front when the pre-flight
+  estimate does not fit: fastest strategy, faster model, core sections only,
+  then fewer pages.
+* Stages cap their own waits with `stage_budget` (File API polling, retry
+  backoff) so that `reserve_seconds` remain for generation.
+* When the deadline passes, `arm()` cancels the work token with
+  DEADLINE_REASON and the pipeline returns what it has as a partial result
+  flagged with "partial": true instead of failing.
+"""
+
+import json
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from cancellation import CancelToken
+from config import settings
+from estimator import DocumentProfile, predict_strategies, recommend
+from metrics import metrics
+
+DEADLINE_REASON = "deadline"
+
+# Fastest first; a model is only ever swapped for one earlier in this list
+MODEL_LADDER = ("gemini-2.5-flash-lite", "gemini-2.5-flash", "gemini-3-flash-preview")
+
+# Sections kept when the deadline only leaves time for the essentials
+CORE_SECTIONS = ("patient", "history", "labs")
+CORE_SECTIONS_OUTPUT_FRACTION = 0.4  # share of output tokens they account for
+
+
+class DeadlineExceeded(Exception):
+    """A stage used up its share of the deadline; the caller may fall back."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Deadline budget exhausted during {stage}")
+
+
+class Deadline:
+    """Absolute time budget of one request (no limit when created without seconds)."""
+
+    def __init__(self, seconds: Optional[float] = None) -> None:
+        self.budget_seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        # Time kept back for the generation call (set by plan_for_deadline)
+        self.reserve_seconds = 0.0
+        self.degraded: List[str] = []
+        self.dropped_content = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_ms(cls, milliseconds: Optional[int]) -> "Deadline":
+        return cls(milliseconds / 1000) if milliseconds else cls()
+
+    @property
+    def enabled(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def stage_budget(self, seconds: float) -> float:
+        """`seconds`, capped so that `reserve_seconds` remain for generation."""
+        return min(seconds, max(0.0, self.remaining() - self.reserve_seconds))
+
+    def degrade(self, kind: str, detail: str, drops_content: bool = False) -> None:
+        """Record a degradation; `drops_content` marks the result as partial."""
+        with self._lock:
+            self.degraded.append(f"{kind}: {detail}")
+            self.dropped_content = self.dropped_content or drops_content
+        metrics.incr(f"deadline.degraded.{kind}")
+        print(f"   ⏱️ Deadline: {kind} ({detail})")
+
+    def arm(self, token: CancelToken) -> Optional[threading.Timer]:
+        """Cancel `token` with DEADLINE_REASON once the deadline passes."""
+        if not self.enabled:
+            return None
+        timer = threading.Timer(self.remaining(), token.cancel, args=(DEADLINE_REASON,))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget_seconds": self.budget_seconds,
+                "remaining_seconds": round(self.remaining(), 3) if self.enabled else None,
+                "degraded": list(self.degraded),
+            }
+
+
+# =============================================================================
+# Planning
+# =============================================================================
+@dataclass
+class DeadlinePlan:
+    """Model, strategy and pages to use so the request fits its deadline."""
+
+    model: str
+    strategy: str
+    selected_pages: Optional[List[int]]
+    core_sections_only: bool = False
+    predicted_seconds: float = 0.0
+
+
+def _predicted(predictions: Dict[str, Dict[str, Any]], strategy: str) -> Dict[str, Any]:
+    if strategy == "race":
+        candidates = [predictions[s] for s in ("upload", "images") if s in predictions]
+        return min(candidates, key=lambda p: p["latency_seconds"])
+    # Strategies that do not apply (e.g. "text" on a scanned PDF) end up as images
+    return predictions.get(strategy, predictions["images"])
+
+
+def plan_for_deadline(
+    profile: DocumentProfile,
+    model: str,
+    strategy: str,
+    selected_pages: Optional[List[int]],
+    deadline: Deadline,
+) -> DeadlinePlan:
+    """Degrade the request step by step until its estimated latency fits.
+
+    Steps: fastest strategy (only for "auto", when its recommendation does
+    not fit), the nearest faster model on MODEL_LADDER, CORE_SECTIONS only,
+    then the first pages that fit. Each step taken is recorded on the deadline.
+    """
+    budget = deadline.remaining() * settings.DEADLINE_SAFETY_FACTOR
+    pages = selected_pages or list(range(1, profile.pages + 1))
+    plan = DeadlinePlan(model, strategy, selected_pages)
+    fraction = 1.0
+
+    def predict(candidate: DocumentProfile, candidate_model: str) -> Dict[str, Dict[str, Any]]:
+        return predict_strategies(
+            candidate,
+            candidate_model,
+            allow_upload=plan.selected_pages is None,
+            output_fraction=fraction,
+        )
+
+    if strategy == "auto":
+        predictions = predict(profile, model)
+        plan.strategy = recommend(predictions)
+        if predictions[plan.strategy]["latency_seconds"] > budget:
+            plan.strategy = min(predictions, key=lambda s: predictions[s]["latency_seconds"])
+
+    def fits(candidate: DocumentProfile, candidate_model: str) -> bool:
+        prediction = _predicted(predict(candidate, candidate_model), plan.strategy)
+        plan.predicted_seconds = prediction["latency_seconds"]
+        deadline.reserve_seconds = prediction["generation_seconds"]
+        return prediction["latency_seconds"] <= budget
+
+    if fits(profile, plan.model):
+        return plan
+
+    position = MODEL_LADDER.index(model) if model in MODEL_LADDER else len(MODEL_LADDER)
+    for faster in reversed(MODEL_LADDER[:position]):
+        plan.model = faster
+        if fits(profile, faster):
+            break
+    if plan.model != model:
+        deadline.degrade("model", f"{model} -> {plan.model}")
+    if plan.predicted_seconds <= budget:
+        return plan
+
+    fraction = CORE_SECTIONS_OUTPUT_FRACTION
+    plan.core_sections_only = True
+    deadline.degrade("sections", "only " + ", ".join(CORE_SECTIONS), drops_content=True)
+    if fits(profile, plan.model) or not profile.is_pdf or len(pages) == 1:
+        return plan
+
+    # A page selection rules out the File API upload
+    plan.selected_pages = pages
+    count = len(pages) - 1
+    while count > 1 and not fits(profile.first_pages(count), plan.model):
+        count = max(1, int(count * 0.75))
+    fits(profile.first_pages(count), plan.model)
+    plan.selected_pages = pages[:count]
+    deadline.degrade("pages", f"first {count} of {len(pages)} pages", drops_content=True)
+    return plan
+
+
+# =============================================================================
+# Partial results
+# =============================================================================
+def _cut_points(text: str) -> List[tuple]:
+    """(prefix length, closers) after every complete JSON value, latest last."""
+    points = []
+    stack: List[str] = []
+    in_string = escaped = False
+    for idx, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+            points.append((idx + 1, "".join(reversed(stack))))
+        elif ch == ",":
+            points.append((idx, "".join(reversed(stack))))
+    return points
+
+
+def salvage_extraction(text: Optional[str], max_attempts: int = 200) -> Dict[str, Any]:
+    """Longest valid MedicalOCR prefix of a truncated JSON response.
+
+    Returns an empty extraction when nothing can be recovered.
+    """
+    from schema_registry import registry
+
+    for length, closers in reversed(_cut_points(text or "")[-max_attempts:]):
+        try:
+            data = json.loads(text[:length] + closers)
+        except ValueError:
+            continue
+        if not isinstance(data, dict):
+            continue
+        data.setdefault("patient", {"name": ""})
+        data.setdefault("history", {})
+        try:
+            return registry.adapter("medical_ocr").validate_python(data).model_dump(mode="json")
+        except ValidationError:
+            continue
+
+    empty = {"patient": {"name": ""}, "history": {}}
+    return registry.adapter("medical_ocr").validate_python(empty).model_dump(mode="json")
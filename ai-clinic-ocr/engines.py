@@ -0,0 +1,66 @@
+"""
+Lazy loaders for heavy and optional OCR engines.
+
+Nothing here is imported at service start-up: the Gemini path only pulls in
+PyMuPDF when a PDF actually has to be opened, and the legacy engines
+(PaddleOCR, Google Cloud Document AI) are only importable when enabled with a
+feature flag and installed from requirements-legacy.txt.
+"""
+
+import os
+import threading
+from typing import Any
+
+from config import settings
+
+_lock = threading.Lock()
+_modules: dict = {}
+
+
+def load_pymupdf() -> Any:
+    """Import PyMuPDF (`fitz`) on first use."""
+    with _lock:
+        if "fitz" not in _modules:
+            try:
+                import fitz  # PyMuPDF
+            except ImportError:
+                raise ImportError(
+                    "PyMuPDF (fitz) is required for PDF handling. Install with: pip install pymupdf"
+                )
+            _modules["fitz"] = fitz
+        return _modules["fitz"]
+
+
+def pymupdf_available() -> bool:
+    try:
+        load_pymupdf()
+        return True
+    except ImportError:
+        return False
+
+
+def load_paddle_ocr(**kwargs: Any) -> Any:
+    """Build a PaddleOCR engine (ENABLE_PADDLE_OCR, legacy install profile)."""
+    if not settings.ENABLE_PADDLE_OCR:
+        raise RuntimeError("PaddleOCR is disabled. Set ENABLE_PADDLE_OCR=true to use it.")
+    with _lock:
+        if "paddleocr" not in _modules:
+            # Paddle reads these when it is first imported
+            os.environ.setdefault("FLAGS_use_mkldnn", "0")
+            os.environ.setdefault("FLAGS_enable_pir_api", "0")
+            from paddleocr import PaddleOCR
+
+            _modules["paddleocr"] = PaddleOCR
+    return _modules["paddleocr"](**kwargs)
+
+
+def load_documentai_client(**kwargs: Any) -> Any:
+    """Build a Document AI client (ENABLE_DOCUMENT_AI, legacy install profile)."""
+    if not settings.ENABLE_DOCUMENT_AI:
+        raise RuntimeError("Document AI is disabled. Set ENABLE_DOCUMENT_AI=true to use it.")
+    with _lock:
+        if "documentai" not in _modules:
+            from google.cloud import documentai
+
+            _modules["documentai"] = documentai
+    return _modules["documentai"].DocumentProcessorServiceClient(**kwargs)
@@ -0,0 +1,368 @@
+"""
+Pre-flight token, cost and latency estimates per PDF strategy.
+
+Everything here is computed locally from the document (page count, page
+sizes, text layer, image dimensions) before any network call. `estimate()`
+predicts prompt tokens, output tokens, latency and cost for every strategy
+that applies to the document and recommends one according to
+ESTIMATE_LATENCY_WEIGHT (0 = cheapest, 1 = fastest).
+
+The constants are deliberately simple, calibrated against typical clinic
+uploads; compare predictions with result["usage"] / result["timing"].
+"""
+
+import math
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from engines import load_pymupdf
+
+# =============================================================================
+# Model
+# =============================================================================
+PDF_PAGE_TOKENS = 258  # Gemini bills a File API PDF page as one image tile
+IMAGE_TILE_TOKENS = 258
+IMAGE_TILE_PIXELS = 768
+SMALL_IMAGE_PIXELS = 384  # both sides <= this: a single tile
+PAGE_MARKER_TOKENS = 8  # "[Page N]" markers between parts
+OUTPUT_TOKENS_PER_PAGE = 350
+MIN_OUTPUT_TOKENS = 300
+CACHED_TOKEN_DISCOUNT = 0.25  # cached input tokens are billed at a quarter
+
+DEFAULT_PAGE_SIZE = (595.0, 842.0)  # A4 in points, used without the file
+
+UPLOAD_BYTES_PER_SECOND = 5_000_000
+JPEG_BYTES_PER_PAGE = 250_000
+FILE_PROCESSING_BASE_SECONDS = 2.0
+FILE_PROCESSING_SECONDS_PER_PAGE = 0.3
+RENDER_SECONDS_PER_PAGE = 0.06
+TEXT_SECONDS_PER_PAGE = 0.005
+REQUEST_OVERHEAD_SECONDS = 1.0
+
+# Per model: USD per 1M input / output tokens and throughput
+MODEL_PROFILES: Dict[str, Dict[str, float]] = {
+    "gemini-2.5-flash-lite": {
+        "input_per_m": 0.10,
+        "output_per_m": 0.40,
+        "prefill_tps": 20000,
+        "output_tps": 250,
+    },
+    "gemini-2.5-flash": {
+        "input_per_m": 0.30,
+        "output_per_m": 2.50,
+        "prefill_tps": 12000,
+        "output_tps": 180,
+    },
+    "gemini-3-flash-preview": {
+        "input_per_m": 0.50,
+        "output_per_m": 3.00,
+        "prefill_tps": 10000,
+        "output_tps": 150,
+    },
+}
+DEFAULT_MODEL_PROFILE = MODEL_PROFILES["gemini-2.5-flash"]
+
+_ARABIC = re.compile(r"[؀-ۿ]")
+
+
+@dataclass
+class DocumentProfile:
+    """What the estimator knows about a document."""
+
+    file_type: str
+    bytes: int
+    pages: int
+    page_sizes: List[Tuple[float, float]] = field(default_factory=list)
+    # Characters in the text layer per page; None when not inspected
+    text_chars: Optional[List[int]] = None
+    arabic_chars: Optional[List[int]] = None
+    image_size: Optional[Tuple[int, int]] = None
+
+    @property
+    def is_pdf(self) -> bool:
+        return self.file_type == "pdf"
+
+    def text_pages(self) -> List[int]:
+        """Indices of pages whose text layer is usable on its own."""
+        if not self.text_chars:
+            return []
+        return [i for i, n in enumerate(self.text_chars) if n >= settings.TEXT_LAYER_MIN_CHARS]
+
+    def first_pages(self, count: int) -> "DocumentProfile":
+        """Profile of the first `count` pages (bytes scaled proportionally)."""
+        count = max(1, min(count, self.pages))
+        return DocumentProfile(
+            self.file_type,
+            self.bytes * count // max(1, self.pages),
+            count,
+            page_sizes=self.page_sizes[:count],
+            text_chars=self.text_chars[:count] if self.text_chars is not None else None,
+            arabic_chars=self.arabic_chars[:count] if self.arabic_chars is not None else None,
+            image_size=self.image_size,
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("page_sizes")
+        data.pop("arabic_chars")
+        data["text_chars"] = sum(self.text_chars) if self.text_chars is not None else None
+        data["text_layer_pages"] = len(self.text_pages()) if self.text_chars is not None else None
+        return data
+
+
+def inspect_document(file_path: str, selected_pages: Optional[List[int]] = None) -> DocumentProfile:
+    """Open the document locally and collect page sizes, text layer and image size.
+
+    Images MuPDF cannot decode get a profile without their size, as from
+    profile_from_metadata.
+    """
+    path = Path(file_path)
+    file_type = path.suffix.lower().lstrip(".")
+    size = path.stat().st_size
+    fitz = load_pymupdf()
+
+    if file_type != "pdf":
+        try:
+            pix = fitz.Pixmap(str(path))
+        except Exception:
+            # Formats MuPDF cannot decode (WebP): estimated from the size alone
+            return profile_from_metadata(file_type, size)
+        return DocumentProfile(file_type, size, 1, image_size=(pix.width, pix.height))
+
+    page_sizes, text_chars, arabic_chars = [], [], []
+    with fitz.open(path) as doc:
+        indices = range(len(doc))
+        if selected_pages:
+            indices = [p - 1 for p in selected_pages if 1 <= p <= len(doc)]
+        for idx in indices:
+            page = doc[idx]
+            text = page.get_text().strip()
+            page_sizes.append((page.rect.width, page.rect.height))
+            text_chars.append(len(text))
+            arabic_chars.append(len(_ARABIC.findall(text)))
+
+    return DocumentProfile(
+        file_type,
+        size,
+        len(page_sizes),
+        page_sizes=page_sizes,
+        text_chars=text_chars,
+        arabic_chars=arabic_chars,
+    )
+
+
+def profile_from_metadata(file_type: str, size_bytes: int, pages: int = 1) -> DocumentProfile:
+    """Profile from what a client knows before uploading (no text layer info)."""
+    file_type = file_type.lower().lstrip(".")
+    pages = max(1, pages if file_type == "pdf" else 1)
+    if file_type == "pdf":
+        return DocumentProfile(file_type, size_bytes, pages, page_sizes=[DEFAULT_PAGE_SIZE] * pages)
+    return DocumentProfile(file_type, size_bytes, 1)
+
+
+# =============================================================================
+# Token and latency predictions
+# =============================================================================
+def image_tokens(width: float, height: float) -> int:
+    if width <= SMALL_IMAGE_PIXELS and height <= SMALL_IMAGE_PIXELS:
+        return IMAGE_TILE_TOKENS
+    tiles = math.ceil(width / IMAGE_TILE_PIXELS) * math.ceil(height / IMAGE_TILE_PIXELS)
+    return tiles * IMAGE_TILE_TOKENS
+
+
+def _rendered_page_tokens(page_size: Tuple[float, float]) -> int:
+    zoom = settings.RENDER_DPI / 72  # as render_pdf_pages
+    return image_tokens(page_size[0] * zoom, page_size[1] * zoom)
+
+
+def _text_tokens(chars: int, arabic: int) -> int:
+    # Arabic script tokenizes at roughly twice the rate of Latin text
+    return math.ceil((chars - arabic) / 4 + arabic / 2)
+
+
+def _prompt_overhead_tokens() -> int:
+    """Tokens of COMPACT_PROMPT + schema sent (or cached) with every request."""
+    # Imported here: medical_ocr_fast imports this module for strategy "auto"
+    import medical_ocr_fast
+
+    return math.ceil(len(medical_ocr_fast.prompt_cache.system_instruction) / 4)
+
+
+def _generation_seconds(prompt_tokens: int, output_tokens: int, model_profile: Dict[str, float]) -> float:
+    return (
+        REQUEST_OVERHEAD_SECONDS
+        + prompt_tokens / model_profile["prefill_tps"]
+        + output_tokens / model_profile["output_tps"]
+    )
+
+
+def _cost(model_profile: Dict[str, float], prompt_tokens: int, output_tokens: int, cached: int) -> float:
+    return (
+        (prompt_tokens - cached) * model_profile["input_per_m"]
+        + cached * model_profile["input_per_m"] * CACHED_TOKEN_DISCOUNT
+        + output_tokens * model_profile["output_per_m"]
+    ) / 1_000_000
+
+
+def usage_cost(model: str, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """USD for actual token usage (result["usage"]) at MODEL_PROFILES prices."""
+    return _cost(MODEL_PROFILES.get(model, DEFAULT_MODEL_PROFILE), prompt_tokens, output_tokens, cached_tokens)
+
+
+def _predict(
+    document_tokens: int,
+    pages: int,
+    prepare_seconds: float,
+    overhead: int,
+    model_profile: Dict[str, float],
+    requests: int = 1,
+    waves: int = 1,
+    output_fraction: float = 1.0,
+) -> Dict[str, Any]:
+    """Totals for `requests` equal calls run in `waves` sequential rounds."""
+    cached = overhead * requests if settings.CONTEXT_CACHE_ENABLED else 0
+    prompt_tokens = document_tokens + overhead * requests
+    output_tokens = math.ceil(
+        max(MIN_OUTPUT_TOKENS * requests, OUTPUT_TOKENS_PER_PAGE * pages) * output_fraction
+    )
+    per_request = _generation_seconds(
+        math.ceil(prompt_tokens / requests), math.ceil(output_tokens / requests), model_profile
+    )
+    cost = _cost(model_profile, prompt_tokens, output_tokens, cached)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached,
+        "output_tokens": output_tokens,
+        "latency_seconds": round(prepare_seconds + per_request * waves, 2),
+        "generation_seconds": round(per_request * waves, 2),
+        "cost_usd": round(cost, 6),
+    }
+
+
+def predict_strategies(
+    profile: DocumentProfile,
+    model: str,
+    allow_upload: bool = True,
+    allow_chunked: bool = True,
+    output_fraction: float = 1.0,
+) -> Dict[str, Dict[str, Any]]:
+    """Predictions for every strategy that applies to the document.
+
+    `output_fraction` scales the expected output (e.g. when only some
+    sections are requested).
+    """
+    model_profile = MODEL_PROFILES.get(model, DEFAULT_MODEL_PROFILE)
+    overhead = _prompt_overhead_tokens()
+    pages = profile.pages
+    predictions: Dict[str, Dict[str, Any]] = {}
+
+    def _prediction(*args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return _predict(*args, output_fraction=output_fraction, **kwargs)
+
+    if not profile.is_pdf:
+        width, height = profile.image_size or (1600, 1200)
+        predictions["images"] = _prediction(
+            image_tokens(width, height),
+            1,
+            profile.bytes / UPLOAD_BYTES_PER_SECOND,
+            overhead,
+            model_profile,
+        )
+        return predictions
+
+    markers = PAGE_MARKER_TOKENS * pages
+    rendered = [_rendered_page_tokens(size) for size in profile.page_sizes]
+    render_seconds = pages * (RENDER_SECONDS_PER_PAGE + JPEG_BYTES_PER_PAGE / UPLOAD_BYTES_PER_SECOND)
+
+    if allow_upload:
+        predictions["upload"] = _prediction(
+            PDF_PAGE_TOKENS * pages,
+            pages,
+            profile.bytes / UPLOAD_BYTES_PER_SECOND
+            + FILE_PROCESSING_BASE_SECONDS
+            + FILE_PROCESSING_SECONDS_PER_PAGE * pages,
+            overhead,
+            model_profile,
+        )
+
+    predictions["images"] = _prediction(sum(rendered) + markers, pages, render_seconds, overhead, model_profile)
+
+    text_pages = set(profile.text_pages())
+    if text_pages:
+        tokens, seconds = markers, 0.0
+        for idx in range(pages):
+            if idx in text_pages:
+                tokens += _text_tokens(profile.text_chars[idx], profile.arabic_chars[idx])
+                seconds += TEXT_SECONDS_PER_PAGE
+            else:
+                tokens += rendered[idx]
+                seconds += RENDER_SECONDS_PER_PAGE + JPEG_BYTES_PER_PAGE / UPLOAD_BYTES_PER_SECOND
+        predictions["text"] = _prediction(tokens, pages, seconds, overhead, model_profile)
+
+    chunk_pages = max(1, settings.PDF_CHUNK_PAGES)
+    if allow_chunked and pages > chunk_pages:
+        chunks = math.ceil(pages / chunk_pages)
+        waves = math.ceil(chunks / max(1, settings.PDF_CHUNK_CONCURRENCY))
+        predictions["chunked"] = _prediction(
+            sum(rendered) + markers,
+            pages,
+            render_seconds / min(chunks, max(1, settings.PDF_CHUNK_CONCURRENCY)),
+            overhead,
+            model_profile,
+            requests=chunks,
+            waves=waves,
+        )
+
+    return predictions
+
+
+def recommend(predictions: Dict[str, Dict[str, Any]], latency_weight: Optional[float] = None) -> str:
+    """Score each strategy relative to the best cost and latency; lowest wins."""
+    weight = settings.ESTIMATE_LATENCY_WEIGHT if latency_weight is None else latency_weight
+    weight = min(1.0, max(0.0, weight))
+    min_cost = min(p["cost_usd"] for p in predictions.values()) or 1e-9
+    min_latency = min(p["latency_seconds"] for p in predictions.values()) or 1e-9
+    for prediction in predictions.values():
+        prediction["score"] = round(
+            weight * prediction["latency_seconds"] / min_latency
+            + (1 - weight) * prediction["cost_usd"] / min_cost,
+            4,
+        )
+    return min(predictions, key=lambda name: predictions[name]["score"])
+
+
+def _warnings(profile: DocumentProfile, prediction: Dict[str, Any]) -> List[str]:
+    warnings = []
+    if profile.pages > settings.ESTIMATE_WARN_PAGES:
+        warnings.append(f"Large document: {profile.pages} pages (warning above {settings.ESTIMATE_WARN_PAGES}).")
+    if prediction["latency_seconds"] > settings.ESTIMATE_WARN_SECONDS:
+        warnings.append(
+            f"Expected processing time {prediction['latency_seconds']:.0f}s exceeds "
+            f"{settings.ESTIMATE_WARN_SECONDS:.0f}s."
+        )
+    if profile.text_chars is not None and profile.is_pdf and not profile.text_pages():
+        warnings.append("No text layer: the document is scanned and is analyzed as images.")
+    return warnings
+
+
+def estimate(
+    profile: DocumentProfile,
+    model: str = "gemini-2.5-flash-lite",
+    latency_weight: Optional[float] = None,
+    allow_upload: bool = True,
+    allow_chunked: bool = True,
+) -> Dict[str, Any]:
+    """Predictions for all applicable strategies plus the recommended one."""
+    predictions = predict_strategies(profile, model, allow_upload, allow_chunked)
+    recommended = recommend(predictions, latency_weight)
+    return {
+        "model": model,
+        "document": profile.summary(),
+        "strategies": predictions,
+        "recommended": recommended,
+        "latency_weight": settings.ESTIMATE_LATENCY_WEIGHT if latency_weight is None else latency_weight,
+        "warnings": _warnings(profile, predictions[recommended]),
+    }
@@ -0,0 +1,660 @@
+"""
+Offline evaluation of pipeline configurations.
+
+Runs a labelled set of documents through variants of the pipeline (model,
+strategy, render DPI, schema sections, chunk size) and scores every
+extraction against its ground truth next to what it cost: tokens, USD,
+latency and bytes sent. `pareto_front` keeps the variants that no other
+variant beats on quality, cost and latency at once.
+
+Nothing here calls Gemini unless recording. The Gen AI client handed to the
+pipeline is one of:
+
+- RecordedClient: replays responses saved in a recordings directory, keyed
+  by a fingerprint of the request (model, prompt, page images or uploaded
+  file content, schema). Given a real client it records the responses that
+  are missing, so a set is recorded once and re-scored offline afterwards.
+  A variant that changes the request (another DPI, schema or model) needs
+  its own recordings.
+- StubClient: answers every request with the ground truth, restricted to the
+  requested schema. Quality then only reflects what a variant asks for
+  (schema sections); tokens are estimated, bytes sent are measured.
+
+Scoring is field-level: every non-empty leaf value is a fact, list entries
+are paired by their natural key (see record_merge) and precision / recall
+count the facts of the prediction and of the truth that match.
+
+A labelled set is a directory of documents with a `<stem>.truth.json` next
+to each: a MedicalOCR JSON, or a reviewed `*_fast.json` result.
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from google.genai import types
+
+from batch_runner import SUPPORTED_EXTENSIONS
+from config import settings
+from deadline import CORE_SECTIONS
+from engines import load_pymupdf
+from estimator import PDF_PAGE_TOKENS, image_tokens, usage_cost
+from record_merge import LIST_PATHS, NATURAL_KEYS, get_list, keyed_entries, list_name
+from schema_registry import SECTION_TYPES, registry
+from text_normalize import normalize_name
+
+TRUTH_SUFFIX = ".truth.json"
+
+# Numbers compared by value; a leading zero is an identifier (phone, file number)
+_NUMBER = re.compile(r"[-+]?(0|[1-9]\d*)(\.\d+)?")
+
+
+# =============================================================================
+# Field-level scoring
+# =============================================================================
+@dataclass
+class FieldCounts:
+    """Facts of the prediction, of the truth, and of both."""
+
+    matched: int = 0
+    predicted: int = 0
+    expected: int = 0
+
+    def compare(self, predicted: Counter, expected: Counter) -> None:
+        self.matched += sum((predicted & expected).values())
+        self.predicted += sum(predicted.values())
+        self.expected += sum(expected.values())
+
+    def add(self, other: "FieldCounts") -> None:
+        self.matched += other.matched
+        self.predicted += other.predicted
+        self.expected += other.expected
+
+    @property
+    def precision(self) -> float:
+        return self.matched / self.predicted if self.predicted else 1.0
+
+    @property
+    def recall(self) -> float:
+        return self.matched / self.expected if self.expected else 1.0
+
+    @property
+    def f1(self) -> float:
+        p, r = self.precision, self.recall
+        return 2 * p * r / (p + r) if p + r else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "precision": round(self.precision, 4),
+            "recall": round(self.recall, 4),
+            "f1": round(self.f1, 4),
+            **asdict(self),
+        }
+
+
+@lru_cache(maxsize=1)
+def _schema_defaults() -> Dict[str, Any]:
+    """Fact path -> non-empty default of that MedicalOCR field."""
+    schema = registry.schema("medical_ocr")
+    definitions = schema.get("$defs", {})
+    defaults: Dict[str, Any] = {}
+
+    def walk(node: Dict[str, Any], path: str, depth: int = 0) -> None:
+        if depth > 20:
+            return
+        if "$ref" in node:
+            node = definitions[node["$ref"].rsplit("/", 1)[-1]]
+        for option in node.get("anyOf", []):
+            walk(option, path, depth + 1)
+        if "items" in node:
+            walk(node["items"], path + "[]", depth + 1)
+        for name, prop in node.get("properties", {}).items():
+            child = f"{path}.{name}" if path else name
+            if prop.get("default") not in (None, "", [], {}):
+                defaults[child] = prop["default"]
+            walk(prop, child, depth + 1)
+
+    walk(schema, "")
+    return defaults
+
+
+def _normalize(path: str, value: Any) -> str:
+    """Comparable form of a leaf: dates by day, numbers by value, text folded."""
+    if isinstance(value, bool):
+        return str(value).lower()
+    text = str(value).strip()
+    if path.rsplit(".", 1)[-1].rstrip("[]").lower().endswith("date"):
+        return text[:10]
+    if _NUMBER.fullmatch(text):
+        return format(Decimal(text).normalize(), "f")
+    return normalize_name(text) or ""
+
+
+def _facts(value: Any, path: str, skip: frozenset = frozenset()) -> Counter:
+    """Multiset of (path, normalized leaf) below `value`.
+
+    Empty values are no facts, nor are values equal to the field's schema
+    default: the model returns those whether or not the document says so.
+    """
+    facts: Counter = Counter()
+    defaults = _schema_defaults()
+
+    def walk(value: Any, path: str) -> None:
+        if path in skip or value is None or value == "" or value == [] or value == {}:
+            return
+        if path in defaults and value == defaults[path]:
+            return
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(item, f"{path}.{key}")
+        elif isinstance(value, list):
+            for item in value:
+                walk(item, path + "[]")
+        else:
+            facts[(path, _normalize(path, value))] += 1
+
+    walk(value, path)
+    return facts
+
+
+def _by_path(facts: Counter) -> Dict[str, Counter]:
+    grouped: Dict[str, Counter] = defaultdict(Counter)
+    for (path, value), count in facts.items():
+        grouped[path][(path, value)] = count
+    return grouped
+
+
+def score_fields(predicted: Dict[str, Any], truth: Dict[str, Any]) -> Dict[str, FieldCounts]:
+    """Per fact path ("labs.labs[].results.value"): facts of both sides and matches.
+
+    List entries are paired by natural key (record_merge.NATURAL_KEYS), so a
+    lab result is compared with the same test on the same day wherever it
+    appears in the list. An entry without a counterpart counts all its facts
+    as unmatched. Paths without facts on either side are left out.
+    """
+    predicted, truth = predicted or {}, truth or {}
+    scores: Dict[str, FieldCounts] = defaultdict(FieldCounts)
+
+    def compare(ours: Counter, theirs: Counter) -> None:
+        ours_by_path, theirs_by_path = _by_path(ours), _by_path(theirs)
+        for path in ours_by_path.keys() | theirs_by_path.keys():
+            scores[path].compare(ours_by_path.get(path, Counter()), theirs_by_path.get(path, Counter()))
+
+    for section in SECTION_TYPES:
+        lists = frozenset(list_name(s, f) for s, f in LIST_PATHS if s == section)
+        compare(_facts(predicted.get(section), section, lists), _facts(truth.get(section), section, lists))
+    for (section, list_field), keys in NATURAL_KEYS.items():
+        path = list_name(section, list_field) + "[]"
+        ours = keyed_entries(get_list(predicted, section, list_field), keys)
+        theirs = keyed_entries(get_list(truth, section, list_field), keys)
+        for key in ours.keys() | theirs.keys():
+            compare(_facts(ours.get(key), path), _facts(theirs.get(key), path))
+    return dict(scores)
+
+
+def score_extraction(predicted: Dict[str, Any], truth: Dict[str, Any]) -> Dict[str, FieldCounts]:
+    """Per MedicalOCR section: score_fields added up by section."""
+    scores = {section: FieldCounts() for section in SECTION_TYPES}
+    for path, counts in score_fields(predicted, truth).items():
+        scores[path.split(".", 1)[0].rstrip("[]")].add(counts)
+    return scores
+
+
+# =============================================================================
+# Offline Gen AI clients
+# =============================================================================
+class RecordingMissing(LookupError):
+    """No recorded response for a request (record it first)."""
+
+
+@dataclass
+class RequestMeter:
+    """What the pipeline sent and what the model spent for one document."""
+
+    requests: int = 0
+    bytes_sent: int = 0
+    model_seconds: float = 0.0
+
+
+def _file_bytes(file: Any) -> bytes:
+    if isinstance(file, io.BytesIO):
+        return file.getvalue()
+    return Path(file).read_bytes()
+
+
+class _Files:
+    def __init__(self, client: "OfflineClient"):
+        self._client = client
+
+    def upload(self, file: Any, config: Any = None) -> Any:
+        return self._client._upload(file, config)
+
+    def get(self, name: str) -> Any:
+        return self._client._get_file(name)
+
+    def delete(self, name: str) -> None:
+        self._client._delete_file(name)
+
+
+class _Models:
+    def __init__(self, client: "OfflineClient"):
+        self._client = client
+
+    def generate_content(self, model: str, contents: List[Any], config: Dict[str, Any]) -> Any:
+        return self._client._generate(model, contents, config)
+
+    def generate_content_stream(self, model: str, contents: List[Any], config: Dict[str, Any]) -> Iterator[Any]:
+        # One chunk: the text and usage of the whole response
+        yield self._client._generate(model, contents, config)
+
+
+@dataclass
+class _Response:
+    text: str
+    usage_metadata: Any = None
+
+
+class OfflineClient:
+    """The part of genai.Client the pipeline uses, metered per document.
+
+    Subclasses answer `_respond`; uploads are kept locally under a name
+    derived from their content unless `_store_file` is overridden.
+    """
+
+    # Whether model calls take their real time (latency needs no correction)
+    realtime = False
+
+    def __init__(self) -> None:
+        self.files = _Files(self)
+        self.models = _Models(self)
+        self.meter = RequestMeter()
+        self._lock = threading.Lock()
+        self._file_digests: Dict[str, str] = {}
+        self._file_pages: Dict[str, int] = {}
+
+    def reset(self, truth: Optional[Dict[str, Any]] = None) -> None:
+        """Start metering a new document (`truth` is for StubClient)."""
+        self.meter = RequestMeter()
+
+    def _upload(self, file: Any, config: Any) -> Any:
+        data = _file_bytes(file)
+        digest = hashlib.sha256(data).hexdigest()
+        remote = self._store_file(file, config, digest)
+        with self._lock:
+            self.meter.bytes_sent += len(data)
+            self._file_digests[remote.name] = digest
+            if data[:5] == b"%PDF-":
+                with load_pymupdf().open(stream=data, filetype="pdf") as doc:
+                    self._file_pages[remote.name] = len(doc)
+        return remote
+
+    def _store_file(self, file: Any, config: Any, digest: str) -> Any:
+        return types.File(name=f"files/{digest[:16]}", state=types.FileState.ACTIVE)
+
+    def _get_file(self, name: str) -> Any:
+        return types.File(name=name, state=types.FileState.ACTIVE)
+
+    def _delete_file(self, name: str) -> None:
+        pass
+
+    def fingerprint(self, model: str, contents: List[Any], config: Dict[str, Any]) -> str:
+        """Stable id of a request: same model, prompt, parts and schema."""
+        digest = hashlib.sha256(model.encode())
+        for content in contents:
+            if isinstance(content, str):
+                digest.update(b"text:" + content.encode("utf-8"))
+            elif getattr(content, "inline_data", None) is not None:
+                digest.update(b"data:" + content.inline_data.data)
+            elif getattr(content, "name", None) in self._file_digests:
+                digest.update(b"file:" + self._file_digests[content.name].encode())
+            else:
+                raise TypeError(f"Cannot fingerprint request part {type(content).__name__}")
+        request_config = {k: v for k, v in config.items() if k != "cached_content"}
+        digest.update(json.dumps(request_config, sort_keys=True, default=str).encode())
+        return digest.hexdigest()[:32]
+
+    def _generate(self, model: str, contents: List[Any], config: Dict[str, Any]) -> Any:
+        sent = len(json.dumps(config.get("response_json_schema") or {}).encode())
+        for content in contents:
+            if isinstance(content, str):
+                sent += len(content.encode("utf-8"))
+            elif getattr(content, "inline_data", None) is not None:
+                sent += len(content.inline_data.data)
+        response, seconds = self._respond(model, contents, config)
+        with self._lock:
+            self.meter.requests += 1
+            self.meter.bytes_sent += sent
+            self.meter.model_seconds += seconds
+        return response
+
+    def _respond(self, model: str, contents: List[Any], config: Dict[str, Any]) -> Tuple[Any, float]:
+        raise NotImplementedError
+
+
+def _usage(usage: Any) -> Dict[str, int]:
+    return {
+        "prompt_token_count": getattr(usage, "prompt_token_count", 0) or 0,
+        "candidates_token_count": getattr(usage, "candidates_token_count", 0) or 0,
+        "cached_content_token_count": getattr(usage, "cached_content_token_count", 0) or 0,
+    }
+
+
+class RecordedClient(OfflineClient):
+    """Replays responses from `directory`; records missing ones through `client`.
+
+    Each response is `<fingerprint>.json` with the text, the token usage and
+    the seconds the call took. With `replay_latency`, a replayed call sleeps
+    for its recorded time, so latency (including concurrent chunks) is real.
+    """
+
+    def __init__(self, directory: str, client: Any = None, replay_latency: bool = False):
+        super().__init__()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.client = client
+        self.replay_latency = replay_latency
+        self.realtime = client is not None or replay_latency
+        self.recorded = 0
+
+    def _store_file(self, file: Any, config: Any, digest: str) -> Any:
+        if self.client is None:
+            return super()._store_file(file, config, digest)
+        return self.client.files.upload(file=file, config=config)
+
+    def _get_file(self, name: str) -> Any:
+        return self.client.files.get(name=name) if self.client else super()._get_file(name)
+
+    def _delete_file(self, name: str) -> None:
+        if self.client:
+            self.client.files.delete(name=name)
+
+    def _respond(self, model: str, contents: List[Any], config: Dict[str, Any]) -> Tuple[Any, float]:
+        fingerprint = self.fingerprint(model, contents, config)
+        path = self.directory / f"{fingerprint}.json"
+        if path.exists():
+            recording = json.loads(path.read_text(encoding="utf-8"))
+            if self.replay_latency:
+                time.sleep(recording["seconds"])
+        elif self.client is not None:
+            start = time.perf_counter()
+            response = self.client.models.generate_content(model=model, contents=contents, config=config)
+            recording = {
+                "model": model,
+                "text": response.text,
+                "usage": _usage(response.usage_metadata),
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+            path.write_text(json.dumps(recording, ensure_ascii=False), encoding="utf-8")
+            with self._lock:
+                self.recorded += 1
+        else:
+            raise RecordingMissing(f"No recorded response {fingerprint} for {model}; record it first")
+        usage = types.GenerateContentResponseUsageMetadata(**recording["usage"])
+        return _Response(recording["text"], usage), recording["seconds"]
+
+
+class StubClient(OfflineClient):
+    """Answers with the document's ground truth, only the requested sections.
+
+    Prompt tokens are estimated like estimator.py does (text by characters,
+    images by tiles, uploaded PDF pages at PDF_PAGE_TOKENS); calls take no time.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.truth: Dict[str, Any] = {}
+
+    def reset(self, truth: Optional[Dict[str, Any]] = None) -> None:
+        super().reset(truth)
+        self.truth = truth or {}
+
+    def _prompt_tokens(self, contents: List[Any]) -> int:
+        tokens = 0
+        for content in contents:
+            if isinstance(content, str):
+                tokens += math.ceil(len(content) / 4)
+            elif getattr(content, "inline_data", None) is not None:
+                pixmap = load_pymupdf().Pixmap(content.inline_data.data)
+                tokens += image_tokens(pixmap.width, pixmap.height)
+            else:
+                tokens += PDF_PAGE_TOKENS * self._file_pages.get(getattr(content, "name", ""), 1)
+        return tokens
+
+    def _respond(self, model: str, contents: List[Any], config: Dict[str, Any]) -> Tuple[Any, float]:
+        sections = (config.get("response_json_schema") or {}).get("properties") or SECTION_TYPES
+        text = json.dumps({section: self.truth.get(section) for section in sections}, ensure_ascii=False)
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=self._prompt_tokens(contents) + math.ceil(len(json.dumps(config)) / 4),
+            candidates_token_count=math.ceil(len(text) / 4),
+        )
+        return _Response(text, usage), 0.0
+
+
+# =============================================================================
+# Variants and runs
+# =============================================================================
+@dataclass(frozen=True)
+class Variant:
+    """One pipeline configuration; `sections` None is the full MedicalOCR schema."""
+
+    name: str
+    model: str
+    strategy: str
+    dpi: int
+    chunk_pages: int
+    sections: Optional[Tuple[str, ...]] = None
+
+    KEYS = ("name", "model", "strategy", "dpi", "chunk_pages", "schema")
+
+    @classmethod
+    def parse(cls, spec: str) -> "Variant":
+        """From "model=...,strategy=images,dpi=100,schema=core,chunk_pages=5".
+
+        Unset keys take the configured defaults. `schema` is "full", "core"
+        (the deadline core sections) or sections joined by "+", e.g.
+        "patient+labs".
+        """
+        values: Dict[str, str] = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            key, sep, value = item.partition("=")
+            if not sep or key not in cls.KEYS:
+                raise ValueError(f"Invalid variant item {item!r}. Keys: {', '.join(cls.KEYS)}")
+            values[key] = value.strip()
+        schema = values.get("schema", "full")
+        if schema == "full":
+            sections = None
+        elif schema == "core":
+            sections = CORE_SECTIONS
+        else:
+            sections = tuple(schema.split("+"))
+            unknown = set(sections) - set(SECTION_TYPES)
+            if unknown:
+                raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}")
+        return cls(
+            name=values.get("name") or spec or "default",
+            model=values.get("model", settings.GEMINI_MODEL),
+            strategy=values.get("strategy", settings.PDF_STRATEGY),
+            dpi=int(values.get("dpi", settings.RENDER_DPI)),
+            chunk_pages=int(values.get("chunk_pages", settings.PDF_CHUNK_PAGES)),
+            sections=sections,
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        config = asdict(self)
+        config["schema"] = "+".join(config.pop("sections") or ()) or "full"
+        return config
+
+
+@dataclass
+class LabelledDocument:
+    path: Path
+    truth: Dict[str, Any]
+
+
+def load_dataset(directory: str) -> List[LabelledDocument]:
+    """Documents below `directory` that have a `<stem>.truth.json`."""
+    documents = []
+    for truth_path in sorted(Path(directory).rglob(f"*{TRUTH_SUFFIX}")):
+        stem = truth_path.name[: -len(TRUTH_SUFFIX)]
+        candidates = [
+            p for p in truth_path.parent.iterdir()
+            if p.stem == stem and p.suffix.lower() in SUPPORTED_EXTENSIONS
+        ]
+        if not candidates:
+            print(f"⚠️  No document for {truth_path}, skipped")
+            continue
+        data = json.loads(truth_path.read_text(encoding="utf-8"))
+        extraction = data.get("extraction", data)
+        # Through the model, so defaults match the pipeline's output
+        truth = registry.adapter("medical_ocr").validate_python(extraction).model_dump(mode="json")
+        documents.append(LabelledDocument(sorted(candidates)[0], truth))
+    return documents
+
+
+@contextlib.contextmanager
+def _overrides(**values: Any) -> Iterator[None]:
+    """Settings changed for the block (runs are sequential, so this is safe here)."""
+    saved = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(settings, name, value)
+
+
+def _mean(rows: List[Dict[str, Any]], key: str) -> float:
+    return sum(row[key] for row in rows) / len(rows) if rows else 0.0
+
+
+def evaluate_variant(
+    variant: Variant,
+    documents: List[LabelledDocument],
+    client: OfflineClient,
+    verbose: bool = False,
+) -> Dict[str, Any]:
+    """Analyze every document with `variant` through `client` and score it.
+
+    A document that fails counts as nothing extracted (its facts are all
+    missed); one without recordings is counted in "missing_recordings" too,
+    and keeps the variant off the Pareto front. Context caching, hedging and the shared rate limit are off so
+    that requests, and hence fingerprints, are the same on every run.
+    """
+    from medical_ocr_fast import analyze_document_streaming
+
+    totals = {section: FieldCounts() for section in SECTION_TYPES}
+    rows: List[Dict[str, Any]] = []
+    failures: List[Dict[str, str]] = []
+    missing = 0
+    for document in documents:
+        client.reset(document.truth)
+        start = time.perf_counter()
+        usage: Dict[str, int] = {}
+        try:
+            with _overrides(
+                RENDER_DPI=variant.dpi,
+                PDF_CHUNK_PAGES=variant.chunk_pages,
+                CONTEXT_CACHE_ENABLED=False,
+                HEDGE_ENABLED=False,
+                GEMINI_REQUESTS_PER_MINUTE=0,
+            ), contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+                result = analyze_document_streaming(
+                    str(document.path),
+                    model=variant.model,
+                    strategy=variant.strategy,
+                    sections=variant.sections,
+                    client=client,
+                )
+            if not result.get("success"):
+                raise ValueError(result.get("error") or "Analysis failed")
+            extraction = result["extraction"]
+            usage = result.get("usage") or {}
+        except Exception as exc:
+            failures.append({"document": str(document.path), "error": str(exc)})
+            missing += isinstance(exc, RecordingMissing)
+            extraction = {}
+        seconds = time.perf_counter() - start
+        meter = client.meter
+
+        scores = score_extraction(extraction, document.truth)
+        overall = FieldCounts()
+        for section, counts in scores.items():
+            totals[section].add(counts)
+            overall.add(counts)
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        rows.append(
+            {
+                "document": str(document.path),
+                **overall.summary(),
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "cost_usd": usage_cost(variant.model, prompt_tokens, output_tokens, usage.get("cached_tokens", 0)),
+                # Replayed calls take no time unless the client sleeps for them
+                "latency_seconds": seconds if client.realtime else seconds + meter.model_seconds,
+                "model_seconds": meter.model_seconds,
+                "requests": meter.requests,
+                "bytes_sent": meter.bytes_sent,
+            }
+        )
+
+    overall = FieldCounts()
+    for counts in totals.values():
+        overall.add(counts)
+    return {
+        "variant": variant.describe(),
+        "documents": len(documents),
+        "failed": len(failures),
+        "missing_recordings": missing,
+        **overall.summary(),
+        "sections": {section: counts.summary() for section, counts in totals.items() if counts.expected or counts.predicted},
+        # Means per document
+        "prompt_tokens": round(_mean(rows, "prompt_tokens")),
+        "output_tokens": round(_mean(rows, "output_tokens")),
+        "cost_usd": round(_mean(rows, "cost_usd"), 6),
+        "latency_seconds": round(_mean(rows, "latency_seconds"), 3),
+        "requests": round(_mean(rows, "requests"), 2),
+        "bytes_sent": round(_mean(rows, "bytes_sent")),
+        "per_document": rows,
+        "failures": failures,
+    }
+
+
+# Objectives of the Pareto front: (report key, higher is better)
+PARETO_OBJECTIVES = (("f1", True), ("cost_usd", False), ("latency_seconds", False))
+
+
+def pareto_front(reports: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Mark (`"pareto": True`) and return the reports no other report dominates.
+
+    A report is dominated when another is at least as good on every
+    objective in PARETO_OBJECTIVES and better on one. Reports with missing
+    recordings are incomplete and take no part.
+    """
+
+    def as_good(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+        return all(a[k] >= b[k] if higher else a[k] <= b[k] for k, higher in PARETO_OBJECTIVES)
+
+    complete = [report for report in reports if not report.get("missing_recordings")]
+    front = []
+    for report in reports:
+        dominated = report not in complete or any(
+            other is not report and as_good(other, report) and not as_good(report, other)
+            for other in complete
+        )
+        report["pareto"] = not dominated
+        if not dominated:
+            front.append(report)
+    return front
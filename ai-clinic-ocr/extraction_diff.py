@@ -0,0 +1,216 @@
+"""
+Field-level comparison of two sets of extractions, for regression checks.
+
+Before switching the default model or the Gen AI SDK, run the archive through
+the new setup and compare the results with the old ones:
+
+    python scripts/diff_extractions.py output/flash-lite/ output/flash/
+    python scripts/diff_extractions.py data/extractions.db data/extractions.db \\
+        --old-model gemini-2.5-flash-lite --new-model gemini-2.5-flash
+
+A side is a directory of saved results (`*_fast.json`, searched recursively)
+or an extraction store database (the latest complete extraction per
+document, optionally of one model). Documents are paired by the hash of
+their content (`source_sha256`, `document_sha256`), whatever the file names.
+
+Agreement is scored as in evaluation.score_fields, with the old side as the
+reference: every non-empty leaf is a fact, list entries are paired by their
+natural key, "recall" is the share of old facts the new side reproduces and
+"precision" the share of new facts the old side had. Counts are added up per
+section and per field path in one pass over the new side: only a hash ->
+location index of the old side is held, never the extractions themselves,
+plus the `worst` least-agreeing documents.
+"""
+
+import heapq
+import json
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from evaluation import FieldCounts, score_fields
+from extraction_store import ExtractionStore
+from schema_registry import SECTION_TYPES
+
+STORE_SUFFIXES = {".db", ".sqlite", ".sqlite3"}
+
+
+# =============================================================================
+# Result sources
+# =============================================================================
+class ResultDirectory:
+    """Saved analysis results (`*_fast.json`) below a directory.
+
+    Failed, partial and unhashed results (single-document runs before
+    `source_sha256` was added) are counted in `skipped` and left out.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.skipped: Counter = Counter()
+
+    def describe(self) -> str:
+        return str(self.directory)
+
+    def load(self, ref: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(ref, encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            self.skipped["unreadable"] += 1
+            return None
+        if result.get("success") is not True:
+            self.skipped["failed"] += 1
+        elif result.get("partial"):
+            self.skipped["partial"] += 1
+        elif not result.get("source_sha256"):
+            self.skipped["no source_sha256"] += 1
+        else:
+            return {**result, "sha256": result["source_sha256"], "file": result.get("file") or ref}
+        return None
+
+    def records(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """(content hash, location, result) of every usable result, one at a time."""
+        for path in sorted(self.directory.rglob("*_fast.json")):
+            record = self.load(str(path))
+            if record is not None:
+                yield record["sha256"], str(path), record
+
+    def index(self) -> Iterator[Tuple[str, str]]:
+        for sha256, ref, _ in self.records():
+            yield sha256, ref
+
+
+class StoredResults:
+    """Latest complete extraction per document in an extraction store."""
+
+    def __init__(self, path: str, model: Optional[str] = None):
+        self.store = ExtractionStore(path)
+        self.model = model
+        self.skipped: Counter = Counter()
+
+    def describe(self) -> str:
+        return f"{self.store.path}" + (f" (model {self.model})" if self.model else "")
+
+    def load(self, ref: int) -> Optional[Dict[str, Any]]:
+        row = self.store.get(ref)
+        if row is None:
+            self.skipped["deleted"] += 1
+            return None
+        return {**row, "sha256": row["document_sha256"], "file": row["file_name"]}
+
+    def records(self) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+        for sha256, ref in self.store.documents(self.model):
+            record = self.load(ref)
+            if record is not None:
+                yield sha256, ref, record
+
+    def index(self) -> Iterator[Tuple[str, int]]:
+        # Hashes and ids only: the extractions are not read
+        return self.store.documents(self.model)
+
+
+def open_source(location: str, model: Optional[str] = None) -> Any:
+    """ResultDirectory or StoredResults (for a .db/.sqlite file) at `location`."""
+    path = Path(location)
+    if path.is_file() and path.suffix.lower() in STORE_SUFFIXES:
+        return StoredResults(location, model)
+    if not path.is_dir():
+        raise ValueError(f"{location} is neither a results directory nor an extraction store")
+    if model:
+        raise ValueError("A model filter only applies to an extraction store")
+    return ResultDirectory(location)
+
+
+# =============================================================================
+# Comparison
+# =============================================================================
+def _total(scores: Dict[str, FieldCounts]) -> FieldCounts:
+    total = FieldCounts()
+    for counts in scores.values():
+        total.add(counts)
+    return total
+
+
+def compare_sources(old: Any, new: Any, worst: int = 20, min_facts: int = 1) -> Dict[str, Any]:
+    """Agreement of `new` with `old` per section and field, in one pass (see module docstring).
+
+    `min_facts` hides fields with fewer facts on both sides from the
+    report's field list (they are still counted in their section).
+    """
+    locations: Dict[str, Any] = {}
+    duplicates = 0
+    for sha256, ref in old.index():
+        if sha256 in locations:
+            duplicates += 1
+        else:
+            locations[sha256] = ref
+
+    sections = {section: FieldCounts() for section in SECTION_TYPES}
+    fields: Dict[str, FieldCounts] = defaultdict(FieldCounts)
+    compared = identical = only_new = 0
+    seen = set()
+    lowest: List[Tuple[float, int, Dict[str, Any]]] = []
+
+    for sha256, _, record in new.records():
+        ref = locations.get(sha256)
+        if ref is None:
+            only_new += 1
+            continue
+        if sha256 in seen:
+            duplicates += 1
+            continue
+        reference = old.load(ref)
+        if reference is None:
+            continue
+        seen.add(sha256)
+
+        scores = score_fields(record.get("extraction"), reference.get("extraction"))
+        per_section: Dict[str, FieldCounts] = defaultdict(FieldCounts)
+        for path, counts in scores.items():
+            fields[path].add(counts)
+            per_section[path.split(".", 1)[0].rstrip("[]")].add(counts)
+        for section, counts in per_section.items():
+            sections[section].add(counts)
+        compared += 1
+
+        total = _total(scores)
+        if total.matched == total.predicted == total.expected:
+            identical += 1
+            continue
+        entry = {
+            "sha256": sha256,
+            "old": {"file": reference.get("file"), "model": reference.get("model")},
+            "new": {"file": record.get("file"), "model": record.get("model")},
+            "f1": round(total.f1, 4),
+            "sections": {
+                section: round(counts.f1, 4) for section, counts in per_section.items() if counts.f1 < 1.0
+            },
+        }
+        # Max-heap by f1 of size `worst`: the best-agreeing one is dropped
+        heapq.heappush(lowest, (-total.f1, compared, entry))
+        if len(lowest) > worst:
+            heapq.heappop(lowest)
+
+    overall = _total(sections)
+    return {
+        "old": old.describe(),
+        "new": new.describe(),
+        "documents": {
+            "compared": compared,
+            "identical": identical,
+            "only_old": len(locations) - len(seen),
+            "only_new": only_new,
+            "duplicates": duplicates,
+            "skipped_old": dict(old.skipped),
+            "skipped_new": dict(new.skipped),
+        },
+        "overall": overall.summary(),
+        "sections": {section: counts.summary() for section, counts in sections.items()},
+        "fields": {
+            path: counts.summary()
+            for path, counts in sorted(fields.items(), key=lambda item: (item[1].f1, item[0]))
+            if max(counts.predicted, counts.expected) >= min_facts
+        },
+        "worst": [entry for _, _, entry in sorted(lowest, key=lambda item: (-item[0], item[1]))],
+    }
@@ -0,0 +1,346 @@
+"""
+Persistent store of validated extractions.
+
+Every successful analysis served by the API is saved to a SQLite database
+(EXTRACTION_STORE_PATH) together with the hash of the source document and the
+patient's normalized phone numbers and names. This lets the service:
+
+- answer a re-upload of a known document from the store instead of Gemini,
+- find prior extractions of a patient by phone, name or Arabic name
+  (indexed lookups, milliseconds even with many thousands of records),
+- let the UI prefill a patient from stored data.
+
+The database uses WAL mode, so several worker processes (or replicas sharing
+a volume on one host) can read and write it at the same time.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+from text_normalize import normalize_name, normalize_phone
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_sha256 TEXT NOT NULL,
+    file_name TEXT,
+    model TEXT NOT NULL,
+    strategy TEXT,
+    requested_strategy TEXT,
+    -- Bundles: JSON list of the strategy each file was processed with
+    file_strategies TEXT,
+    partial INTEGER NOT NULL DEFAULT 0,
+    degraded INTEGER NOT NULL DEFAULT 0,
+    extracted_at REAL NOT NULL,
+    patient_name TEXT,
+    patient_name_ar TEXT,
+    name_norm TEXT,
+    name_ar_norm TEXT,
+    extraction TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_extractions_document
+    ON extractions (document_sha256, model, extracted_at);
+CREATE INDEX IF NOT EXISTS idx_extractions_name ON extractions (name_norm);
+CREATE INDEX IF NOT EXISTS idx_extractions_name_ar ON extractions (name_ar_norm);
+CREATE INDEX IF NOT EXISTS idx_extractions_date ON extractions (extracted_at);
+
+-- One row per phone number of the patient (phone and optional_phone)
+CREATE TABLE IF NOT EXISTS extraction_phones (
+    phone_norm TEXT NOT NULL,
+    extraction_id INTEGER NOT NULL REFERENCES extractions (id) ON DELETE CASCADE,
+    PRIMARY KEY (phone_norm, extraction_id)
+) WITHOUT ROWID;
+
+-- Deleted extraction ids, in order, so other worker processes can drop
+-- them from their in-memory patient index (see patient_matching)
+CREATE TABLE IF NOT EXISTS extraction_deletions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    extraction_id INTEGER NOT NULL,
+    deleted_at REAL NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS extractions_deleted AFTER DELETE ON extractions
+BEGIN
+    INSERT INTO extraction_deletions (extraction_id, deleted_at)
+    VALUES (old.id, CAST(strftime('%s', 'now') AS REAL));
+END;
+"""
+
+# Columns returned by searches (the extraction itself only on request)
+_SUMMARY_COLUMNS = (
+    "id, document_sha256, file_name, model, strategy, partial, degraded, extracted_at, "
+    "patient_name, patient_name_ar"
+)
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+def _timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds from an epoch number or an ISO date(time) string."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+# =============================================================================
+# Store
+# =============================================================================
+class ExtractionStore:
+    """SQLite table of extractions with phone, name, document and date indexes."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        self._add_column(conn, "requested_strategy TEXT")
+        self._add_column(conn, "file_strategies TEXT")
+
+    @staticmethod
+    def _add_column(conn: sqlite3.Connection, definition: str) -> None:
+        """Add a column to the extractions table of a database created before it."""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(extractions)")}
+        if definition.split()[0] in columns:
+            return
+        try:
+            conn.execute(f"ALTER TABLE extractions ADD COLUMN {definition}")
+        except sqlite3.OperationalError as exc:
+            # Another worker process added it first
+            if "duplicate column" not in str(exc):
+                raise
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+    def save(
+        self,
+        result: Dict[str, Any],
+        document_sha256: str,
+        file_name: Optional[str] = None,
+        requested_strategy: Optional[str] = None,
+    ) -> int:
+        """Store the extraction of a successful analysis result. Returns its id.
+
+        `requested_strategy` is the strategy the analysis was asked for; the
+        result's own `strategy` is the one actually used (e.g. "upload" for "race").
+        """
+        extraction = result["extraction"]
+        patient = extraction.get("patient") or {}
+        strategy = result.get("strategy")
+        file_strategies = None
+        if isinstance(strategy, list):
+            file_strategies = json.dumps(strategy)
+            strategy = ",".join(s or "" for s in strategy)
+        phones = {
+            normalize_phone(patient.get(field)) for field in ("phone", "optional_phone")
+        } - {None}
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "INSERT INTO extractions (document_sha256, file_name, model, strategy, "
+                "requested_strategy, file_strategies, partial, degraded, extracted_at, "
+                "patient_name, patient_name_ar, name_norm, name_ar_norm, extraction) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    document_sha256,
+                    file_name,
+                    result.get("model", ""),
+                    strategy,
+                    requested_strategy,
+                    file_strategies,
+                    int(bool(result.get("partial"))),
+                    int(bool((result.get("deadline") or {}).get("degraded"))),
+                    time.time(),
+                    patient.get("name") or None,
+                    patient.get("name_ar") or None,
+                    normalize_name(patient.get("name")),
+                    normalize_name(patient.get("name_ar")),
+                    json.dumps(extraction, ensure_ascii=False, default=str),
+                ),
+            )
+            extraction_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO extraction_phones (phone_norm, extraction_id) VALUES (?, ?)",
+                [(phone, extraction_id) for phone in phones],
+            )
+            conn.execute("COMMIT")
+            return extraction_id
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, extraction_id: int) -> bool:
+        cursor = self._conn().execute("DELETE FROM extractions WHERE id = ?", (extraction_id,))
+        return cursor.rowcount > 0
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+    def _row(self, row: sqlite3.Row, include_extraction: bool) -> Dict[str, Any]:
+        record = {
+            key: row[key]
+            for key in row.keys()
+            if key not in ("extraction", "name_norm", "name_ar_norm")
+        }
+        if record.get("file_strategies"):
+            record["file_strategies"] = json.loads(record["file_strategies"])
+        record["partial"] = bool(record["partial"])
+        record["degraded"] = bool(record["degraded"])
+        if include_extraction:
+            record["extraction"] = json.loads(row["extraction"])
+        return record
+
+    def get(self, extraction_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM extractions WHERE id = ?", (extraction_id,)
+        ).fetchone()
+        return self._row(row, include_extraction=True) if row else None
+
+    def latest_for_document(
+        self,
+        document_sha256: str,
+        model: Optional[str] = None,
+        requested_strategy: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Most recent extraction of a document that was neither partial nor degraded.
+
+        With `requested_strategy`, only extractions asked for with that strategy.
+        """
+        sql = (
+            "SELECT * FROM extractions "
+            "WHERE document_sha256 = ? AND partial = 0 AND degraded = 0"
+        )
+        params: List[Any] = [document_sha256]
+        if model:
+            sql += " AND model = ?"
+            params.append(model)
+        if requested_strategy:
+            sql += " AND requested_strategy = ?"
+            params.append(requested_strategy)
+        row = self._conn().execute(
+            sql + " ORDER BY extracted_at DESC LIMIT 1", params
+        ).fetchone()
+        return self._row(row, include_extraction=True) if row else None
+
+    def search(
+        self,
+        phone: Optional[str] = None,
+        name: Optional[str] = None,
+        name_ar: Optional[str] = None,
+        document_sha256: Optional[str] = None,
+        since: Any = None,
+        until: Any = None,
+        include_extraction: bool = False,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """Newest first. Names match by prefix of the normalized name."""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if phone:
+            clauses.append(
+                "id IN (SELECT extraction_id FROM extraction_phones WHERE phone_norm = ?)"
+            )
+            params.append(normalize_phone(phone))
+        for column, value in (("name_norm", name), ("name_ar_norm", name_ar)):
+            normalized = normalize_name(value)
+            if normalized:
+                # Range instead of LIKE so the index is used
+                clauses.append(f"{column} >= ? AND {column} < ?")
+                params += [normalized, normalized + "\uffff"]
+        if document_sha256:
+            clauses.append("document_sha256 = ?")
+            params.append(document_sha256)
+        if since is not None:
+            clauses.append("extracted_at >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            clauses.append("extracted_at < ?")
+            params.append(_timestamp(until))
+
+        columns = "*" if include_extraction else _SUMMARY_COLUMNS
+        sql = f"SELECT {columns} FROM extractions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY extracted_at DESC LIMIT ?"
+        params.append(limit)
+        rows = self._conn().execute(sql, params).fetchall()
+        return [self._row(row, include_extraction) for row in rows]
+
+    def patients(self, after_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(extraction id, patient) of every extraction after `after_id`, oldest first."""
+        rows = self._conn().execute(
+            "SELECT id, json_extract(extraction, '$.patient') FROM extractions "
+            "WHERE id > ? ORDER BY id",
+            (after_id,),
+        )
+        for extraction_id, patient in rows:
+            yield extraction_id, json.loads(patient) if patient else {}
+
+    def labs(self) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """(extraction id, labs list) of every complete extraction with labs, oldest first."""
+        rows = self._conn().execute(
+            "SELECT id, json_extract(extraction, '$.labs.labs') FROM extractions "
+            "WHERE partial = 0 AND json_extract(extraction, '$.labs.labs') IS NOT NULL ORDER BY id"
+        )
+        for extraction_id, labs in rows:
+            yield extraction_id, json.loads(labs)
+
+    def documents(self, model: Optional[str] = None) -> Iterator[Tuple[str, int]]:
+        """(document hash, id of its latest complete extraction), optionally of one model."""
+        sql = "SELECT document_sha256, MAX(id) FROM extractions WHERE partial = 0 AND degraded = 0"
+        params: List[Any] = []
+        if model:
+            sql += " AND model = ?"
+            params.append(model)
+        yield from self._conn().execute(sql + " GROUP BY document_sha256 ORDER BY 2", params)
+
+    def deletions(self, after_seq: int = 0) -> List[Tuple[int, int]]:
+        """(sequence number, extraction id) of the deletions after `after_seq`, in order."""
+        return self._conn().execute(
+            "SELECT seq, extraction_id FROM extraction_deletions WHERE seq > ? ORDER BY seq",
+            (after_seq,),
+        ).fetchall()
+
+    def last_deletion(self) -> int:
+        return self._conn().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM extraction_deletions"
+        ).fetchone()[0]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+
+
+_store: Optional[ExtractionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_extraction_store() -> ExtractionStore:
+    """Process-wide ExtractionStore opened lazily at EXTRACTION_STORE_PATH."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ExtractionStore(settings.EXTRACTION_STORE_PATH)
+        return _store
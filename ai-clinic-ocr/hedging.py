@@ -0,0 +1,173 @@
+"""
+Hedged requests for Gemini generation calls.
+
+If a generation call has not returned by a percentile of recent latency for
+its model, an identical second request is fired. The first attempt that
+returns a valid result wins and the other attempt is cancelled through its
+CancelToken (which closes its response stream). A global budget caps the
+fraction of calls that may be hedged so quota use stays bounded.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+from cancellation import AnalysisCancelled, CancelToken
+from config import settings
+from metrics import metrics
+from profiling import in_context
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies per model."""
+
+    def __init__(self, window: int = 200) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(model, deque(maxlen=self.window))
+            samples.append(seconds)
+
+    def percentile(self, model: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        """Nearest-rank percentile, or None until `min_samples` latencies are known."""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        rank = min(len(samples) - 1, max(0, int(round(pct / 100 * len(samples))) - 1))
+        return samples[rank]
+
+
+class HedgeBudget:
+    """Allow hedges only while hedged calls stay under `max_rate` of all calls."""
+
+    def __init__(self, max_rate: float, window_seconds: float) -> None:
+        self.max_rate = max_rate
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._calls: Deque[float] = deque()
+        self._hedges: Deque[float] = deque()
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        for events in (self._calls, self._hedges):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def record_call(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._calls.append(now)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if (len(self._hedges) + 1) > self.max_rate * max(1, len(self._calls)):
+                return False
+            self._hedges.append(now)
+            return True
+
+
+# Shared by all requests in this process
+latency_tracker = LatencyTracker()
+hedge_budget = HedgeBudget(settings.HEDGE_MAX_RATE, settings.HEDGE_WINDOW_SECONDS)
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gemini-hedge")
+
+
+def run_hedged(
+    model: str,
+    attempt: Callable[[CancelToken], T],
+    is_valid: Callable[[T], bool],
+    cancel_token: Optional[CancelToken] = None,
+    percentile: Optional[float] = None,
+) -> T:
+    """Run `attempt`, firing one hedge if it is slower than the latency percentile.
+
+    `attempt` receives its own CancelToken and must honour it. Results for
+    which `is_valid` returns False are treated like failures: the other
+    attempt (if any) still gets a chance to win.
+    """
+    pct = settings.HEDGE_PERCENTILE if percentile is None else percentile
+    threshold = latency_tracker.percentile(model, pct, settings.HEDGE_MIN_SAMPLES)
+    hedge_budget.record_call()
+
+    tokens: Dict[Future, CancelToken] = {}
+    started: Dict[Future, float] = {}
+
+    def launch() -> Future:
+        token = CancelToken()
+        if cancel_token:
+            cancel_token.on_cancel(lambda: token.cancel(cancel_token.reason or "cancelled"))
+        future = _executor.submit(in_context(attempt), token)
+        tokens[future] = token
+        started[future] = time.monotonic()
+        return future
+
+    pending = {launch()}
+    hedged = False
+    last_error: Optional[BaseException] = None
+    invalid_result: Optional[T] = None
+
+    try:
+        while pending:
+            timeout = None
+            if not hedged and threshold is not None:
+                elapsed = time.monotonic() - min(started.values())
+                timeout = max(0.0, threshold - elapsed)
+
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # Primary is slower than the percentile: hedge once if budget allows
+                hedged = True
+                if hedge_budget.try_acquire():
+                    metrics.incr("hedge.fired")
+                    pending.add(launch())
+                else:
+                    metrics.incr("hedge.budget_exhausted")
+                continue
+
+            for future in done:
+                try:
+                    result = future.result()
+                except AnalysisCancelled as exc:
+                    last_error = last_error or exc
+                    continue
+                except Exception as exc:
+                    last_error = exc
+                    continue
+
+                if not is_valid(result):
+                    metrics.incr("hedge.invalid_result")
+                    invalid_result = result
+                    continue
+
+                latency_tracker.record(model, time.monotonic() - started[future])
+                if len(tokens) > 1:
+                    won_by_hedge = future is not next(iter(tokens))
+                    metrics.incr("hedge.won" if won_by_hedge else "hedge.primary_won")
+                return result
+    finally:
+        # Cancel the loser (or everything, if we are bailing out)
+        for token in tokens.values():
+            token.cancel("hedge finished")
+
+    if cancel_token and cancel_token.cancelled:
+        # An attempt's own cancellation may carry the partial response text
+        if isinstance(last_error, AnalysisCancelled):
+            raise last_error
+        cancel_token.raise_if_cancelled("generate")
+    if invalid_result is not None:
+        return invalid_result
+    if last_error is not None:
+        raise last_error
+    raise RuntimeError("Hedged generation produced no result.")
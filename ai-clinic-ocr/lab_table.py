@@ -0,0 +1,613 @@
+"""
+Columnar table of extracted lab results.
+
+Lab values come back from Gemini as free strings: "13.5", "<0.5", "5,2",
+"١٣٫٥", "Negative", units as "mg/dl", "mg/dL", "mmol/l", reference ranges as
+{"min": "13", "max": "18"} or {"range": "70 - 110"}. `build_lab_table` turns
+the labs of many extractions into NumPy columns in one pass:
+
+- text is dictionary-encoded while reading, so each distinct string is
+  parsed once, not per row,
+- units are canonicalized ("mg/dl" -> "mg/dL") and, for common analytes,
+  converted to one unit (glucose mmol/L -> mg/dL, HbA1c mmol/mol -> %, ...)
+  with a vectorized factor/offset lookup,
+- high / low flags are computed against the extracted reference range.
+
+`LabTable.summary` aggregates per test and unit across all patients with
+`np.bincount` on the integer codes, and `LabTable.save` writes Parquet (if pyarrow is installed)
+or a compressed `.npz`. See scripts/export_labs.py and
+scripts/bench_lab_table.py.
+"""
+
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from text_normalize import normalize_name
+
+# =============================================================================
+# Units and analytes
+# =============================================================================
+# Unit spelling (lower case, no spaces, µ/μ as u) -> canonical unit
+UNIT_ALIASES: Dict[str, str] = {
+    "mg/dl": "mg/dL",
+    "mg%": "mg/dL",
+    "mmol/l": "mmol/L",
+    "mmol/mol": "mmol/mol",
+    "umol/l": "µmol/L",
+    "micromol/l": "µmol/L",
+    "nmol/l": "nmol/L",
+    "pmol/l": "pmol/L",
+    "g/dl": "g/dL",
+    "gm/dl": "g/dL",
+    "gm%": "g/dL",
+    "g/l": "g/L",
+    "mg/l": "mg/L",
+    "ng/ml": "ng/mL",
+    "ng/dl": "ng/dL",
+    "pg/ml": "pg/mL",
+    "ug/dl": "µg/dL",
+    "u/l": "U/L",
+    "iu/l": "U/L",
+    "miu/l": "mIU/L",
+    "uiu/ml": "mIU/L",
+    "miu/ml": "IU/L",
+    "meq/l": "mEq/L",
+    "%": "%",
+    "fl": "fL",
+    "pg": "pg",
+    "sec": "s",
+    "seconds": "s",
+    "mm/hr": "mm/h",
+    "mm/h": "mm/h",
+    "/ul": "/µL",
+    "/cmm": "/µL",
+    "/mm3": "/µL",
+    "x10^3/ul": "10^3/µL",
+    "10^3/ul": "10^3/µL",
+    "x10^9/l": "10^3/µL",
+    "10^9/l": "10^3/µL",
+    "k/ul": "10^3/µL",
+    "x10^6/ul": "10^6/µL",
+    "10^6/ul": "10^6/µL",
+    "x10^12/l": "10^6/µL",
+    "10^12/l": "10^6/µL",
+}
+
+# Test name spelling (normalized) -> (test, analyte). The test is what results
+# are grouped by; the analyte decides unit conversions.
+TEST_ALIASES: Dict[str, Tuple[str, str]] = {}
+for _test, _analyte, _aliases in (
+    ("Fasting glucose", "glucose", ["fbs", "fbg", "fasting blood sugar", "fasting blood glucose",
+                                    "fasting glucose", "fasting plasma glucose", "سكر صائم"]),
+    ("Random glucose", "glucose", ["rbs", "random blood sugar", "random blood glucose",
+                                   "random glucose", "سكر عشوائي"]),
+    ("Postprandial glucose", "glucose", ["2hpp", "2h pp", "pp", "ppbs", "post prandial",
+                                         "postprandial blood sugar", "2 hours post prandial",
+                                         "سكر فاطر"]),
+    ("Glucose", "glucose", ["glucose", "blood sugar", "blood glucose", "سكر"]),
+    ("HbA1c", "hba1c", ["hba1c", "hb a1c", "a1c", "glycated hemoglobin",
+                        "glycosylated hemoglobin", "السكر التراكمي"]),
+    ("Hemoglobin", "hemoglobin", ["hb", "hgb", "hemoglobin", "haemoglobin", "هيموجلوبين"]),
+    ("Total cholesterol", "cholesterol", ["cholesterol", "total cholesterol", "t. cholesterol",
+                                          "chol", "كوليسترول"]),
+    ("LDL cholesterol", "cholesterol", ["ldl", "ldl-c", "ldl cholesterol"]),
+    ("HDL cholesterol", "cholesterol", ["hdl", "hdl-c", "hdl cholesterol"]),
+    ("Triglycerides", "triglycerides", ["tg", "triglycerides", "triglyceride", "دهون ثلاثية"]),
+    ("Creatinine", "creatinine", ["creatinine", "s. creatinine", "serum creatinine", "creat",
+                                  "كرياتينين"]),
+    ("Urea", "urea", ["urea", "blood urea", "s. urea"]),
+    ("Albumin", "albumin", ["albumin", "s. albumin", "serum albumin"]),
+    ("Total bilirubin", "bilirubin", ["bilirubin", "total bilirubin", "t. bilirubin", "tbil"]),
+    ("Direct bilirubin", "bilirubin", ["direct bilirubin", "d. bilirubin", "dbil"]),
+    ("Calcium", "calcium", ["calcium", "ca", "s. calcium", "total calcium"]),
+    ("Vitamin D", "vitamin_d", ["vitamin d", "vit d", "25-oh vitamin d", "25 oh vit d",
+                                "25-hydroxy vitamin d"]),
+    ("ALT", "alt", ["alt", "sgpt", "alt (sgpt)"]),
+    ("AST", "ast", ["ast", "sgot", "ast (sgot)"]),
+    ("TSH", "tsh", ["tsh"]),
+    ("WBC", "wbc", ["wbc", "tlc", "white blood cells", "total leucocytic count"]),
+    ("Platelets", "platelets", ["plt", "platelets", "platelet count"]),
+):
+    for _alias in _aliases:
+        TEST_ALIASES[_alias] = (_test, _analyte)
+
+# Unit every result of an analyte is converted to
+CANONICAL_UNITS: Dict[str, str] = {
+    "glucose": "mg/dL",
+    "hba1c": "%",
+    "hemoglobin": "g/dL",
+    "cholesterol": "mg/dL",
+    "triglycerides": "mg/dL",
+    "creatinine": "mg/dL",
+    "urea": "mg/dL",
+    "albumin": "g/dL",
+    "bilirubin": "mg/dL",
+    "calcium": "mg/dL",
+    "vitamin_d": "ng/mL",
+}
+
+# (analyte, from unit) -> (factor, offset): canonical = value * factor + offset
+CONVERSIONS: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ("glucose", "mmol/L"): (18.016, 0.0),
+    # IFCC -> NGSP master equation
+    ("hba1c", "mmol/mol"): (0.09148, 2.152),
+    ("hemoglobin", "g/L"): (0.1, 0.0),
+    ("hemoglobin", "mmol/L"): (1.611, 0.0),
+    ("cholesterol", "mmol/L"): (38.67, 0.0),
+    ("triglycerides", "mmol/L"): (88.57, 0.0),
+    ("creatinine", "µmol/L"): (1 / 88.4, 0.0),
+    ("urea", "mmol/L"): (6.006, 0.0),
+    ("albumin", "g/L"): (0.1, 0.0),
+    ("bilirubin", "µmol/L"): (1 / 17.1, 0.0),
+    ("calcium", "mmol/L"): (4.008, 0.0),
+    ("vitamin_d", "nmol/L"): (1 / 2.496, 0.0),
+}
+
+# =============================================================================
+# Parsing of distinct strings
+# =============================================================================
+_NUMBER = r"[-+]?\d+(?:[.,]\d+)*"
+_VALUE = re.compile(rf"^\s*(<=|>=|[<>≤≥])?\s*({_NUMBER})\s*(.*)$")
+_RANGE = re.compile(rf"({_NUMBER})\s*(?:-|–|—|to|:)\s*({_NUMBER})")
+_BOUND = re.compile(rf"(<=|>=|[<>≤≥]|up to|less than|more than|below|above)\s*({_NUMBER})", re.I)
+_LOWER_WORDS = (">", ">=", "≥", "more than", "above")
+_TEST_NOISE = re.compile(r"\s*\([^)]*\)\s*$|[:*]+$")
+
+
+def _number(text: str) -> float:
+    """"5,2" -> 5.2 (decimal comma); "250,000" -> 250000 (thousands)."""
+    if "," in text:
+        if "." in text or re.search(r",\d{3}(?!\d)", text):
+            text = text.replace(",", "")
+        else:
+            text = text.replace(",", ".")
+    return float(text)
+
+
+def _digits(text: str) -> str:
+    """Arabic-Indic digits and separators to ASCII."""
+    return "".join(
+        str(unicodedata.digit(ch)) if ch.isdigit() else {"٫": ".", "٬": ","}.get(ch, ch)
+        for ch in text
+    )
+
+
+def _parse_value(raw: str) -> Tuple[float, str, str]:
+    """(value, comparator, unit written after the value) of a result string."""
+    match = _VALUE.match(_digits(raw))
+    if not match:
+        return np.nan, "", ""
+    comparator = {"≤": "<", "≥": ">", "<=": "<", ">=": ">"}.get(match[1] or "", match[1] or "")
+    try:
+        return _number(match[2]), comparator, match[3].strip()
+    except ValueError:
+        return np.nan, "", ""
+
+
+def _parse_range(raw: str) -> Tuple[float, float]:
+    """(low, high) of a reference range string; NaN for an open end."""
+    text = _digits(raw)
+    match = _RANGE.search(text)
+    if match:
+        return _number(match[1]), _number(match[2])
+    match = _BOUND.search(text)
+    if match:
+        if match[1].lower() in _LOWER_WORDS:
+            return _number(match[2]), np.nan
+        return np.nan, _number(match[2])
+    return np.nan, np.nan
+
+
+def _range_text(reference_range: Any) -> str:
+    """Reference range dict as one string "low-high" (or the raw text)."""
+    if not reference_range:
+        return ""
+    if not isinstance(reference_range, dict):
+        return str(reference_range)
+    low = next((reference_range[k] for k in ("min", "low", "lower") if reference_range.get(k)), None)
+    high = next((reference_range[k] for k in ("max", "high", "upper") if reference_range.get(k)), None)
+    if low and high:
+        return f"{low}-{high}"
+    if low:
+        return f">{low}"
+    if high:
+        return f"<{high}"
+    return " ".join(str(v) for v in reference_range.values() if v)
+
+
+def canonical_unit(unit: str) -> str:
+    key = unit.strip().replace("μ", "u").replace("µ", "u").replace(" ", "").lower()
+    return UNIT_ALIASES.get(key, unit.strip())
+
+
+def canonical_test(name: str) -> Tuple[str, str]:
+    """(test, analyte); unknown tests keep their name and have no analyte."""
+    key = normalize_name(name) or ""
+    for candidate in (key, _TEST_NOISE.sub("", key)):
+        if candidate in TEST_ALIASES:
+            return TEST_ALIASES[candidate]
+    return " ".join(name.split()), ""
+
+
+def _factorize(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(code per value, distinct values) in first-seen order; a dict, no sorting."""
+    index: Dict[str, int] = {}
+    codes = np.fromiter(
+        (index.setdefault(value, len(index)) for value in values), dtype=np.int32, count=len(values)
+    )
+    return codes, np.array(list(index), dtype=str)
+
+
+def _recode(codes: np.ndarray, mapped: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Codes and categories after mapping each category to a new string."""
+    new_codes, categories = _factorize(mapped)
+    return new_codes[codes], categories
+
+
+def _parse_date(text: str) -> np.datetime64:
+    try:
+        return np.datetime64(text[:10], "D")
+    except ValueError:
+        return np.datetime64("NaT", "D")
+
+
+# =============================================================================
+# Table
+# =============================================================================
+# Dictionary-encoded text columns: int32 codes into a categories array
+CATEGORICAL = ("test", "test_raw", "comparator", "value_raw", "unit", "unit_raw", "flag")
+
+# Column -> dtype of an empty table
+COLUMNS: Dict[str, Any] = {
+    "record": np.int64,
+    "test": np.int32,
+    "test_raw": np.int32,
+    "lab_date": "datetime64[D]",
+    "value": np.float64,
+    "comparator": np.int32,
+    "value_raw": np.int32,
+    "unit": np.int32,
+    "unit_raw": np.int32,
+    "ref_low": np.float64,
+    "ref_high": np.float64,
+    "flag": np.int32,
+}
+
+FLAGS = np.array(["", "N", "H", "L"])
+
+
+@dataclass
+class LabTable:
+    """One row per lab result; each column a NumPy array.
+
+    `record` is the extraction id (or the position of the source file),
+    `value` / `ref_low` / `ref_high` are in the canonical `unit`, `flag` is
+    "H", "L", "N" (within range) or "" (no range or no numeric value).
+    Text columns are dictionary-encoded (`codes` / `categories`), as in Arrow:
+    grouping and filtering work on integers.
+    """
+
+    columns: Dict[str, np.ndarray]
+    categories: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.columns["record"])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        """Column values (text columns decoded)."""
+        if column in self.categories:
+            return self.categories[column][self.columns[column]]
+        return self.columns[column]
+
+    def codes(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def equals(self, column: str, value: str) -> np.ndarray:
+        """Row mask of a text column equal to `value` (compares codes, not strings)."""
+        matches = np.flatnonzero(self.categories[column] == value)
+        if not len(matches):
+            return np.zeros(len(self), dtype=bool)
+        return self.columns[column] == matches[0]
+
+    def filter(self, mask: np.ndarray) -> "LabTable":
+        return LabTable({name: values[mask] for name, values in self.columns.items()}, self.categories)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per test and unit: results, patients (records), mean / min / max, flags.
+
+        Censored results ("<0.5", ">1000") are not exact values: they are
+        counted in `censored` and left out of mean / min / max.
+        """
+        if not len(self):
+            return []
+        units = len(self.categories["unit"])
+        keys = self.columns["test"].astype(np.int64) * units + self.columns["unit"]
+        n = len(self.categories["test"]) * units
+        if n <= max(1 << 20, len(self)):
+            # Few enough test/unit combinations: the key is the bin
+            groups, codes = np.arange(n), keys
+        else:
+            groups, codes = np.unique(keys, return_inverse=True)
+            n = len(groups)
+        value = self.columns["value"]
+        exact = (self.categories["comparator"] == "")[self.columns["comparator"]]
+        numeric = ~np.isnan(value)
+        censored = np.bincount(codes, weights=numeric & ~exact, minlength=n)
+        numeric &= exact
+        counts = np.bincount(codes, minlength=n)
+        valued = np.bincount(codes, weights=numeric, minlength=n)
+        sums = np.bincount(codes, weights=np.where(numeric, value, 0.0), minlength=n)
+        low = np.full(n, np.inf)
+        high = np.full(n, -np.inf)
+        np.minimum.at(low, codes[numeric], value[numeric])
+        np.maximum.at(high, codes[numeric], value[numeric])
+        flag = self.columns["flag"]
+        flags = {
+            name: np.bincount(codes, weights=flag == code, minlength=n)
+            for code, name in enumerate(FLAGS)
+            if name in ("H", "L")
+        }
+        # Distinct (group, record) pairs: sort, keep the first of each run
+        pairs = np.sort(codes.astype(np.int64) << 32 | self.columns["record"] & 0xFFFFFFFF)
+        first = np.ones(len(pairs), dtype=bool)
+        first[1:] = pairs[1:] != pairs[:-1]
+        patients = np.bincount((pairs[first] >> 32).astype(np.intp), minlength=n)
+
+        summary = []
+        present = np.flatnonzero(counts)
+        for i in present[np.argsort(-counts[present], kind="stable")]:
+            test, unit = divmod(int(groups[i]), units)
+            has_values = valued[i] > 0
+            summary.append(
+                {
+                    "test": str(self.categories["test"][test]),
+                    "unit": str(self.categories["unit"][unit]),
+                    "results": int(counts[i]),
+                    "patients": int(patients[i]),
+                    "mean": round(float(sums[i] / valued[i]), 3) if has_values else None,
+                    "min": float(low[i]) if has_values else None,
+                    "max": float(high[i]) if has_values else None,
+                    "censored": int(censored[i]),
+                    "high": int(flags["H"][i]),
+                    "low": int(flags["L"][i]),
+                }
+            )
+        return summary
+
+    # -------------------------------------------------------------------------
+    # Export
+    # -------------------------------------------------------------------------
+    def save(self, path: str) -> Path:
+        """Write Parquet (`.parquet`, needs pyarrow) or compressed NumPy (`.npz`)."""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.suffix == ".parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError(
+                    "pyarrow is required for Parquet export. Install with: pip install pyarrow "
+                    "(or export to .npz)"
+                )
+            arrays = {
+                name: (
+                    pa.DictionaryArray.from_arrays(values, self.categories[name].tolist())
+                    if name in self.categories
+                    else values
+                )
+                for name, values in self.columns.items()
+            }
+            pq.write_table(pa.table(arrays), target)
+        else:
+            target = target.with_suffix(".npz")
+            np.savez_compressed(
+                target,
+                **self.columns,
+                **{f"{name}__categories": values for name, values in self.categories.items()},
+            )
+        return target
+
+    @classmethod
+    def load(cls, path: str) -> "LabTable":
+        columns: Dict[str, np.ndarray] = {}
+        categories: Dict[str, np.ndarray] = {}
+        if Path(path).suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            table = pq.read_table(path)
+            for name in table.column_names:
+                column = table[name].combine_chunks()
+                if name in CATEGORICAL:
+                    columns[name] = column.indices.to_numpy().astype(np.int32)
+                    categories[name] = np.array(column.dictionary.to_pylist(), dtype=str)
+                else:
+                    columns[name] = column.to_numpy(zero_copy_only=False)
+            return cls(columns, categories)
+        with np.load(path) as data:
+            for name in data.files:
+                if name.endswith("__categories"):
+                    categories[name[: -len("__categories")]] = data[name]
+                else:
+                    columns[name] = data[name]
+        return cls(columns, categories)
+
+
+def _empty_table() -> LabTable:
+    return LabTable(
+        {name: np.array([], dtype=dtype) for name, dtype in COLUMNS.items()},
+        {name: FLAGS if name == "flag" else np.array([], dtype=str) for name in CATEGORICAL},
+    )
+
+
+def build_lab_table(records: Iterable[Tuple[int, List[Dict[str, Any]]]], convert: bool = True) -> LabTable:
+    """Lab table from (record id, labs list) pairs, e.g. `ExtractionStore.labs()`.
+
+    Every distinct string (value, unit, range, test name, date) is parsed
+    once. With `convert`, results of known analytes are converted to their
+    canonical unit (CANONICAL_UNITS) together with their reference range.
+    """
+    # Strings are dictionary-encoded while reading: one code per row, one
+    # parse per distinct string
+    record_ids: List[int] = []
+    columns: Dict[str, Tuple[Dict[Any, int], List[int]]] = {
+        name: ({}, []) for name in ("test", "date", "value", "unit", "range")
+    }
+    tests, dates, values, units, ranges = (columns[name] for name in columns)
+    for record_id, labs in records:
+        for lab in labs or []:
+            if not isinstance(lab, dict):
+                continue
+            results = lab.get("results") or {}
+            reference_range = results.get("reference_range")
+            if isinstance(reference_range, dict):
+                reference_range = tuple(reference_range.items())
+            record_ids.append(record_id)
+            for (index, codes), raw in (
+                (tests, lab.get("testName")),
+                (dates, lab.get("labDate")),
+                (values, results.get("value")),
+                (units, results.get("unit")),
+                (ranges, reference_range),
+            ):
+                codes.append(index.setdefault(raw, len(index)))
+    if not record_ids:
+        return _empty_table()
+
+    def decoded(column: Tuple[Dict[Any, int], List[int]]) -> Tuple[np.ndarray, List[Any]]:
+        index, codes = column
+        return np.array(codes, dtype=np.int32), list(index)
+
+    # Different raw objects (13.5 and "13.5", None and "") may stringify the same: re-encode
+    value_codes, raw_values = decoded(values)
+    value_codes, value_raw = _recode(value_codes, [str(v or "") for v in raw_values])
+    parsed = [_parse_value(text) for text in value_raw.tolist()]
+    value = np.array([row[0] for row in parsed], dtype=np.float64)[value_codes]
+    comparator, comparators = _recode(value_codes, [row[1] for row in parsed])
+
+    range_codes, raw_ranges = decoded(ranges)
+    bounds = np.array(
+        [_parse_range(_range_text(dict(r) if isinstance(r, tuple) else r)) for r in raw_ranges],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    ref_low, ref_high = bounds[range_codes, 0], bounds[range_codes, 1]
+
+    date_codes, raw_dates = decoded(dates)
+    lab_date = np.array(
+        [_parse_date(str(d or "")) for d in raw_dates], dtype="datetime64[D]"
+    )[date_codes]
+
+    test_raw, raw_tests = decoded(tests)
+    test_raw, test_names = _recode(test_raw, [str(t or "") for t in raw_tests])
+    unit_raw, raw_units = decoded(units)
+    unit_raw, unit_names = _recode(unit_raw, [str(u or "") for u in raw_units])
+
+    tests = [canonical_test(name) for name in test_names.tolist()]
+    test, test_categories = _recode(test_raw, [name for name, _ in tests])
+    analyte, analytes = _recode(test_raw, [name for _, name in tests])
+
+    # "13.5 mg/dl" in the value and no unit of its own
+    trailing = [row[2] for row in parsed]
+    written = np.where(unit_names[unit_raw] == "", len(unit_names) + value_codes, unit_raw)
+    unit, unit_categories = _recode(written, [canonical_unit(u) for u in unit_names.tolist() + trailing])
+
+    if convert:
+        value, ref_low, ref_high, unit, unit_categories = _convert(
+            analyte, analytes, unit, unit_categories, value, ref_low, ref_high
+        )
+
+    high = (value > ref_high) & (comparators[comparator] != "<")
+    low = (value < ref_low) & (comparators[comparator] != ">")
+    has_range = ~(np.isnan(ref_low) & np.isnan(ref_high))
+    flag = np.where(high, 2, np.where(low, 3, np.where(has_range & ~np.isnan(value), 1, 0)))
+
+    return LabTable(
+        {
+            "record": np.array(record_ids, dtype=np.int64),
+            "test": test,
+            "test_raw": test_raw,
+            "lab_date": lab_date,
+            "value": value,
+            "comparator": comparator,
+            "value_raw": value_codes,
+            "unit": unit,
+            "unit_raw": unit_raw,
+            "ref_low": ref_low,
+            "ref_high": ref_high,
+            "flag": flag.astype(np.int32),
+        },
+        {
+            "test": test_categories,
+            "test_raw": test_names,
+            "comparator": comparators,
+            "value_raw": value_raw,
+            "unit": unit_categories,
+            "unit_raw": unit_names,
+            "flag": FLAGS,
+        },
+    )
+
+
+def _convert(
+    analyte: np.ndarray,
+    analytes: np.ndarray,
+    unit: np.ndarray,
+    units: np.ndarray,
+    value: np.ndarray,
+    ref_low: np.ndarray,
+    ref_high: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Convert to canonical units with an (analyte, unit) -> factor/offset lookup."""
+    unit_names = units.tolist()
+    factor = np.ones((len(analytes), len(units)))
+    offset = np.zeros((len(analytes), len(units)))
+    target = np.tile(np.arange(len(units)), (len(analytes), 1))
+    for a, name in enumerate(analytes.tolist()):
+        for u, unit_name in enumerate(unit_names):
+            conversion = CONVERSIONS.get((name, unit_name))
+            if conversion:
+                factor[a, u], offset[a, u] = conversion
+                canonical = CANONICAL_UNITS[name]
+                if canonical not in unit_names:
+                    unit_names.append(canonical)
+                target[a, u] = unit_names.index(canonical)
+
+    row_factor = factor[analyte, unit]
+    row_offset = offset[analyte, unit]
+    return (
+        value * row_factor + row_offset,
+        ref_low * row_factor + row_offset,
+        ref_high * row_factor + row_offset,
+        target[analyte, unit].astype(np.int32),
+        np.array(unit_names, dtype=str),
+    )
+
+
+# =============================================================================
+# Sources
+# =============================================================================
+def labs_from_results(paths: Iterable[Path]) -> Iterable[Tuple[int, List[Dict[str, Any]]]]:
+    """(file position, labs) of saved analysis results (`*_fast.json`)."""
+    for position, path in enumerate(paths):
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            continue
+        extraction = result.get("extraction") or {}
+        yield position, (extraction.get("labs") or {}).get("labs") or []
+
+
+def labs_from_store(store: Optional[Any] = None) -> Iterable[Tuple[int, List[Dict[str, Any]]]]:
+    """(extraction id, labs) of the extraction store."""
+    if store is None:
+        from extraction_store import get_extraction_store
+
+        store = get_extraction_store()
+    return store.labs()
@@ -9,35 +9,63 @@ Single API call using Google Gen AI SDK for:
 Usage:
     python medical_ocr_fast.py document.pdf
     python medical_ocr_fast.py scan.png --model gemini-2.5-flash
+    python medical_ocr_fast.py labs.jpg report.pdf history.png --bundle
+    python medical_ocr_fast.py archive/ "scans/**/*.pdf" --concurrency 8
+    python medical_ocr_fast.py large_scan.pdf --profile
+    python medical_ocr_fast.py archive/2023/ --background
 """
 
 import argparse
+import io
 import json
+import shutil
+import tempfile
+import threading
 import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
-from ocr_types.medical_types import (
-    MedicalOCR,
-)  # Ensure this matches your local file structure
 from pydantic import ValidationError
 from google import genai
 from google.genai import types
 
-# PyMuPDF for fast PDF rendering (no external dependencies)
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    fitz = None
-
+from cancellation import AnalysisCancelled, CancelToken
+from circuit_breaker import CircuitOpen, breakers
 from config import settings
+from deadline import (
+    CORE_SECTIONS,
+    DEADLINE_REASON,
+    Deadline,
+    DeadlineExceeded,
+    plan_for_deadline,
+    salvage_extraction,
+)
+from engines import load_pymupdf, pymupdf_available
+from estimator import DocumentProfile, estimate, inspect_document, profile_from_metadata
+from hedging import run_hedged
+from metrics import metrics
+from profiling import finish as finish_profile
+from profiling import in_context, profile_analysis, stage
+from prompt_cache import PromptCache, is_cache_error
+from page_sections import PageGroup, plan_sections, section_instructions
+from pdf_split import MB, MemoryBudget, SplitPart, is_large_pdf, split_pdf
+from record_merge import merge_extractions
+from schema_registry import SECTION_TYPES, registry
+from shared_state import acquire_gemini_budget, file_sha256
 
 # =============================================================================
 # Configuration
 # =============================================================================
 GEMINI_API_KEY = settings.GEMINI_API_KEY.get_secret_value()
 
+# Ways of sending a PDF to Gemini (see analyze_document_streaming)
+PDF_STRATEGIES = ("upload", "images", "race", "text", "chunked", "sections", "auto")
+
 # =============================================================================
 # Compact Prompt
 # =============================================================================
@@ -51,6 +79,22 @@ CRITICAL INSTRUCTIONS:
 5. If a field is missing, leave it null or empty list.
 6. Return purely the JSON object matching the schema."""
 
+# Gemini cached-content entry for COMPACT_PROMPT + MedicalOCR schema
+prompt_cache = PromptCache(COMPACT_PROMPT, registry.schema("medical_ocr"))
+
+# Appended to COMPACT_PROMPT when several files are sent in one request
+BUNDLE_INSTRUCTIONS = """
+
+BUNDLE: The following files all belong to ONE patient. Each file starts with a
+[File N/M: name] marker. Merge them into a single record: one patient object,
+combined lists, and no duplicated entries for the same finding."""
+
+# Appended when a deadline only leaves time for the core sections
+CORE_SECTIONS_INSTRUCTIONS = f"""
+
+TIME LIMITED: Extract only these sections: {", ".join(CORE_SECTIONS)}.
+Leave every other section null or an empty list."""
+
 
 def parse_page_selection(selection: Optional[str]) -> Optional[List[int]]:
     """Convert a CLI page selection string into sorted page numbers."""
@@ -84,186 +128,912 @@ def parse_page_selection(selection: Optional[str]) -> Optional[List[int]]:
     return sorted(pages) if pages else None
 
 
-def analyze_document_streaming(
+def _page_indices(total_pages: int, selected_pages: Optional[List[int]]) -> List[int]:
+    """Zero-based indices of the pages to process (all pages without a selection)."""
+    if selected_pages:
+        page_indices = [p - 1 for p in selected_pages if 1 <= p <= total_pages]
+    else:
+        page_indices = list(range(total_pages))
+
+    if not page_indices:
+        raise ValueError("No valid pages selected.")
+    return page_indices
+
+
+@stage("render")
+def render_pdf_pages(
     file_path: str,
-    api_key: Optional[str] = None,
-    model: str = "gemini-2.5-flash-lite",
     selected_pages: Optional[List[int]] = None,
-    progress_cb: Optional[Callable[[int, str], None]] = None,
-) -> Dict[str, Any]:
-    """Analyze a medical document using Gemini 2.0 Flash with robust PDF handling."""
+    zoom: Optional[float] = None,
+    on_page: Optional[Callable[[int, int], None]] = None,
+) -> List[Any]:
+    """Render PDF pages to JPEG request parts: a "[Page N]" marker plus image per page.
+
+    `zoom` defaults to RENDER_DPI / 72. `on_page(idx, total)` is called before
+    each page is rendered (progress reporting and cancellation checkpoints).
+    """
+    # PyMuPDF for fast PDF rendering (imported on first use, see engines)
+    fitz = load_pymupdf()
+
+    # Open PDF with PyMuPDF
+    doc = fitz.open(file_path)
+    try:
+        page_indices = _page_indices(len(doc), selected_pages)
+
+        # Render pages to images using PyMuPDF (faster than Poppler)
+        # RENDER_DPI 144 (zoom 2.0) is a good balance of quality/speed
+        zoom = zoom or settings.RENDER_DPI / 72
+        zoom_matrix = fitz.Matrix(zoom, zoom)
+        parts: List[Any] = []
+
+        for idx, page_idx in enumerate(page_indices):
+            if on_page:
+                on_page(idx, len(page_indices))
+            pix = doc[page_idx].get_pixmap(matrix=zoom_matrix)
+            parts.append(f"\n[Page {page_idx + 1}]")
+            parts.append(
+                types.Part.from_bytes(data=pix.tobytes("jpeg"), mime_type="image/jpeg")
+            )
+        return parts
+    finally:
+        doc.close()
 
-    def report(percent: int, message: str) -> None:
-        if progress_cb:
-            progress_cb(max(0, min(100, percent)), message)
 
-    # 1. Setup Client
-    api_key = api_key or GEMINI_API_KEY
-    if not api_key:
-        raise ValueError("Gemini API key not configured. Set GEMINI_API_KEY env var.")
+@stage("text")
+def extract_text_parts(
+    file_path: str,
+    selected_pages: Optional[List[int]] = None,
+    zoom: Optional[float] = None,
+    on_page: Optional[Callable[[int, int], None]] = None,
+) -> List[Any]:
+    """PDF text layer as request parts; pages without usable text are rendered.
+
+    Text is far cheaper than a page image for digital (non-scanned) PDFs.
+    Pages with fewer than TEXT_LAYER_MIN_CHARS characters are treated as
+    scanned and sent as JPEG images like render_pdf_pages does.
+    """
+    fitz = load_pymupdf()
+
+    doc = fitz.open(file_path)
+    try:
+        page_indices = _page_indices(len(doc), selected_pages)
+        zoom = zoom or settings.RENDER_DPI / 72
+        zoom_matrix = fitz.Matrix(zoom, zoom)
+        parts: List[Any] = []
+        rendered = 0
+
+        for idx, page_idx in enumerate(page_indices):
+            if on_page:
+                on_page(idx, len(page_indices))
+            page = doc[page_idx]
+            text = page.get_text().strip()
+            if len(text) >= settings.TEXT_LAYER_MIN_CHARS:
+                parts.append(f"\n[Page {page_idx + 1}]\n{text}")
+                continue
+            rendered += 1
+            pix = page.get_pixmap(matrix=zoom_matrix)
+            parts.append(f"\n[Page {page_idx + 1}]")
+            parts.append(
+                types.Part.from_bytes(data=pix.tobytes("jpeg"), mime_type="image/jpeg")
+            )
 
-    client = genai.Client(api_key=api_key)
-    path = Path(file_path)
+        print(f"   📊 Text layer: {len(page_indices) - rendered} pages, rendered: {rendered} pages.")
+        return parts
+    finally:
+        doc.close()
+
+
+@dataclass
+class GenerationResult:
+    """Aggregated output of a streamed generate_content call."""
+
+    text: str
+    usage_metadata: Any = None
+
+
+@stage("generate")
+def _generate_content(
+    client: "genai.Client",
+    model: str,
+    contents: List[Any],
+    config: Dict[str, Any],
+    cancel_token: Optional[CancelToken] = None,
+) -> Any:
+    """Call Gemini, streaming the response when the call may need to be aborted.
+
+    Without a cancel token this is a plain generate_content call. With one, the
+    stream is consumed in a worker thread and this call returns (raising
+    AnalysisCancelled with the text received so far) as soon as the token is
+    cancelled, even before the first chunk has arrived. The worker closes the
+    HTTP stream at its next chunk and then exits.
+    """
+    if cancel_token is None:
+        return client.models.generate_content(
+            model=model, contents=contents, config=config
+        )
 
-    if not path.exists():
-        raise FileNotFoundError(f"File not found: {file_path}")
+    chunks: List[str] = []
+    outcome: Dict[str, Any] = {}
+    finished = threading.Event()
 
-    start_time = datetime.now()
-    print(f"\n⚡ Processing: {file_path}")
-    report(2, "starting")
+    def consume() -> None:
+        stream = None
+        try:
+            stream = client.models.generate_content_stream(
+                model=model, contents=contents, config=config
+            )
+            for chunk in stream:
+                if cancel_token.cancelled:
+                    return
+                if chunk.text:
+                    chunks.append(chunk.text)
+                if chunk.usage_metadata:
+                    outcome["usage"] = chunk.usage_metadata
+            outcome["done"] = True
+        except Exception as exc:
+            outcome["error"] = exc
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+            finished.set()
+
+    cancel_token.on_cancel(finished.set)
+    threading.Thread(target=in_context(consume), name="generate", daemon=True).start()
+    finished.wait()
+
+    if "error" in outcome:
+        raise outcome["error"]
+    if not outcome.get("done"):
+        metrics.incr("generation.aborted")
+        raise AnalysisCancelled("generate", cancel_token.reason, partial="".join(list(chunks)))
+    return GenerationResult(text="".join(chunks), usage_metadata=outcome.get("usage"))
+
+
+def _is_valid_extraction(response: Any, schema_name: str = "medical_ocr") -> bool:
+    """True if the response text parses as a MedicalOCR (hedging winner check)."""
+    try:
+        registry.validate_json(schema_name, response.text or "")
+        return True
+    except (ValidationError, ValueError):
+        return False
 
-    parts = []
 
-    # =========================================================================
-    # STRATEGY 1: Direct PDF Upload (File API)
-    # Best for: Speed, Token Efficiency, Text Accuracy
-    # =========================================================================
-    if path.suffix.lower() == ".pdf" and not selected_pages:
-        print(" 📄 Mode: Direct PDF Upload (File API)")
-        temp_path = None
+def _delete_remote_file(client: "genai.Client", name: Optional[str]) -> None:
+    """Best-effort removal of a File API upload."""
+    if not name:
+        return
+    try:
+        client.files.delete(name=name)
+        metrics.incr("files.remote_deleted")
+    except Exception as exc:
+        print(f"   ⚠️ Could not delete remote file {name}: {exc}")
+
+
+def _document_profile(path: Path) -> Dict[str, Any]:
+    """Cheap document descriptors to correlate strategy timings with."""
+    profile: Dict[str, Any] = {"type": path.suffix.lower().lstrip("."), "bytes": path.stat().st_size}
+    if profile["type"] == "pdf" and pymupdf_available():
         try:
-            report(12, "preparing pdf upload")
-            # --- FIX FOR ARABIC FILENAMES ---
-            # The API client fails if the local filename has non-ASCII characters.
-            # We create a temporary copy with a safe English name.
-            safe_filename = f"temp_upload_{int(time.time())}.pdf"
-            temp_path = Path(safe_filename)
-
-            # Read original bytes -> Write to safe temp file
-            temp_path.write_bytes(path.read_bytes())
-
-            # Upload the SAFE file
-            report(20, "uploading pdf")
+            with load_pymupdf().open(path) as doc:
+                profile["pages"] = len(doc)
+        except Exception:
+            pass
+    return profile
+
+
+def _stage_timing(start: float, status: str, **extra: Any) -> Dict[str, Any]:
+    """Per-strategy timing entry recorded in result["timing"]["strategies"]."""
+    return {"seconds": round(time.monotonic() - start, 3), "status": status, **extra}
+
+
+def _upload_pdf(
+    client: "genai.Client",
+    path: Path,
+    cancel_token: Optional[CancelToken] = None,
+    report: Optional[Callable[[int, str], None]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Any:
+    """Upload a PDF through the File API and wait until it is processed.
+
+    The remote file is deleted again if the upload is cancelled while the
+    File API is still processing it, or if polling would eat into the time
+    the deadline keeps back for generation (DeadlineExceeded).
+    """
+
+    def progress(percent: int, message: str) -> None:
+        if report:
+            report(percent, message)
+
+    def checkpoint(stage: str) -> None:
+        if cancel_token:
+            cancel_token.raise_if_cancelled(stage)
+
+    progress(12, "preparing pdf upload")
+    # --- FIX FOR ARABIC FILENAMES ---
+    # The API client fails if the local filename has non-ASCII characters.
+    # We create a temporary copy with a safe English name.
+    temp_dir = tempfile.mkdtemp(prefix="ocr_upload_")
+    try:
+        temp_path = Path(temp_dir) / f"temp_upload_{int(time.time())}.pdf"
+        shutil.copyfile(path, temp_path)
+
+        # Upload the SAFE file
+        checkpoint("upload")
+        progress(20, "uploading pdf")
+        with stage("upload"):
             myfile = client.files.upload(
                 file=temp_path,
                 config=types.UploadFileConfig(display_name="medical_document"),
             )
+    finally:
+        # Clean up temp file immediately (we don't need it anymore)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return _wait_until_processed(client, myfile, cancel_token, report, deadline)
+
 
-            # Clean up temp file immediately (we don't need it anymore)
-            if temp_path.exists():
-                temp_path.unlink()
+def _wait_until_processed(
+    client: "genai.Client",
+    myfile: Any,
+    cancel_token: Optional[CancelToken] = None,
+    report: Optional[Callable[[int, str], None]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Any:
+    """Poll an uploaded file until the File API has processed it (see _upload_pdf)."""
+    try:
+        if cancel_token:
+            cancel_token.raise_if_cancelled("upload")
 
-            # Poll for processing completion
-            poll_count = 0
+        # Poll for processing completion
+        poll_count = 0
+        with stage("poll"):
             while myfile.state == "PROCESSING":
                 print("   ⏳ Processing PDF...")
                 poll_count += 1
-                report(min(60, 30 + poll_count * 5), "processing pdf")
-                time.sleep(1)
-                myfile = client.files.get(name=myfile)
+                if report:
+                    report(min(60, 30 + poll_count * 5), "processing pdf")
+                interval = deadline.stage_budget(1) if deadline else 1
+                if interval <= 0:
+                    deadline.degrade("poll", "File API still processing, stopped waiting")
+                    raise DeadlineExceeded("poll")
+                if cancel_token:
+                    cancel_token.sleep(interval, "poll")
+                else:
+                    time.sleep(interval)
+                myfile = client.files.get(name=myfile.name)
+    except (AnalysisCancelled, DeadlineExceeded):
+        _delete_remote_file(client, myfile.name)
+        raise
+
+    if myfile.state == "FAILED":
+        raise ValueError(f"PDF processing failed: {myfile.error.message}")
+
+    return myfile
+
+
+def _upload_split_pdf(
+    client: "genai.Client",
+    path: Path,
+    groups: List[List[int]],
+    timings: Dict[str, Dict[str, Any]],
+    cancel_token: Optional[CancelToken] = None,
+    report: Optional[Callable[[int, str], None]] = None,
+    deadline: Optional[Deadline] = None,
+) -> List[List[Any]]:
+    """Upload a large PDF as page-range sub-PDFs, concurrently (see pdf_split).
+
+    Parts are built while earlier ones upload (LARGE_PDF_UPLOAD_CONCURRENCY at
+    a time) and are processed by the File API in parallel. Returns the
+    processed files of every page group, in page order. If any part fails or
+    the analysis is cancelled, every part uploaded so far is deleted.
+    """
+    upload_token = CancelToken()
+    if cancel_token:
+        cancel_token.on_cancel(lambda: upload_token.cancel(cancel_token.reason or "cancelled"))
+
+    def check() -> None:
+        upload_token.raise_if_cancelled("upload")
+
+    budget = MemoryBudget(settings.LARGE_PDF_MEMORY_MB * MB)
+    uploaded: List[str] = []
+    lock = threading.Lock()
+
+    def upload(part: SplitPart) -> Any:
+        try:
+            check()
+            with stage("upload"):
+                myfile = client.files.upload(
+                    file=io.BytesIO(part.data),
+                    config=types.UploadFileConfig(
+                        display_name=f"medical_document_{part.pages[0]}", mime_type="application/pdf"
+                    ),
+                )
+        finally:
+            budget.release(len(part.data))
+            # This frame and the executor hold the part until it is processed
+            part.data = b""
+        with lock:
+            uploaded.append(myfile.name)
+        try:
+            return _wait_until_processed(client, myfile, upload_token, None, deadline)
+        except (AnalysisCancelled, DeadlineExceeded):
+            with lock:  # already deleted while polling
+                uploaded.remove(myfile.name)
+            raise
+
+    stage_start = time.monotonic()
+    # (group, pages, bytes) only: the parts' data is dropped once uploaded
+    parts: List[Tuple[int, List[int], int]] = []
+    futures = []
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, settings.LARGE_PDF_UPLOAD_CONCURRENCY), thread_name_prefix="pdf-part"
+    )
+    try:
+        try:
+            for part in split_pdf(str(path), groups, budget, check):
+                parts.append((part.group, part.pages, len(part.data)))
+                future = executor.submit(in_context(upload), part)
+                # A failed part stops the split, it is raised below
+                future.add_done_callback(lambda f: f.exception() and upload_token.cancel("part failed"))
+                futures.append(future)
+        except AnalysisCancelled:
+            pass
+        files = [[] for _ in groups]
+        errors = []
+        for done_count, ((group, _, _), future) in enumerate(zip(parts, futures), start=1):
+            try:
+                files[group].append(future.result())
+            except Exception as exc:
+                errors.append(exc)
+            if report:
+                report(15 + int(done_count / len(futures) * 45), "uploading pdf parts")
+        if cancel_token:
+            cancel_token.raise_if_cancelled("upload")
+        if errors:
+            # Report the root cause, not the cancellations it triggered
+            raise next((e for e in errors if not isinstance(e, AnalysisCancelled)), errors[0])
+        upload_token.raise_if_cancelled("upload")
+    except BaseException:
+        upload_token.cancel("upload failed")
+        executor.shutdown(wait=True)
+        for name in uploaded:
+            _delete_remote_file(client, name)
+        raise
+    executor.shutdown(wait=False)
+
+    timings["split_upload"] = _stage_timing(
+        stage_start,
+        "used",
+        parts=len(parts),
+        megabytes=round(sum(size for _, _, size in parts) / MB, 1),
+        peak_megabytes=round(budget.peak / MB, 1),
+    )
+    print(
+        f"   📦 Uploaded {len(parts)} parts ({timings['split_upload']['megabytes']} MB, "
+        f"at most {timings['split_upload']['peak_megabytes']} MB in memory)"
+    )
+    return files
+
+
+def _race_pdf_inputs(
+    client: "genai.Client",
+    path: Path,
+    timings: Dict[str, Dict[str, Any]],
+    cancel_token: Optional[CancelToken] = None,
+    report: Optional[Callable[[int, str], None]] = None,
+    deadline: Optional[Deadline] = None,
+) -> tuple:
+    """Run File API upload and local page rendering concurrently.
+
+    Commits to whichever input is ready first and cancels the other one; if
+    one fails, the other result is used as soon as it is ready. Returns
+    (parts, strategy, uploaded_names) like _prepare_parts and fills `timings`.
+    """
+    upload_token, render_token = CancelToken(), CancelToken()
+    if cancel_token:
+        for token in (upload_token, render_token):
+            cancel_token.on_cancel(
+                lambda token=token: token.cancel(cancel_token.reason or "cancelled")
+            )
 
-            if myfile.state == "FAILED":
-                raise ValueError(f"PDF processing failed: {myfile.error.message}")
+    def on_page(idx: int, total: int) -> None:
+        render_token.raise_if_cancelled("render")
+        if report:
+            report(15 + int(((idx + 1) / total) * 45), "rendering pages")
+
+    start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-race")
+    upload_future = executor.submit(in_context(_upload_pdf), client, path, upload_token, None, deadline)
+    render_future = executor.submit(in_context(render_pdf_pages), str(path), None, None, on_page)
+    executor.shutdown(wait=False)
+
+    names = {upload_future: "upload", render_future: "render"}
+    tokens = {upload_future: upload_token, render_future: render_token}
+    pending = set(names)
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = names[future]
+            try:
+                value = future.result()
+            except AnalysisCancelled:
+                timings[name] = _stage_timing(start, "cancelled")
+                continue
+            except Exception as exc:
+                timings[name] = _stage_timing(start, "failed", error=str(exc))
+                continue
+
+            timings[name] = _stage_timing(start, "won")
+            metrics.incr(f"pdf_race.won.{name}")
+            for loser in pending:
+                timings[names[loser]] = _stage_timing(start, "lost")
+                tokens[loser].cancel("race lost")
+                if loser is upload_future:
+                    # Upload may still finish after losing: drop the remote copy
+                    loser.add_done_callback(
+                        lambda f: f.exception() is None
+                        and _delete_remote_file(client, f.result().name)
+                    )
+
+            if name == "upload":
+                return [value], "upload", [value.name]
+            return list(value), "images", []
+
+    if cancel_token:
+        cancel_token.raise_if_cancelled("race")
+    raise RuntimeError("Both direct PDF upload and page rendering failed.")
+
+
+def _prepare_parts(
+    client: "genai.Client",
+    path: Path,
+    strategy: str,
+    timings: Dict[str, Dict[str, Any]],
+    selected_pages: Optional[List[int]] = None,
+    cancel_token: Optional[CancelToken] = None,
+    report: Optional[Callable[[int, str], None]] = None,
+    deadline: Optional[Deadline] = None,
+) -> tuple:
+    """Turn one document into request parts (without the prompt).
+
+    Returns (parts, used_strategy, uploaded_names). `used_strategy` is
+    "upload" when the parts reference File API uploads, "text" for the PDF
+    text layer, else "images". "auto" must be resolved by the caller (see
+    _estimate_strategy); "chunked" is split by the caller and renders images here.
+    A large PDF (pdf_split.is_large_pdf) is uploaded as concurrent page-range
+    parts, which also works with `selected_pages`.
+    """
+
+    def progress(percent: int, message: str) -> None:
+        if report:
+            report(percent, message)
+
+    def checkpoint(stage: str) -> None:
+        if cancel_token:
+            cancel_token.raise_if_cancelled(stage)
+
+    is_pdf = path.suffix.lower() == ".pdf"
 
-            parts = [myfile, COMPACT_PROMPT]
+    # =========================================================================
+    # STRATEGY 1: Direct PDF Upload (File API)
+    # Best for: Speed, Token Efficiency, Text Accuracy
+    # =========================================================================
+    if is_pdf and strategy == "upload" and is_large_pdf(path):
+        print(f" 📦 Mode: Split PDF Upload (File API, parts of ~{settings.LARGE_PDF_PART_MB} MB)")
+        stage_start = time.monotonic()
+        try:
+            with load_pymupdf().open(path) as doc:
+                pages = [i + 1 for i in _page_indices(len(doc), selected_pages)]
+            files = _upload_split_pdf(client, path, [pages], timings, cancel_token, report, deadline)[0]
+            timings["upload"] = _stage_timing(stage_start, "used", parts=len(files))
+            return files, "upload", [f.name for f in files]
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            timings["upload"] = _stage_timing(stage_start, "failed", error=str(e))
+            print(f"   ⚠️ Split upload failed ({e}), falling back to image conversion...")
 
+    elif is_pdf and not selected_pages and strategy == "upload":
+        print(" 📄 Mode: Direct PDF Upload (File API)")
+        stage_start = time.monotonic()
+        try:
+            myfile = _upload_pdf(client, path, cancel_token, report, deadline)
+            timings["upload"] = _stage_timing(stage_start, "used")
+            return [myfile], "upload", [myfile.name]
+        except AnalysisCancelled:
+            raise
         except Exception as e:
-            # Ensure temp cleanup in case of error
-            if temp_path and temp_path.exists():
-                temp_path.unlink()
+            timings["upload"] = _stage_timing(stage_start, "failed", error=str(e))
+            print(f"   ⚠️ Direct upload failed ({e}), falling back to image conversion...")
 
-            print(
-                f"   ⚠️ Direct upload failed ({e}), falling back to image conversion..."
-            )
-            parts = []  # Reset to trigger fallback
+    # =========================================================================
+    # STRATEGY 1b: Race upload against local rendering
+    # Best for: Latency when File API processing time is unpredictable
+    # =========================================================================
+    elif is_pdf and not selected_pages and strategy == "race":
+        print(" 🏁 Mode: Race (File API upload vs. page rendering)")
+        return _race_pdf_inputs(client, path, timings, cancel_token, report, deadline)
+
+    # =========================================================================
+    # STRATEGY 1c: Text layer (scanned pages rendered)
+    # Best for: Digital PDFs, far fewer tokens than page images
+    # =========================================================================
+    elif is_pdf and strategy == "text":
+        print(f" 📝 Mode: Text Layer (Pages: {selected_pages if selected_pages else 'All'})")
+
+        def on_text_page(idx: int, total: int) -> None:
+            checkpoint("render")
+            progress(15 + int(((idx + 1) / total) * 45), "reading text layer")
+
+        stage_start = time.monotonic()
+        text_parts = extract_text_parts(str(path), selected_pages=selected_pages, on_page=on_text_page)
+        timings["text"] = _stage_timing(stage_start, "used")
+        return text_parts, "text", []
 
     # =========================================================================
     # STRATEGY 2: Fallback / Image Conversion
-    # Used if: Not a PDF, specific pages requested, or PDF upload failed
+    # Used if: Not a PDF, specific pages requested, "images" strategy,
+    # or PDF upload failed
     # =========================================================================
-    if not parts:
-        print(
-            f" 🖼️ Mode: Image Analysis (Pages: {selected_pages if selected_pages else 'All'})"
-        )
+    checkpoint("render")
+    print(f" 🖼️ Mode: Image Analysis (Pages: {selected_pages if selected_pages else 'All'})")
 
-        if path.suffix.lower() == ".pdf":
-            if fitz is None:
-                raise ImportError(
-                    "PyMuPDF (fitz) is required for page selection or fallback. Install with: pip install pymupdf"
-                )
+    if is_pdf:
 
-            # Open PDF with PyMuPDF
-            doc = fitz.open(file_path)
-            total_pages_in_doc = len(doc)
+        def on_page(idx: int, total: int) -> None:
+            checkpoint("render")
+            progress(15 + int(((idx + 1) / total) * 45), "rendering pages")
 
-            # Determine which pages to process
-            if selected_pages:
-                page_indices = [
-                    p - 1 for p in selected_pages if 1 <= p <= total_pages_in_doc
-                ]
-            else:
-                page_indices = list(range(total_pages_in_doc))
-
-            if not page_indices:
-                doc.close()
-                raise ValueError("No valid pages selected.")
-
-            # Build request parts
-            parts = [COMPACT_PROMPT]
-            total_pages = len(page_indices)
-
-            # Render pages to images using PyMuPDF (faster than Poppler)
-            # zoom=2.0 gives ~144 DPI (72 * 2), good balance of quality/speed
-            zoom_matrix = fitz.Matrix(2.0, 2.0)
-
-            for idx, page_idx in enumerate(page_indices):
-                report(15 + int(((idx + 1) / total_pages) * 45), "rendering pages")
-                page = doc[page_idx]
-                pix = page.get_pixmap(matrix=zoom_matrix)
-                img_bytes = pix.tobytes("jpeg")
-                parts.append(f"\n[Page {page_idx + 1}]")
-                parts.append(
-                    types.Part.from_bytes(data=img_bytes, mime_type="image/jpeg")
-                )
+        stage_start = time.monotonic()
+        page_parts = render_pdf_pages(str(path), selected_pages=selected_pages, on_page=on_page)
+        timings["render"] = _stage_timing(stage_start, "used")
+        print(f"   📊 Processed {len(page_parts) // 2} page images.")
+        return page_parts, "images", []
 
-            doc.close()
-            print(f"   📊 Processed {total_pages} page images.")
+    # Single Image File (JPG/PNG)
+    progress(20, "preparing image")
+    img_bytes = path.read_bytes()
+    mime_type = "image/png" if path.suffix.lower() == ".png" else "image/jpeg"
+    return [types.Part.from_bytes(data=img_bytes, mime_type=mime_type)], "images", []
 
-        else:
-            # Single Image File (JPG/PNG)
-            report(20, "preparing image")
-            with open(file_path, "rb") as f:
-                img_bytes = f.read()
-            mime_type = "image/png" if path.suffix.lower() == ".png" else "image/jpeg"
-            parts = [
-                COMPACT_PROMPT,
-                types.Part.from_bytes(data=img_bytes, mime_type=mime_type),
-            ]
 
-    # =========================================================================
-    # EXECUTE API CALL
-    # =========================================================================
-    print(f" 🚀 Sending request to {model}...")
-    report(70, "analyzing document")
+def _inspect_document(path: Path, selected_pages: Optional[List[int]] = None) -> Optional[DocumentProfile]:
+    """estimator.inspect_document, None if the document cannot be opened locally."""
+    try:
+        return inspect_document(str(path), selected_pages)
+    except Exception as exc:
+        metrics.incr("estimator.inspect_failed")
+        print(f"   ⚠️ Could not inspect {path.name}: {exc}")
+        return None
+
+
+def _estimate_strategy(
+    path: Path,
+    model: str,
+    selected_pages: Optional[List[int]] = None,
+    allow_chunked: bool = True,
+) -> Dict[str, Any]:
+    """Pre-flight estimate for one document; "recommended" is the strategy to use.
+
+    A document that cannot be inspected is estimated from its type and size.
+    """
+    profile = _inspect_document(path, selected_pages)
+    if profile is None:
+        profile = profile_from_metadata(path.suffix, path.stat().st_size)
+    result = estimate(
+        profile,
+        model,
+        allow_upload=not selected_pages,
+        allow_chunked=allow_chunked,
+    )
+    print(f" 🧮 Estimator picked strategy: {result['recommended']}")
+    return result
+
+
+def _generation_config(schema_name: str = "medical_ocr") -> Dict[str, Any]:
+    """Structured-output config of a MedicalOCR request (a new dict each call)."""
+    return {
+        "response_mime_type": "application/json",
+        # Precomputed MedicalOCR.model_json_schema() (see schema_registry)
+        "response_json_schema": registry.schema(schema_name),
+        "temperature": 0.0,
+    }
+
 
-    max_retries = 3
-    base_delay = 2
+def prepare_request(
+    client: "genai.Client",
+    file_path: str,
+    strategy: str = "upload",
+    selected_pages: Optional[List[int]] = None,
+) -> tuple:
+    """Contents and config of one MedicalOCR request, for callers that send it
+    themselves (see batch_prediction).
+
+    Returns (contents, config, used_strategy, uploaded_names); the caller
+    deletes the uploads once the request is answered. Only strategies that
+    make a single request are supported: "upload", "images" and "text".
+    """
+    if strategy not in ("upload", "images", "text"):
+        raise ValueError(f"Strategy {strategy} cannot be sent as a single request")
+    path = Path(file_path)
+    parts, used_strategy, uploaded_names = _prepare_parts(client, path, strategy, {}, selected_pages)
+    # The prompt follows an uploaded file and precedes page images
+    contents = [*parts, COMPACT_PROMPT] if used_strategy == "upload" else [COMPACT_PROMPT, *parts]
+    return contents, _generation_config(), used_strategy, uploaded_names
+
+
+def _generate_with_retries(
+    client: "genai.Client",
+    model: str,
+    parts: List[Any],
+    prompt_first: bool = True,
+    extra_instructions: str = "",
+    cancel_token: Optional[CancelToken] = None,
+    use_hedging: bool = False,
+    max_retries: int = 3,
+    base_delay: float = 2,
+    deadline: Optional[Deadline] = None,
+    schema_name: str = "medical_ocr",
+) -> Any:
+    """Structured MedicalOCR generation with 429/503 backoff (and optional hedging).
+
+    COMPACT_PROMPT (plus `extra_instructions`) is placed before or after
+    `parts`, unless a context cache entry for the prompt and schema is
+    available, in which case only `extra_instructions` is sent inline.
+    Backoff delays are shortened to what the deadline leaves over.
+    `schema_name` selects a registry schema other than the full MedicalOCR
+    (see SchemaRegistry.subset); the context cache only holds the full one.
+    """
     response = None
+    cache_name = prompt_cache.get(client, model) if schema_name == "medical_ocr" else None
 
     for attempt in range(max_retries):
+        generation_config = _generation_config(schema_name)
+        if cache_name:
+            generation_config["cached_content"] = cache_name
+            contents = [extra_instructions.strip(), *parts] if extra_instructions else parts
+        else:
+            prompt = COMPACT_PROMPT + extra_instructions
+            contents = [prompt, *parts] if prompt_first else [*parts, prompt]
+
+        def generate_once(token: Optional[CancelToken]) -> Any:
+            # Fail fast while Gemini is known to be down for this model
+            with breakers.get(model).call():
+                acquire_gemini_budget(model, token)
+                return _generate_content(
+                    client, model, contents, config=generation_config, cancel_token=token
+                )
+
         try:
-            response = client.models.generate_content(
-                model=model,
-                contents=parts,
-                config={
-                    "response_mime_type": "application/json",
-                    # Ensure you use .model_json_schema() for Pydantic classes
-                    "response_json_schema": MedicalOCR.model_json_schema(),
-                    "temperature": 0.0,
-                },
-            )
+            if use_hedging:
+                response = run_hedged(
+                    model,
+                    generate_once,
+                    lambda candidate: _is_valid_extraction(candidate, schema_name),
+                    cancel_token=cancel_token,
+                )
+            else:
+                response = generate_once(cancel_token)
             break
+        except (AnalysisCancelled, CircuitOpen):
+            raise
         except Exception as exc:
-            if "503" in str(exc) or "429" in str(exc):
+            if cache_name and is_cache_error(exc):
+                print("   ⚠️ Context cache rejected, retrying with inline prompt...")
+                prompt_cache.invalidate(model)
+                cache_name = None
+            elif "503" in str(exc) or "429" in str(exc):
                 delay = base_delay * (2**attempt)
+                if deadline and deadline.stage_budget(delay) < delay:
+                    shortened = deadline.stage_budget(delay)
+                    deadline.degrade("retry", f"backoff {delay}s -> {shortened:.1f}s")
+                    delay = shortened
                 print(f"   ⏳ Rate limited/Busy, retrying in {delay}s...")
-                time.sleep(delay)
+                if cancel_token:
+                    cancel_token.sleep(delay, "retry")
+                else:
+                    time.sleep(delay)
             else:
                 raise exc
 
     if not response:
         raise RuntimeError("Failed to get response from Gemini after retries.")
+    return response
+
+
+def _analyze_page_groups(
+    client: "genai.Client",
+    path: Path,
+    model: str,
+    groups: List[PageGroup],
+    timings: Dict[str, Dict[str, Any]],
+    cancel_token: Optional[CancelToken] = None,
+    use_hedging: bool = False,
+    report: Optional[Callable[[int, str], None]] = None,
+    extra_instructions: str = "",
+    deadline: Optional[Deadline] = None,
+    part_strategy: str = "chunked",
+    label: str = "chunk",
+    timing_key: str = "chunked",
+    group_parts: Optional[List[List[Any]]] = None,
+) -> GenerationResult:
+    """Analyze page groups of a PDF concurrently and merge the extractions.
+
+    Each group is prepared with `part_strategy` (or sent as its already
+    uploaded `group_parts`) as its own request (PDF_CHUNK_CONCURRENCY at a
+    time); a group with `sections` only asks for those sections. The merged extraction is returned as a GenerationResult
+    with summed token usage, so it goes through the same validation as a
+    single response. The first failing group cancels the others. If the
+    deadline passes, the groups finished so far are merged into the partial
+    text of the raised AnalysisCancelled.
+    """
+    group_token = CancelToken()
+    if cancel_token:
+        cancel_token.on_cancel(lambda: group_token.cancel(cancel_token.reason or "cancelled"))
+
+    def run_group(idx: int, group: PageGroup) -> tuple:
+        group_start = time.monotonic()
+        pages = group.pages
+        schema_name = registry.subset(group.sections) if group.sections else "medical_ocr"
+        if group_parts:
+            parts = group_parts[idx]
+        else:
+            parts, _, _ = _prepare_parts(client, path, part_strategy, {}, pages, group_token)
+        response = _generate_with_retries(
+            client,
+            model,
+            parts,
+            # The prompt follows uploaded files and precedes page images
+            prompt_first=not group_parts,
+            extra_instructions=extra_instructions + section_instructions(group.sections),
+            cancel_token=group_token,
+            use_hedging=use_hedging,
+            deadline=deadline,
+            schema_name=schema_name,
+        )
+        try:
+            with stage("validate"):
+                extraction = registry.validate_json(schema_name, response.text).model_dump(mode="json")
+        except ValidationError as ve:
+            raise ValueError(f"Invalid response for pages {pages[0]}-{pages[-1]}: {ve}")
+        extra = {"sections": list(group.sections)} if group.sections else {}
+        return extraction, response.usage_metadata, _stage_timing(group_start, "used", pages=pages, **extra)
+
+    stage_start = time.monotonic()
+    results: List[Any] = [None] * len(groups)
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(settings.PDF_CHUNK_CONCURRENCY, len(groups))),
+        thread_name_prefix=label,
+    ) as executor:
+        futures = {executor.submit(in_context(run_group), idx, group): idx for idx, group in enumerate(groups)}
+        errors = []
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as exc:
+                errors.append(exc)
+                group_token.cancel(f"{label} failed")
+            if report:
+                report(15 + int(done_count / len(groups) * 70), f"analyzing page {label}s")
+
+    if cancel_token and cancel_token.reason == DEADLINE_REASON and any(results):
+        for idx, group in enumerate(groups, start=1):
+            if results[idx - 1] is None:
+                timings[f"{label}_{idx}"] = {"status": "deadline", "pages": group.pages}
+        merged = merge_extractions(result[0] for result in results if result)
+        raise AnalysisCancelled("generate", DEADLINE_REASON, partial=json.dumps(merged))
+    if cancel_token:
+        cancel_token.raise_if_cancelled("generate")
+    if errors:
+        # Report the root cause, not the cancellations it triggered
+        raise next((e for e in errors if not isinstance(e, AnalysisCancelled)), errors[0])
+
+    for idx, (_, _, group_timing) in enumerate(results, start=1):
+        timings[f"{label}_{idx}"] = group_timing
+
+    def total(attr: str) -> int:
+        return sum(getattr(usage, attr, 0) or 0 for _, usage, _ in results if usage)
+
+    merged = merge_extractions(extraction for extraction, _, _ in results)
+    timings[timing_key] = _stage_timing(stage_start, "used", **{f"{label}s": len(groups)})
+    return GenerationResult(
+        text=json.dumps(merged, ensure_ascii=False),
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=total("prompt_token_count"),
+            candidates_token_count=total("candidates_token_count"),
+            cached_content_token_count=total("cached_content_token_count"),
+        ),
+    )
 
+
+def _analyze_chunks(
+    client: "genai.Client",
+    path: Path,
+    model: str,
+    pages: List[int],
+    timings: Dict[str, Dict[str, Any]],
+    cancel_token: Optional[CancelToken] = None,
+    use_hedging: bool = False,
+    report: Optional[Callable[[int, str], None]] = None,
+    extra_instructions: str = "",
+    deadline: Optional[Deadline] = None,
+    sections: Optional[Tuple[str, ...]] = None,
+) -> GenerationResult:
+    """Analyze page chunks of a long PDF concurrently and merge the extractions.
+
+    Each chunk of PDF_CHUNK_PAGES pages is rendered and sent as its own
+    request (see _analyze_page_groups), asking for `sections` only if given.
+    The chunks of a large PDF are uploaded as sub-PDFs instead (see
+    _upload_split_pdf), which skips rendering; they are deleted again if the
+    analysis is cancelled.
+    """
+    size = max(1, settings.PDF_CHUNK_PAGES)
+    chunks = [PageGroup(pages[i : i + size], sections) for i in range(0, len(pages), size)]
+    print(f" 🧩 Mode: Chunked ({len(chunks)} chunks of up to {size} pages)")
+    group_parts = None
+    if is_large_pdf(path):
+        group_parts = _upload_split_pdf(
+            client, path, [chunk.pages for chunk in chunks], timings, cancel_token, report, deadline
+        )
+    try:
+        return _analyze_page_groups(
+            client, path, model, chunks, timings, cancel_token, use_hedging, report,
+            extra_instructions, deadline, group_parts=group_parts,
+        )
+    except AnalysisCancelled:
+        for name in (f.name for files in group_parts or [] for f in files):
+            _delete_remote_file(client, name)
+        raise
+
+
+def _analyze_sections(
+    client: "genai.Client",
+    path: Path,
+    model: str,
+    selected_pages: Optional[List[int]],
+    timings: Dict[str, Dict[str, Any]],
+    cancel_token: Optional[CancelToken] = None,
+    use_hedging: bool = False,
+    report: Optional[Callable[[int, str], None]] = None,
+    core_sections_only: bool = False,
+    deadline: Optional[Deadline] = None,
+    sections: Optional[Tuple[str, ...]] = None,
+) -> GenerationResult:
+    """Classify pages by section and extract each group with a focused schema.
+
+    Pages are sent as text where the text layer is usable (scans are
+    rendered). Groups are restricted to `sections` if given. See page_sections.
+    """
+    if core_sections_only:
+        sections = tuple(s for s in sections or CORE_SECTIONS if s in CORE_SECTIONS) or CORE_SECTIONS
+    stage_start = time.monotonic()
+    with stage("classify"):
+        plan = plan_sections(str(path), selected_pages, only=sections)
+    timings["classify"] = _stage_timing(stage_start, "used", **plan.summary())
+    print(f" 🗂️ Mode: Sections ({len(plan.groups)} page groups)")
+    for group in plan.groups:
+        print(f"   • {group.describe()}")
+    return _analyze_page_groups(
+        client, path, model, plan.groups, timings, cancel_token, use_hedging, report,
+        deadline=deadline, part_strategy="text", label="section", timing_key="sections",
+    )
+
+
+def _build_result(
+    response: Any,
+    model: str,
+    start_time: datetime,
+    report: Callable[[int, str], None],
+    schema_name: str = "medical_ocr",
+    **fields: Any,
+) -> Dict[str, Any]:
+    """Validate the Gemini response and assemble the standard result dict.
+
+    A response for a section subset (`schema_name`, see SchemaRegistry.subset)
+    is returned in the full MedicalOCR shape, other sections left empty.
+    """
     total_time = (datetime.now() - start_time).total_seconds()
     print(f" ✓ Done ({total_time:.1f}s)")
 
@@ -273,12 +1043,16 @@ def analyze_document_streaming(
     usage = response.usage_metadata
     prompt_tokens = usage.prompt_token_count if usage else 0
     output_tokens = usage.candidates_token_count if usage else 0
+    cached_tokens = (usage.cached_content_token_count or 0) if usage else 0
 
     try:
         # Validate response against Pydantic schema
         report(90, "parsing response")
-        model_obj = MedicalOCR.model_validate_json(response.text)
-        extraction = model_obj.model_dump()
+        with stage("validate"):
+            model_obj = registry.validate_json(schema_name, response.text)
+            extraction = model_obj.model_dump(mode="json")
+            if schema_name != "medical_ocr":
+                extraction = merge_extractions([extraction])
         print(" ✅ JSON Schema Validation Passed")
     except ValidationError as ve:
         print(f" ⚠️ Validation Error: {ve}")
@@ -286,20 +1060,440 @@ def analyze_document_streaming(
 
     report(100, "done")
 
+    timing = fields.pop("timing", {})
     return {
         "success": True,
-        "file": str(file_path),
+        **fields,
         "model": model,
         "extraction": extraction,
         "timing": {
             "total_seconds": total_time,
             "tokens_per_second": output_tokens / total_time if total_time > 0 else 0,
+            **timing,
+        },
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "cached_tokens": cached_tokens,
         },
-        "usage": {"prompt_tokens": prompt_tokens, "output_tokens": output_tokens},
         "timestamp": datetime.now().isoformat(),
     }
 
 
+def _progress_reporter(
+    progress_cb: Optional[Callable[[int, str], None]],
+) -> Callable[[int, str], None]:
+    def report(percent: int, message: str) -> None:
+        if progress_cb:
+            progress_cb(max(0, min(100, percent)), message)
+
+    return report
+
+
+def _on_cancelled(
+    client: "genai.Client", cancelled: AnalysisCancelled, uploaded_names: List[str]
+) -> None:
+    """Record a cancellation and drop remote uploads that will never be used."""
+    print(f" 🛑 {cancelled}")
+    metrics.incr("analysis.cancelled")
+    metrics.incr(f"analysis.cancelled.stage.{cancelled.stage}")
+    for name in uploaded_names:
+        _delete_remote_file(client, name)
+
+
+def _resolve_strategy(strategy: Optional[str]) -> str:
+    strategy = strategy or settings.PDF_STRATEGY
+    if strategy not in PDF_STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}. Allowed: {', '.join(PDF_STRATEGIES)}")
+    return strategy
+
+
+@lru_cache(maxsize=8)
+def _client_for_key(api_key: str) -> "genai.Client":
+    # Clients hold connection pools: build once per key and reuse across requests
+    return genai.Client(api_key=api_key)
+
+
+def _make_client(api_key: Optional[str]) -> "genai.Client":
+    api_key = api_key or GEMINI_API_KEY
+    if not api_key:
+        raise ValueError("Gemini API key not configured. Set GEMINI_API_KEY env var.")
+    return _client_for_key(api_key)
+
+
+def _deadline_token(
+    cancel_token: Optional[CancelToken], deadline: Deadline
+) -> tuple:
+    """Work token cancelled by the caller's token or, with DEADLINE_REASON, by the deadline.
+
+    Returns (token, timer); the timer must be cancelled once the work is done.
+    """
+    if not deadline.enabled:
+        return cancel_token, None
+    work_token = CancelToken()
+    if cancel_token:
+        cancel_token.on_cancel(lambda: work_token.cancel(cancel_token.reason or "cancelled"))
+    return work_token, deadline.arm(work_token)
+
+
+def _partial_result(
+    cancelled: AnalysisCancelled,
+    model: str,
+    start_time: datetime,
+    report: Callable[[int, str], None],
+    deadline: Deadline,
+    **fields: Any,
+) -> Dict[str, Any]:
+    """Result flagged "partial" from whatever was generated before the deadline."""
+    total_time = (datetime.now() - start_time).total_seconds()
+    deadline.degrade("expired", f"during {cancelled.stage}", drops_content=True)
+    metrics.incr("deadline.partial")
+    print(f" ⏱️ Deadline reached after {total_time:.1f}s, returning partial result")
+    report(100, "deadline reached")
+
+    timing = fields.pop("timing", {})
+    return {
+        "success": True,
+        **fields,
+        "model": model,
+        "extraction": salvage_extraction(cancelled.partial),
+        "partial": True,
+        "deadline": deadline.snapshot(),
+        "timing": {"total_seconds": total_time, **timing},
+        "usage": None,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def analyze_document_streaming(
+    file_path: str,
+    api_key: Optional[str] = None,
+    model: str = "gemini-2.5-flash-lite",
+    selected_pages: Optional[List[int]] = None,
+    progress_cb: Optional[Callable[[int, str], None]] = None,
+    cancel_token: Optional[CancelToken] = None,
+    hedge: Optional[bool] = None,
+    strategy: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    sections: Optional[Tuple[str, ...]] = None,
+    client: Optional["genai.Client"] = None,
+) -> Dict[str, Any]:
+    """Analyze a medical document using Gemini 2.0 Flash with robust PDF handling.
+
+    If `cancel_token` is given, it is checked between stages, while waiting
+    for the File API and between rendered pages. On cancellation the uploaded
+    remote file and local temp files are removed and AnalysisCancelled is raised.
+
+    `hedge` enables hedged generation calls (defaults to HEDGE_ENABLED).
+
+    `strategy` selects how PDFs are sent (defaults to PDF_STRATEGY):
+    "upload" tries the File API first and renders pages only if that fails,
+    "images" always renders pages, "race" runs both concurrently and
+    uses whichever is ready first, "text" sends the PDF text layer (rendering
+    only scanned pages), "chunked" analyzes page chunks concurrently and
+    merges them, "sections" classifies pages locally and extracts each group
+    of pages with only the sections it contains (see page_sections), and
+    "auto" lets the pre-flight estimator choose.
+
+    With a `deadline`, the request is degraded up front if its estimate does
+    not fit (see plan_for_deadline), File API polling and retry backoff are
+    capped, and when the deadline passes a result flagged "partial" is
+    returned instead of raising.
+
+    `sections` restricts the extraction to these MedicalOCR sections (a
+    smaller response schema); the result keeps the full shape. `client`
+    replaces the Gen AI client built from `api_key` (e.g. a recorded client
+    for offline evaluation, see evaluation.py).
+    """
+    use_hedging = settings.HEDGE_ENABLED if hedge is None else hedge
+    strategy = _resolve_strategy(strategy)
+    report = _progress_reporter(progress_cb)
+    deadline = deadline or Deadline()
+    schema_name = "medical_ocr"
+    if sections:
+        unknown = set(sections) - set(SECTION_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}. Allowed: {', '.join(SECTION_TYPES)}")
+        sections = tuple(s for s in SECTION_TYPES if s in sections)
+        schema_name = registry.subset(sections)
+
+    # 1. Setup Client
+    client = client or _make_client(api_key)
+    path = Path(file_path)
+
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    start_time = datetime.now()
+    print(f"\n⚡ Processing: {file_path}")
+    report(2, "starting")
+
+    work_token, timer = _deadline_token(cancel_token, deadline)
+
+    def checkpoint(stage: str) -> None:
+        if work_token:
+            work_token.raise_if_cancelled(stage)
+
+    uploaded_names: List[str] = []
+    strategy_timings: Dict[str, Dict[str, Any]] = {}
+    extra: Dict[str, Any] = {}
+    extra_instructions = ""
+    is_pdf = path.suffix.lower() == ".pdf"
+    used_strategy = strategy
+
+    try:
+        checkpoint("start")
+        # A document that cannot be inspected is analyzed without a plan
+        profile = _inspect_document(path, selected_pages) if deadline.enabled else None
+        if profile is not None:
+            plan = plan_for_deadline(profile, model, strategy, selected_pages, deadline)
+            model, strategy, selected_pages = plan.model, plan.strategy, plan.selected_pages
+            if plan.core_sections_only:
+                extra_instructions = CORE_SECTIONS_INSTRUCTIONS
+        if strategy == "auto":
+            extra["estimate"] = _estimate_strategy(path, model, selected_pages)
+            strategy = extra["estimate"]["recommended"]
+        used_strategy = strategy
+
+        pages: List[int] = []
+        if is_pdf and strategy == "chunked":
+            with load_pymupdf().open(path) as doc:
+                pages = [i + 1 for i in _page_indices(len(doc), selected_pages)]
+
+        if is_pdf and strategy == "sections":
+            response = _analyze_sections(
+                client,
+                path,
+                model,
+                selected_pages,
+                strategy_timings,
+                work_token,
+                use_hedging,
+                report,
+                core_sections_only=extra_instructions == CORE_SECTIONS_INSTRUCTIONS,
+                deadline=deadline,
+                sections=sections,
+            )
+        elif len(pages) > settings.PDF_CHUNK_PAGES:
+            used_strategy = "chunked"
+            response = _analyze_chunks(
+                client,
+                path,
+                model,
+                pages,
+                strategy_timings,
+                work_token,
+                use_hedging,
+                report,
+                extra_instructions,
+                deadline,
+                sections,
+            )
+        else:
+            parts, used_strategy, part_names = _prepare_parts(
+                client,
+                path,
+                strategy,
+                strategy_timings,
+                selected_pages,
+                work_token,
+                report,
+                deadline,
+            )
+            uploaded_names.extend(part_names)
+
+            # =================================================================
+            # EXECUTE API CALL
+            # =================================================================
+            checkpoint("generate")
+            print(f" 🚀 Sending request to {model}...")
+            report(70, "analyzing document")
+            response = _generate_with_retries(
+                client,
+                model,
+                parts,
+                # The prompt follows an uploaded file and precedes page images
+                prompt_first=used_strategy != "upload",
+                extra_instructions=extra_instructions + section_instructions(sections),
+                cancel_token=work_token,
+                use_hedging=use_hedging,
+                deadline=deadline,
+                schema_name=schema_name,
+            )
+        checkpoint("parse")
+
+    except AnalysisCancelled as cancelled:
+        if cancelled.reason == DEADLINE_REASON and not (cancel_token and cancel_token.cancelled):
+            for name in uploaded_names:
+                _delete_remote_file(client, name)
+            return _partial_result(
+                cancelled,
+                model,
+                start_time,
+                report,
+                deadline,
+                file=str(file_path),
+                strategy=used_strategy,
+                document=_document_profile(path),
+                timing={"strategies": strategy_timings},
+            )
+        _on_cancelled(client, cancelled, uploaded_names)
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+
+    if deadline.enabled:
+        extra["partial"] = deadline.dropped_content
+        extra["deadline"] = deadline.snapshot()
+
+    return _build_result(
+        response,
+        model,
+        start_time,
+        report,
+        # Chunks and section groups are merged into the full shape already
+        schema_name=schema_name if used_strategy not in ("chunked", "sections") else "medical_ocr",
+        file=str(file_path),
+        strategy=used_strategy,
+        document=_document_profile(path),
+        timing={"strategies": strategy_timings},
+        **extra,
+    )
+
+
+def analyze_bundle(
+    file_paths: List[str],
+    api_key: Optional[str] = None,
+    model: str = "gemini-2.5-flash-lite",
+    progress_cb: Optional[Callable[[int, str], None]] = None,
+    cancel_token: Optional[CancelToken] = None,
+    hedge: Optional[bool] = None,
+    strategy: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    client: Optional["genai.Client"] = None,
+) -> Dict[str, Any]:
+    """Analyze several documents of ONE patient in a single Gemini call.
+
+    Every file is prepared like a standalone document (PDFs concurrently),
+    then all parts are sent in one request behind per-file markers. The prompt
+    and schema are paid for once and the model returns one merged MedicalOCR.
+
+    A `deadline` caps polling and retry backoff and yields a partial result
+    like analyze_document_streaming, but does not change model or pages.
+    `client` replaces the Gen AI client built from `api_key`, as there.
+    """
+    if not file_paths:
+        raise ValueError("A bundle needs at least one file.")
+
+    use_hedging = settings.HEDGE_ENABLED if hedge is None else hedge
+    strategy = _resolve_strategy(strategy)
+    report = _progress_reporter(progress_cb)
+    deadline = deadline or Deadline()
+
+    client = client or _make_client(api_key)
+    paths = [Path(p) for p in file_paths]
+    for path in paths:
+        if not path.exists():
+            raise FileNotFoundError(f"File not found: {path}")
+
+    start_time = datetime.now()
+    print(f"\n⚡ Processing bundle of {len(paths)} files")
+    report(2, "starting")
+
+    uploaded_names: List[str] = []
+    file_timings: List[Dict[str, Dict[str, Any]]] = [{} for _ in paths]
+    prepared: List[Any] = [None] * len(paths)
+    work_token, timer = _deadline_token(cancel_token, deadline)
+
+    def prepare(idx: int) -> tuple:
+        file_strategy = strategy
+        if strategy == "auto":
+            # One request for the whole bundle: never split a file into chunks
+            file_strategy = _estimate_strategy(paths[idx], model, allow_chunked=False)["recommended"]
+        return _prepare_parts(
+            client, paths[idx], file_strategy, file_timings[idx], None, work_token, None, deadline
+        )
+
+    try:
+        if work_token:
+            work_token.raise_if_cancelled("start")
+
+        report(10, "preparing files")
+        with ThreadPoolExecutor(
+            max_workers=min(4, len(paths)), thread_name_prefix="bundle"
+        ) as executor:
+            futures = {executor.submit(in_context(prepare), idx): idx for idx in range(len(paths))}
+            errors = []
+            for done_count, future in enumerate(as_completed(futures), start=1):
+                idx = futures[future]
+                try:
+                    prepared[idx] = future.result()
+                    uploaded_names.extend(prepared[idx][2])
+                except Exception as exc:
+                    errors.append(exc)
+                report(10 + int(done_count / len(paths) * 50), "preparing files")
+            if errors:
+                raise errors[0]
+
+        contents: List[Any] = []
+        for idx, (path, (parts, _, _)) in enumerate(zip(paths, prepared), start=1):
+            contents.append(f"\n[File {idx}/{len(paths)}: {path.name}]")
+            contents.extend(parts)
+
+        print(f" 🚀 Sending bundle request to {model}...")
+        report(70, "analyzing documents")
+        response = _generate_with_retries(
+            client,
+            model,
+            contents,
+            extra_instructions=BUNDLE_INSTRUCTIONS,
+            cancel_token=work_token,
+            use_hedging=use_hedging,
+            deadline=deadline,
+        )
+        if work_token:
+            work_token.raise_if_cancelled("parse")
+
+    except AnalysisCancelled as cancelled:
+        if cancelled.reason == DEADLINE_REASON and not (cancel_token and cancel_token.cancelled):
+            for name in uploaded_names:
+                _delete_remote_file(client, name)
+            return _partial_result(
+                cancelled,
+                model,
+                start_time,
+                report,
+                deadline,
+                files=[str(p) for p in paths],
+                strategy=[prep[1] if prep else strategy for prep in prepared],
+                document=[_document_profile(p) for p in paths],
+                timing={"strategies": file_timings},
+            )
+        _on_cancelled(client, cancelled, uploaded_names)
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+
+    extra: Dict[str, Any] = {}
+    if deadline.enabled:
+        extra["partial"] = deadline.dropped_content
+        extra["deadline"] = deadline.snapshot()
+
+    return _build_result(
+        response,
+        model,
+        start_time,
+        report,
+        files=[str(p) for p in paths],
+        strategy=[prep[1] for prep in prepared],
+        document=[_document_profile(p) for p in paths],
+        timing={"strategies": file_timings},
+        **extra,
+    )
+
+
 def print_results(result: Dict[str, Any]) -> None:
     """Pretty print extraction results."""
     print("\n" + "=" * 60)
@@ -310,7 +1504,7 @@ def print_results(result: Dict[str, Any]) -> None:
         print(f"❌ Error: {result.get('error')}")
         return
 
-    print(f"\n📁 File: {result['file']}")
+    print(f"\n📁 File: {result.get('file') or ', '.join(result.get('files', []))}")
     print(f"🤖 Model: {result['model']}")
 
     timing = result.get("timing", {})
@@ -372,13 +1566,30 @@ def print_results(result: Dict[str, Any]) -> None:
         for i in imgs:
             print(f"   • {i.get('studyName')} ({i.get('modality')})")
 
+    # 5. Profile (--profile)
+    profile = result.get("profile")
+    if profile:
+        print(
+            f"\n🔬 Profile ({profile['wall_seconds']:.2f}s wall, "
+            f"memory peak {profile['memory']['peak_mb']} MB):"
+        )
+        for name, entry in list(profile["stages"].items())[:8]:
+            print(f"   • {name}: {entry['seconds']:.3f}s ({entry['calls']} calls)")
+        for row in profile["cpu"]["top_self"][:5]:
+            print(f"   🔥 {row['function']}: {row['share']:.0%} of busy samples")
+
 
 def main():
     parser = argparse.ArgumentParser(
         description="Medical Document OCR - Fast Single Request",
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
-    parser.add_argument("file", type=str, help="Path to PDF or image file")
+    parser.add_argument(
+        "files",
+        type=str,
+        nargs="+",
+        help="PDF or image file(s), directories or glob patterns (batch mode)",
+    )
     parser.add_argument(
         "--output", type=str, default="output/medical_ocr", help="Output directory"
     )
@@ -394,27 +1605,146 @@ def main():
         default=None,
         help="Pages to process (e.g. 1,3-5). Disables direct PDF upload.",
     )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Treat all files as one patient and analyze them in a single request",
+    )
+    parser.add_argument(
+        "--strategy",
+        type=str,
+        choices=PDF_STRATEGIES,
+        default=None,
+        help="How PDFs are sent: upload (File API), images, race both, text layer, "
+        "chunked, or auto (estimator picks)",
+    )
+
+    parser.add_argument(
+        "--deadline-ms",
+        type=int,
+        default=None,
+        help="Time budget in ms; degrade and return a partial result instead of overrunning",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Batch mode: documents analyzed at the same time",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Batch mode: analyze again even if a complete output for the same content exists",
+    )
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        help="Batch mode: submit as Gemini batch prediction jobs (half price, results within 24h)",
+    )
+    parser.add_argument(
+        "--local-batch",
+        action="store_true",
+        help="With --background: answer the jobs in-process instead of through the batch API",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Add a profiling report (stage times, CPU samples, memory) and save it to PROFILE_DIR",
+    )
 
     args = parser.parse_args()
+    if args.bundle and args.pages:
+        parser.error("--pages cannot be combined with --bundle")
+    if args.background and (args.bundle or args.profile or args.deadline_ms):
+        parser.error("--background cannot be combined with --bundle, --profile or --deadline-ms")
+    if args.background and args.strategy not in (None, "upload", "images", "text"):
+        parser.error("--background supports the upload, images and text strategies")
+    if args.local_batch and not args.background:
+        parser.error("--local-batch needs --background")
+
+    from batch_runner import BatchRunner, collect_inputs, plan_outputs, print_summary
+
+    files = collect_inputs(args.files)
+    if not files:
+        parser.error("No PDF or image files found")
+    batch = args.background or (not args.bundle and (len(files) > 1 or not Path(args.files[0]).is_file()))
+    if batch and args.profile:
+        parser.error("--profile profiles one document (or one --bundle), not a batch")
 
     try:
         selected_pages = parse_page_selection(args.pages)
+        output_dir = Path(args.output)
 
-        result = analyze_document_streaming(
-            args.file,
-            model=args.model,
-            selected_pages=selected_pages,
-        )
+        if batch and args.background:
+            from batch_prediction import BatchPrediction, with_local_batches
+
+            client = _make_client(None)
+            runner = BatchPrediction(
+                plan_outputs(args.files, files, output_dir),
+                model=args.model,
+                client=with_local_batches(client) if args.local_batch else client,
+                output_dir=output_dir,
+                concurrency=args.concurrency,
+                selected_pages=selected_pages,
+                strategy=args.strategy,
+                force=args.force,
+            )
+        elif batch:
+            runner = BatchRunner(
+                plan_outputs(args.files, files, output_dir),
+                model=args.model,
+                concurrency=args.concurrency,
+                selected_pages=selected_pages,
+                strategy=args.strategy,
+                deadline_ms=args.deadline_ms,
+                force=args.force,
+            )
+        if batch:
+            summary = runner.run()
+            print_summary(summary)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            with open(output_dir / "batch_summary.json", "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+            print(f"\n💾 Saved batch summary to: {output_dir / 'batch_summary.json'}")
+            if summary["counts"].get("failed"):
+                exit(1)
+            return
+
+        with profile_analysis(str(files[0])) if args.profile else nullcontext() as active:
+            if args.bundle:
+                result = analyze_bundle(
+                    [str(f) for f in files],
+                    model=args.model,
+                    strategy=args.strategy,
+                    deadline=Deadline.from_ms(args.deadline_ms),
+                )
+                out_stem = files[0].stem + "_bundle"
+            else:
+                result = analyze_document_streaming(
+                    str(files[0]),
+                    model=args.model,
+                    selected_pages=selected_pages,
+                    strategy=args.strategy,
+                    deadline=Deadline.from_ms(args.deadline_ms),
+                )
+                out_stem = files[0].stem
+                # Lets a later batch run over the same files skip this one
+                if result.get("success"):
+                    result["source_sha256"] = file_sha256(str(files[0]))
+            with stage("serialize"):
+                saved = json.dumps(result, indent=2, ensure_ascii=False)
+        if active:
+            result["profile"] = finish_profile(active)
+            saved = json.dumps(result, indent=2, ensure_ascii=False)
 
         print_results(result)
 
         # Save to JSON
-        output_dir = Path(args.output)
         output_dir.mkdir(parents=True, exist_ok=True)
-        out_name = Path(args.file).stem + "_fast.json"
+        out_name = out_stem + "_fast.json"
 
         with open(output_dir / out_name, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+            f.write(saved)
 
         print(f"\n💾 Saved full JSON to: {output_dir / out_name}")
 
@@ -0,0 +1,33 @@
+"""
+In-process metrics for the OCR service.
+
+Counters are plain integers keyed by dotted names (e.g. "analysis.cancelled")
+and are exposed as JSON by the `/metrics` endpoint in api.py.
+"""
+
+import threading
+from typing import Dict
+
+
+class Metrics:
+    """Thread-safe counter registry shared by the API and the pipeline."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+
+# Process-wide registry
+metrics = Metrics()
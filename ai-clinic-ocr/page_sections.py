@@ -0,0 +1,254 @@
+"""
+Page section classifier for the "sections" PDF strategy.
+
+Instead of asking for the whole MedicalOCR schema on every page, each page is
+classified locally from its text layer (no network call, about a millisecond
+per page) into the MedicalOCR sections it contains: lab sheets, imaging
+reports, history, visit notes, follow-up call logs, notes. Keywords are
+matched in English and Arabic; lab pages are also recognized by their layout
+(many lines with a value followed by a unit or a reference range).
+
+Pages with the same sections are grouped, and every group is extracted with
+a prompt and schema for just those sections (plus the patient), concurrently.
+Pages without a usable text layer (scans) or without any recognized section
+get the full schema, so nothing is lost when the classifier is unsure.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from engines import load_pymupdf
+from schema_registry import SECTION_TYPES
+from text_normalize import normalize_arabic
+
+# Always requested: demographics are printed on the header of most pages
+ALWAYS_SECTIONS = ("patient",)
+
+# Terms per section. English terms match whole words; Arabic terms match
+# anywhere (articles and conjunctions are attached: "والتحاليل").
+SECTION_TERMS: Dict[str, Tuple[List[str], List[str]]] = {
+    "history": (
+        [
+            "medical history", "past history", "past medical", "surgical history", "history of",
+            "chronic", "diabetic", "hypertensive", "allergy", "allergies", "allergic",
+            "medications", "current medications", "drug history", "smoker", "smoking",
+            "previous surgery", "previous operation", "comorbidities", "complaint",
+        ],
+        ["تاريخ مرضي", "التاريخ المرضي", "امراض مزمنه", "حساسيه", "الادويه", "ادويه",
+         "عمليات سابقه", "تدخين", "الشكوي"],
+    ),
+    "labs": (
+        [
+            "laboratory", "lab results", "test", "result", "results", "reference range",
+            "normal range", "ref. range", "specimen", "cbc", "hba1c", "hemoglobin", "creatinine",
+            "glucose", "cholesterol", "triglycerides", "alt", "ast", "tsh", "platelets", "wbc",
+            "urine analysis", "sgpt", "sgot",
+        ],
+        ["تحاليل", "تحليل", "معمل", "نتيجه", "المعدل الطبيعي", "صوره دم", "سكر صائم"],
+    ),
+    "imaging": (
+        [
+            "ultrasound", "sonography", "x-ray", "xray", "ct", "mri", "echocardiogram", "echo",
+            "endoscopy", "radiology", "impression", "findings", "scan", "doppler", "ogd",
+        ],
+        ["اشعه", "سونار", "موجات صوتيه", "رنين", "مقطعيه", "منظار", "ايكو"],
+    ),
+    "visits": (
+        [
+            "visit", "clinic visit", "examination", "on examination", "wound", "weight",
+            "vital signs", "blood pressure", "plan", "assessment", "outpatient", "follow up visit",
+        ],
+        ["كشف", "زياره", "فحص", "الجرح", "الوزن", "ضغط الدم", "العياده"],
+    ),
+    "followups": (
+        [
+            "follow-up call", "follow up call", "phone call", "call log", "adherence",
+            "post-op day", "pod", "diet stage", "bowel", "alarming signs",
+        ],
+        ["مكالمه", "متابعه تليفونيه", "اتصال"],
+    ),
+    "notes": (
+        ["note", "notes", "memo", "administrative", "referral", "letter", "communication"],
+        ["ملاحظات", "ملاحظه", "تحويل", "خطاب"],
+    ),
+}
+
+# A number that is not part of a date (2024-01-02, 12/05), a time or a phone
+# number (010-1234...), whose parts have leading zeros or more digits
+_LAB_NUMBER = r"(?:0|[1-9]\d{0,3})(?:[.,]\d+)?(?![\d:]|/\d)"
+_LAB_VALUE = r"(?<![\d.,:/-])" + _LAB_NUMBER
+# Lab table rows: a value with a unit, or a value followed by its reference
+# range ("13.5  H  12 - 16", "2.5 (0.4-4.0)")
+_LAB_ROW = re.compile(
+    _LAB_VALUE + r"\s*(?:mg/dl|mmol/l|g/dl|u/l|iu/l|%|ng/ml|pg/ml|mg/l|fl|pg|/cmm|x10|10\^)"
+    r"|" + _LAB_VALUE + r"\s+(?:[hl]\s+)?[(\[]?\s*" + _LAB_VALUE + r"\s*[-–]\s*"
+    + _LAB_NUMBER + r"(?!\s*[-–/]\s*\d)",
+    re.IGNORECASE,
+)
+LAB_ROWS_FOR_TABLE = 3  # lines matching _LAB_ROW that make a page a lab sheet
+LAB_TABLE_SCORE = 3
+
+MIN_SECTION_SCORE = 2  # distinct terms (or layout evidence) to assign a section
+
+
+def _english_pattern(terms: List[str]) -> "re.Pattern[str]":
+    alternatives = sorted((re.escape(term) for term in terms), key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+_PATTERNS = {
+    section: (_english_pattern(english), [normalize_arabic(term) for term in arabic])
+    for section, (english, arabic) in SECTION_TERMS.items()
+}
+
+
+@dataclass
+class PageGroup:
+    """Pages extracted together; `sections` None means the full schema."""
+
+    pages: List[int]
+    sections: Optional[Tuple[str, ...]] = None
+
+    def describe(self) -> str:
+        names = ", ".join(self.sections) if self.sections else "all sections"
+        return f"pages {_page_ranges(self.pages)}: {names}"
+
+
+@dataclass
+class SectionPlan:
+    groups: List[PageGroup]
+    # 1-based page -> its sections (None: unreadable / unrecognized)
+    pages: Dict[int, Optional[Tuple[str, ...]]] = field(default_factory=dict)
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "groups": [
+                {"pages": group.pages, "sections": list(group.sections) if group.sections else None}
+                for group in self.groups
+            ],
+            "unclassified_pages": sorted(p for p, sections in self.pages.items() if sections is None),
+        }
+
+
+def _page_ranges(pages: List[int]) -> str:
+    ranges = []
+    start = prev = pages[0]
+    for page in pages[1:] + [None]:
+        if page is not None and page == prev + 1:
+            prev = page
+            continue
+        ranges.append(f"{start}-{prev}" if prev != start else str(start))
+        if page is not None:
+            start = prev = page
+    return ",".join(ranges)
+
+
+def score_sections(text: str) -> Dict[str, int]:
+    """Evidence per section in a page text: distinct matched terms plus layout."""
+    folded = normalize_arabic(text.casefold())
+    scores = {}
+    for section, (english, arabic) in _PATTERNS.items():
+        hits = {match.group(0).casefold() for match in english.finditer(folded)}
+        hits.update(term for term in arabic if term in folded)
+        scores[section] = len(hits)
+    lab_rows = sum(1 for line in folded.splitlines() if _LAB_ROW.search(line))
+    if lab_rows >= LAB_ROWS_FOR_TABLE:
+        scores["labs"] += LAB_TABLE_SCORE
+    return scores
+
+
+def classify_text(text: str) -> Optional[Tuple[str, ...]]:
+    """Sections (in MedicalOCR order) a page text contains, None if unsure.
+
+    A section needs MIN_SECTION_SCORE; with no section that strong, the
+    single best one is taken if it has any evidence at all.
+    """
+    if len(text.strip()) < settings.TEXT_LAYER_MIN_CHARS:
+        return None
+    scores = score_sections(text)
+    found = [s for s, score in scores.items() if score >= MIN_SECTION_SCORE]
+    if not found:
+        best = max(scores, key=scores.__getitem__)
+        if not scores[best]:
+            return None
+        found = [best]
+    return tuple(s for s in SECTION_TYPES if s in found or s in ALWAYS_SECTIONS)
+
+
+def group_pages(
+    page_sections: Dict[int, Optional[Tuple[str, ...]]],
+    max_groups: int,
+    max_pages: int,
+) -> List[PageGroup]:
+    """Group pages by their sections, at most `max_groups` groups of `max_pages` pages.
+
+    Unclassified pages form one full-schema group. When there are too many
+    groups, the two smallest are merged (union of their sections) until they
+    fit; a group with every section becomes a full-schema group.
+    """
+    by_sections: Dict[Optional[Tuple[str, ...]], List[int]] = {}
+    for page, sections in sorted(page_sections.items()):
+        by_sections.setdefault(sections, []).append(page)
+
+    groups = [PageGroup(pages, sections) for sections, pages in by_sections.items()]
+    max_groups = max(1, max_groups)
+    while len(groups) > max_groups:
+        groups.sort(key=lambda g: len(g.pages))
+        first, second = groups.pop(0), groups.pop(0)
+        if first.sections is None or second.sections is None:
+            sections = None
+        else:
+            union = set(first.sections) | set(second.sections)
+            sections = tuple(s for s in SECTION_TYPES if s in union)
+        groups.append(PageGroup(sorted(first.pages + second.pages), sections))
+
+    split: List[PageGroup] = []
+    for group in sorted(groups, key=lambda g: g.pages[0]):
+        if group.sections is not None and set(group.sections) >= set(SECTION_TYPES):
+            group.sections = None
+        size = max(1, max_pages)
+        for i in range(0, len(group.pages), size):
+            split.append(PageGroup(group.pages[i : i + size], group.sections))
+    return split
+
+
+def plan_sections(
+    file_path: str,
+    selected_pages: Optional[List[int]] = None,
+    only: Optional[Tuple[str, ...]] = None,
+) -> SectionPlan:
+    """Classify the pages of a PDF and group them for section-specific extraction.
+
+    `only` restricts every group to these sections (e.g. deadline core
+    sections); pages left without a section are skipped.
+    """
+    fitz = load_pymupdf()
+    page_sections: Dict[int, Optional[Tuple[str, ...]]] = {}
+    with fitz.open(file_path) as doc:
+        total = len(doc)
+        pages = [p for p in selected_pages if 1 <= p <= total] if selected_pages else range(1, total + 1)
+        for page in pages:
+            page_sections[page] = classify_text(doc[page - 1].get_text())
+
+    if only:
+        restricted: Dict[int, Optional[Tuple[str, ...]]] = {}
+        for page, sections in page_sections.items():
+            kept = tuple(s for s in (sections or SECTION_TYPES) if s in only)
+            if set(kept) - set(ALWAYS_SECTIONS) or sections is None:
+                restricted[page] = kept
+        page_sections = restricted or {page: tuple(only) for page in page_sections}
+
+    groups = group_pages(page_sections, settings.SECTION_MAX_GROUPS, settings.PDF_CHUNK_PAGES)
+    return SectionPlan(groups, page_sections)
+
+
+def section_instructions(sections: Optional[Tuple[str, ...]]) -> str:
+    """Prompt addition that focuses a request on `sections`."""
+    if not sections:
+        return ""
+    return f"""
+
+FOCUSED PAGES: These pages were pre-classified as containing: {", ".join(sections)}.
+Extract only these sections; the response schema has no other fields."""
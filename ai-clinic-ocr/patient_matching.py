@@ -0,0 +1,278 @@
+"""
+Duplicate-patient matching.
+
+`PatientIndex` answers "do we already know this patient?" for an extracted
+`Patient` without comparing it against every record. Each patient is filed
+under a few blocking keys:
+
+- every normalized phone number (phone, optional_phone)
+- the consonant skeletons of the first two and first three name tokens, for
+  the English and the Arabic name (`text_normalize.name_skeleton`, so
+  "Mohamed Ahmed" and "محمد أحمد" share their keys)
+- date of birth + first name
+
+Skeletons only select candidates: "Mahmoud" and "Mohamed" share one. When
+scoring, first names are compared on `text_normalize.given_name`, which keeps
+the vowels, so brothers who share father, grandfather and phone are not
+reported as one patient.
+
+A query only scores the patients that share a selective key with it (phone,
+three name tokens, dob). The two-token name key is a fallback for queries
+that have nothing else. Keys shared by more than MATCH_MAX_BLOCK patients
+("Mohamed Ahmed") are skipped as too unselective.
+Matching a patient against hundreds of thousands takes well under a
+millisecond (see scripts/bench_patient_matching.py).
+"""
+
+import heapq
+import threading
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from config import settings
+from text_normalize import given_name, name_skeleton, normalize_phone, same_given_name
+
+# Score weights; a dob that contradicts costs DOB_MISMATCH_PENALTY
+PHONE_WEIGHT = 0.45
+NAME_WEIGHT = 0.40
+DOB_WEIGHT = 0.15
+DOB_MISMATCH_PENALTY = 0.30
+
+# Above this a candidate is reported as "likely" the same patient
+LIKELY_SCORE = 0.7
+
+# Only the candidates sharing the most blocking keys are scored
+MAX_SCORED = 50
+
+
+class _Entry:
+    """Indexed form of one patient (slots: hundreds of thousands are kept)."""
+
+    __slots__ = ("patient_id", "phones", "names", "given", "dob", "name", "name_ar")
+
+    def __init__(self, patient_id: int, patient: Dict[str, Any]) -> None:
+        self.patient_id = patient_id
+        self.phones: FrozenSet[str] = frozenset(
+            {normalize_phone(patient.get(f)) for f in ("phone", "optional_phone")} - {None}
+        )
+        names = [
+            (tuple(skeleton), given_name(name))
+            for name in (patient.get("name"), patient.get("name_ar"))
+            for skeleton in (name_skeleton(name),)
+            if skeleton
+        ]
+        self.names: Tuple[Tuple[str, ...], ...] = tuple(skeleton for skeleton, _ in names)
+        # First name of each entry of `names`, with its vowels
+        self.given: Tuple[Any, ...] = tuple(given for _, given in names)
+        dob = patient.get("dob")
+        self.dob: Optional[str] = str(dob)[:10] if dob else None
+        self.name = patient.get("name") or ""
+        self.name_ar = patient.get("name_ar")
+
+    def keys(self) -> Set[str]:
+        return self.selective_keys() | self.fallback_keys()
+
+    def selective_keys(self) -> Set[str]:
+        keys = {f"p:{phone}" for phone in self.phones}
+        for skeleton in self.names:
+            if len(skeleton) >= 3:
+                keys.add("n3:" + "|".join(skeleton[:3]))
+            if self.dob:
+                keys.add(f"d:{self.dob}|{skeleton[0]}")
+        return keys
+
+    def fallback_keys(self) -> Set[str]:
+        return {"n2:" + "|".join(skeleton[:2]) for skeleton in self.names if len(skeleton) >= 2}
+
+
+def _name_similarity(a: _Entry, b: _Entry) -> float:
+    """Best share of equal leading name tokens over the name pairs (0-1).
+
+    Egyptian names are first name + father + grandfather, so tokens are
+    compared by position. A differing first name means a different person,
+    and first names are compared with their vowels (same_given_name); names
+    of one or two tokens are less conclusive than longer ones.
+    """
+    best = 0.0
+    for x, x_given in zip(a.names, a.given):
+        for y, y_given in zip(b.names, b.given):
+            if x[0] != y[0] or not same_given_name(x_given, y_given):
+                continue
+            n = min(len(x), len(y), 4)
+            same = 1
+            for i in range(1, n):
+                if x[i] == y[i]:
+                    same += 1
+            similarity = same / n if n >= 3 else 0.9 * same / n
+            if similarity > best:
+                best = similarity
+    return best
+
+
+def score_pair(query: _Entry, candidate: _Entry) -> Tuple[float, List[str]]:
+    """Similarity score (0-1) and the fields that matched."""
+    matched = []
+    score = 0.0
+    if not query.phones.isdisjoint(candidate.phones):
+        score += PHONE_WEIGHT
+        matched.append("phone")
+    name = _name_similarity(query, candidate)
+    if name:
+        score += NAME_WEIGHT * name
+        matched.append("name")
+    if query.dob and candidate.dob:
+        if query.dob == candidate.dob:
+            score += DOB_WEIGHT
+            matched.append("dob")
+        else:
+            score -= DOB_MISMATCH_PENALTY
+    return max(0.0, score), matched
+
+
+class PatientIndex:
+    """In-memory blocking index of patients by id (thread-safe)."""
+
+    def __init__(self, max_block: Optional[int] = None) -> None:
+        self.max_block = max_block or settings.MATCH_MAX_BLOCK
+        self._lock = threading.RLock()
+        self._entries: Dict[int, _Entry] = {}
+        # Blocks hold the entries themselves: no id lookups while matching
+        self._blocks: Dict[str, List[_Entry]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, patient_id: int, patient: Dict[str, Any]) -> None:
+        entry = _Entry(patient_id, patient)
+        with self._lock:
+            if patient_id in self._entries:
+                self.remove(patient_id)
+            self._entries[patient_id] = entry
+            for key in entry.keys():
+                self._blocks[key].append(entry)
+
+    def add_many(self, patients: Iterable[Tuple[int, Dict[str, Any]]]) -> int:
+        count = 0
+        for patient_id, patient in patients:
+            self.add(patient_id, patient)
+            count += 1
+        return count
+
+    def remove(self, patient_id: int) -> bool:
+        with self._lock:
+            entry = self._entries.pop(patient_id, None)
+            if entry is None:
+                return False
+            for key in entry.keys():
+                block = self._blocks[key]
+                block.remove(entry)
+                if not block:
+                    del self._blocks[key]
+            return True
+
+    def candidates(self, entry: _Entry, limit: int = MAX_SCORED) -> List[_Entry]:
+        """Entries sharing a selective blocking key with `entry` (else a fallback key).
+
+        When there are more than `limit`, the ones sharing the most keys win:
+        the same patient shares phone, name and dob keys, a namesake only one.
+        """
+        with self._lock:
+            for keys in (entry.selective_keys(), entry.fallback_keys()):
+                shared: Dict[_Entry, int] = {}
+                for key in keys:
+                    block = self._blocks.get(key)
+                    if block and len(block) <= self.max_block:
+                        for candidate in block:
+                            shared[candidate] = shared.get(candidate, 0) + 1
+                if len(shared) > limit:
+                    return heapq.nlargest(limit, shared, key=shared.__getitem__)
+                if shared:
+                    return list(shared)
+        return []
+
+    def match(
+        self,
+        patient: Dict[str, Any],
+        limit: int = 5,
+        min_score: Optional[float] = None,
+        exclude: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Known patients that may be `patient`, best first."""
+        min_score = settings.MATCH_MIN_SCORE if min_score is None else min_score
+        query = _Entry(-1, patient)
+        scored = []
+        with self._lock:
+            for candidate in self.candidates(query):
+                if candidate.patient_id == exclude:
+                    continue
+                score, matched = score_pair(query, candidate)
+                if score >= min_score:
+                    scored.append((score, candidate, matched))
+
+        scored.sort(key=lambda item: (-item[0], -item[1].patient_id))
+        return [
+            {
+                "patient_id": candidate.patient_id,
+                "score": round(score, 3),
+                "likely": score >= LIKELY_SCORE,
+                "matched_on": matched,
+                "name": candidate.name,
+                "name_ar": candidate.name_ar,
+            }
+            for score, candidate, matched in scored[:limit]
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = [len(block) for block in self._blocks.values()]
+            return {
+                "patients": len(self._entries),
+                "blocks": len(sizes),
+                "largest_block": max(sizes, default=0),
+                "oversized_blocks": sum(1 for size in sizes if size > self.max_block),
+            }
+
+
+# =============================================================================
+# Index over the extraction store
+# =============================================================================
+_index: Optional[PatientIndex] = None
+_index_lock = threading.Lock()
+# Last extraction id and deletion sequence number applied to _index
+_synced_id = 0
+_synced_deletion = 0
+
+
+def get_patient_index() -> PatientIndex:
+    """Process-wide index of the patients in the extraction store, kept in sync with it.
+
+    Built on first use; every later call applies what was saved or deleted
+    since, by any worker process: extractions with a higher id, and the
+    store's deletion log. Both are primary-key range reads, so the index
+    stays current at a negligible cost per match. Patient ids are extraction ids.
+    """
+    global _index, _synced_id, _synced_deletion
+    from extraction_store import get_extraction_store
+
+    store = get_extraction_store()
+    with _index_lock:
+        building = _index is None
+        if building:
+            # Deletions before the build are not in the store any more
+            _synced_deletion = store.last_deletion()
+            _index = PatientIndex()
+        count = 0
+        for extraction_id, patient in store.patients(after_id=_synced_id):
+            _index.add(extraction_id, patient)
+            _synced_id = extraction_id
+            count += 1
+        for seq, extraction_id in store.deletions(after_seq=_synced_deletion):
+            _index.remove(extraction_id)
+            _synced_deletion = seq
+        if building:
+            print(f"   🧑‍⚕️ Patient index: {count} patients")
+        return _index
+
+
+def patient_index_loaded() -> bool:
+    return _index is not None
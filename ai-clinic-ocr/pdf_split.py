@@ -0,0 +1,138 @@
+"""
+Split large PDFs into page-range sub-PDFs for concurrent File API uploads.
+
+A 100+ MB scan uploaded as one File API object is one single-threaded upload
+followed by one long server-side PROCESSING wait. Split into parts of about
+LARGE_PDF_PART_MB, the parts upload (and are processed) in parallel.
+
+Parts are built with PyMuPDF's insert_pdf, which copies the page objects
+(scanned images included) as they are: nothing is rendered or re-encoded.
+The source is read from disk, never loaded whole, and the parts that are in
+memory at a time (being built or waiting for their upload to finish) are
+bounded by a MemoryBudget of LARGE_PDF_MEMORY_MB, so the service never holds
+the file in RAM twice however large it is.
+"""
+
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+from config import settings
+from engines import load_pymupdf
+from profiling import stage
+
+MB = 1024 * 1024
+
+
+def is_large_pdf(path: Path) -> bool:
+    """Whether a PDF is sent as split parts (LARGE_PDF_MB, 0 disables)."""
+    return (
+        settings.LARGE_PDF_MB > 0
+        and path.suffix.lower() == ".pdf"
+        and path.stat().st_size > settings.LARGE_PDF_MB * MB
+    )
+
+
+class MemoryBudget:
+    """Bytes of split parts held at once.
+
+    `acquire` blocks while the budget is used up. A part larger than the whole
+    budget is still admitted once nothing else is held, so a single huge page
+    slows the split down instead of deadlocking it.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit = max(1, limit_bytes)
+        self.held = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int, check: Optional[Callable[[], None]] = None) -> None:
+        """Reserve `size` bytes; `check` runs while waiting (e.g. to raise on cancellation)."""
+        with self._cond:
+            while self.held and self.held + size > self.limit:
+                if check:
+                    check()
+                self._cond.wait(timeout=0.5)
+            self.held += size
+            self.peak = max(self.peak, self.held)
+
+    def resize(self, reserved: int, actual: int) -> None:
+        """Replace a reservation by the actual size, without blocking."""
+        with self._cond:
+            self.held += actual - reserved
+            self.peak = max(self.peak, self.held)
+            self._cond.notify_all()
+
+    def release(self, size: int) -> None:
+        with self._cond:
+            self.held = max(0, self.held - size)
+            self._cond.notify_all()
+
+
+@dataclass
+class SplitPart:
+    """One sub-PDF: `group` indexes the page groups passed to split_pdf."""
+
+    group: int
+    pages: List[int]
+    data: bytes
+
+    def describe(self) -> str:
+        return f"pages {self.pages[0]}-{self.pages[-1]}" if len(self.pages) > 1 else f"page {self.pages[0]}"
+
+
+def plan_parts(pages: List[int], bytes_per_page: float, part_bytes: int) -> List[List[int]]:
+    """Split `pages` into runs of about `part_bytes` (at least one page each)."""
+    size = max(1, int(part_bytes // max(1.0, bytes_per_page)))
+    return [pages[i : i + size] for i in range(0, len(pages), size)]
+
+
+def _runs(pages: List[int]) -> Iterator[tuple]:
+    """Consecutive (first, last) 1-based page runs, for insert_pdf ranges."""
+    start = prev = pages[0]
+    for page in pages[1:]:
+        if page != prev + 1:
+            yield start, prev
+            start = page
+        prev = page
+    yield start, prev
+
+
+def split_pdf(
+    file_path: str,
+    groups: List[List[int]],
+    budget: MemoryBudget,
+    check: Optional[Callable[[], None]] = None,
+) -> Iterator[SplitPart]:
+    """Yield sub-PDFs of about LARGE_PDF_PART_MB for every group of 1-based pages.
+
+    Each part is reserved in `budget` before it is built; the consumer must
+    `budget.release(len(part.data))` once the part is uploaded. Parts are
+    built one at a time, so building never needs more than one part of memory.
+    """
+    fitz = load_pymupdf()
+    file_bytes = Path(file_path).stat().st_size
+    with fitz.open(file_path) as doc:
+        total = len(doc)
+        bytes_per_page = file_bytes / max(1, total)
+        part_bytes = settings.LARGE_PDF_PART_MB * MB
+        for idx, group in enumerate(groups):
+            pages = [p for p in group if 1 <= p <= total]
+            if not pages:
+                continue
+            for part_pages in plan_parts(pages, bytes_per_page, part_bytes):
+                estimate = int(len(part_pages) * bytes_per_page)
+                budget.acquire(estimate, check)
+                try:
+                    with stage("split"), fitz.open() as part:
+                        for first, last in _runs(part_pages):
+                            part.insert_pdf(doc, from_page=first - 1, to_page=last - 1)
+                        # garbage=1 drops unused objects; streams keep their encoding
+                        data = part.tobytes(garbage=1)
+                except BaseException:
+                    budget.release(estimate)
+                    raise
+                budget.resize(estimate, len(data))
+                yield SplitPart(idx, part_pages, data)
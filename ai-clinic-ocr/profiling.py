@@ -0,0 +1,280 @@
+"""
+Opt-in profiling of a single analysis.
+
+`profile_analysis` wraps one analysis and reports where its time and memory
+went:
+
+- wall time per pipeline stage (upload, poll, render, text, classify, split,
+  generate, validate, serialize), marked in the pipeline with `stage()`;
+  stages of concurrent chunks add up, so they can exceed the wall time
+- a sampled CPU profile: a thread reads the stacks of the analysis threads
+  every PROFILE_SAMPLE_INTERVAL_MS; samples waiting on locks, sockets or
+  queues are counted apart, the rest give the hottest functions
+- the tracemalloc peak and the allocations (by line) that grew most up to
+  the largest stage-end snapshot
+
+The report is returned as a dict and saved to PROFILE_DIR together with the
+sampled stacks in folded format (flamegraph.pl, speedscope). The active
+profile is a context variable, so stages of other requests never count;
+executor threads join it through `in_context`. tracemalloc slows the whole
+process down, which is why only one analysis per process is profiled at a
+time and the API refuses profiling unless PROFILING_ENABLED is set.
+"""
+
+import contextvars
+import functools
+import json
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+from engines import pymupdf_available
+
+MAX_STACK_DEPTH = 64
+TRACEMALLOC_FRAMES = 10
+
+# Leaf functions of a thread that is blocked, not using the CPU
+WAITING_LEAVES = {
+    "threading:wait",
+    "threading:_wait_for_tstate_lock",
+    "threading:join",
+    "queue:get",
+    "selectors:select",
+    "socket:readinto",
+    "ssl:read",
+    "ssl:recv_into",
+    "cancellation:sleep",
+    "cancellation:wait",
+    "_base:result",
+    "thread:_worker",
+}
+
+_current: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+_exclusive = threading.Lock()
+
+
+class ProfileBusy(RuntimeError):
+    """Another analysis of this process is being profiled."""
+
+
+def in_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """`fn` bound to a copy of the current context, for executor threads.
+
+    Without it, work submitted to a thread pool would not see the active
+    profile. Call it once per submit: a context can run in one thread at a time.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a pipeline stage for the active profile (no-op without one)."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile.threads.add(threading.get_ident())
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, time.perf_counter() - start)
+
+
+def _frame_key(code: Any) -> str:
+    return f"{Path(code.co_filename).stem}:{code.co_name}"
+
+
+class _Sampler(threading.Thread):
+    """Collects the stacks of the profile's threads at a fixed interval."""
+
+    def __init__(self, profile: "Profile", interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.profile = profile
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.profile.threads):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_key(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class Profile:
+    """Stage timings, stack samples and memory of one analysis."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.threads = {threading.get_ident()}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._wall = 0.0
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.take_snapshot()
+        self._max_traced = 0
+        self._max_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak = 0
+        self._sampler = _Sampler(self, max(0.001, settings.PROFILE_SAMPLE_INTERVAL_MS / 1000))
+        self._sampler.start()
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        with self._lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "max_seconds": 0.0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            if traced > self._max_traced:
+                # What is alive at the fullest stage end: the top allocators
+                self._max_traced = traced
+                self._max_snapshot = tracemalloc.take_snapshot()
+
+    def stop(self) -> None:
+        self._wall = time.perf_counter() - self._start
+        self._sampler.stop()
+        if tracemalloc.is_tracing():
+            self._peak = tracemalloc.get_traced_memory()[1]
+            if self._max_snapshot is None:
+                self._max_snapshot = tracemalloc.take_snapshot()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+    # =========================================================================
+    # Report
+    # =========================================================================
+    def _cpu_report(self, top: int) -> Dict[str, Any]:
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        busy = 0
+        for stack, count in self._sampler.stacks.items():
+            if not stack or stack[-1] in WAITING_LEAVES:
+                continue
+            busy += count
+            self_counts[stack[-1]] += count
+            for key in set(stack):
+                total_counts[key] += count
+        interval_ms = settings.PROFILE_SAMPLE_INTERVAL_MS
+        return {
+            "interval_ms": interval_ms,
+            "samples": self._sampler.samples,
+            "busy_samples": busy,
+            "threads": len(self.threads),
+            "top_self": [
+                {"function": key, "samples": count, "share": round(count / busy, 3)}
+                for key, count in self_counts.most_common(top)
+            ],
+            "top_total": [
+                {"function": key, "samples": count, "share": round(count / busy, 3)}
+                for key, count in total_counts.most_common(top)
+            ],
+        }
+
+    def _memory_report(self, top: int) -> Dict[str, Any]:
+        if self._max_snapshot is None:
+            return {"peak_mb": None, "top": []}
+        ignore = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+        growth = self._max_snapshot.filter_traces(ignore).compare_to(
+            self._baseline.filter_traces(ignore), "lineno"
+        )
+        return {
+            "peak_mb": round(self._peak / 1024 / 1024, 2),
+            "top": [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_kb": round(stat.size_diff / 1024, 1),
+                    "count": stat.count_diff,
+                }
+                for stat in growth[:top]
+                if stat.size_diff > 0
+            ],
+        }
+
+    def report(self) -> Dict[str, Any]:
+        top = settings.PROFILE_TOP
+        return {
+            "label": self.label,
+            "wall_seconds": round(self._wall, 3),
+            "stages": {
+                name: {k: round(v, 3) if isinstance(v, float) else v for k, v in entry.items()}
+                for name, entry in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])
+            },
+            "cpu": self._cpu_report(top),
+            "memory": self._memory_report(top),
+        }
+
+    def folded_stacks(self) -> List[str]:
+        """Sampled stacks as "outer;...;leaf count" lines."""
+        return [f"{';'.join(stack)} {count}" for stack, count in self._sampler.stacks.most_common()]
+
+    def save(self, report: Dict[str, Any]) -> Tuple[Path, Path]:
+        """Write the report and the folded stacks to PROFILE_DIR."""
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", Path(self.label).stem)[:60] or "analysis"
+        base = directory / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{name}"
+        report_path, stacks_path = base.with_suffix(".json"), base.with_suffix(".folded")
+        report_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        stacks_path.write_text("\n".join(self.folded_stacks()) + "\n", encoding="utf-8")
+        return report_path, stacks_path
+
+
+@contextmanager
+def profile_analysis(label: str) -> Iterator[Profile]:
+    """Profile the analysis run inside the block (one per process at a time).
+
+    Raises ProfileBusy if another analysis is being profiled. The report is
+    built with `finish` once the block is left.
+    """
+    if not _exclusive.acquire(blocking=False):
+        raise ProfileBusy("Another analysis is being profiled, try again later")
+    # PyMuPDF is imported lazily; importing it under tracemalloc takes tens
+    # of seconds and would be the whole profile of a first (CLI) analysis
+    pymupdf_available()
+    profile = Profile(label)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile.stop()
+        _exclusive.release()
+
+
+def finish(profile: Profile) -> Dict[str, Any]:
+    """Report of a finished profile, saved to PROFILE_DIR (paths under "files")."""
+    report = profile.report()
+    report_path, stacks_path = profile.save(report)
+    report["files"] = {"report": str(report_path), "stacks": str(stacks_path)}
+    print(f"   🔬 Profile saved to: {report_path}")
+    return report
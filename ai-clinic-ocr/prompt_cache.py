@@ -0,0 +1,129 @@
+"""
+Gemini context caching for the static prompt + schema prefix.
+
+Every request starts with the same COMPACT_PROMPT and MedicalOCR JSON schema.
+This module keeps one Gemini cached-content entry per (model, schema version,
+prompt version), refreshes its TTL before it expires and hands its name to
+generate_content calls. Entry names are shared between worker processes via
+SharedState. When caching is disabled, unsupported by the model or fails for
+any reason, callers get None and send the prompt inline as before.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from google.genai import types
+
+from config import settings
+from metrics import metrics
+from shared_state import get_shared_state
+
+
+def content_version(value: Any) -> str:
+    """Short stable hash used to version the prompt and schema."""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+
+
+class PromptCache:
+    """Creates, refreshes and looks up cached-content entries for a static prefix."""
+
+    def __init__(self, prompt: str, schema: Dict[str, Any]) -> None:
+        self.prompt_version = content_version(prompt)
+        self.schema_version = content_version(schema)
+        self.system_instruction = (
+            f"{prompt}\n\nThe JSON schema of the response:\n"
+            f"{json.dumps(schema, ensure_ascii=False)}"
+        )
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # model -> monotonic time until which caching is not retried
+        self._unavailable: Dict[str, float] = {}
+
+    def key(self, model: str) -> str:
+        return f"context_cache:{model}:{self.schema_version}:{self.prompt_version}"
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            try:
+                entry = get_shared_state().cache_get(key)
+            except Exception:
+                entry = None
+        if entry and entry["expires_at"] > time.time():
+            self._entries[key] = entry
+            return entry
+        return None
+
+    def _store(self, key: str, entry: Dict[str, Any]) -> None:
+        self._entries[key] = entry
+        try:
+            get_shared_state().cache_put(key, entry, max(1.0, entry["expires_at"] - time.time()))
+        except Exception:
+            pass
+
+    def get(self, client: Any, model: str) -> Optional[str]:
+        """Name of a live cached-content entry for `model`, or None to send inline."""
+        if not settings.CONTEXT_CACHE_ENABLED:
+            return None
+
+        ttl = settings.CONTEXT_CACHE_TTL_SECONDS
+        key = self.key(model)
+        with self._lock:
+            if self._unavailable.get(model, 0) > time.monotonic():
+                return None
+
+            entry = self._lookup(key)
+            now = time.time()
+            try:
+                if entry is None:
+                    cached = client.caches.create(
+                        model=model,
+                        config=types.CreateCachedContentConfig(
+                            display_name=key,
+                            system_instruction=self.system_instruction,
+                            ttl=f"{ttl}s",
+                        ),
+                    )
+                    entry = {"name": cached.name, "expires_at": now + ttl}
+                    self._store(key, entry)
+                    metrics.incr("context_cache.created")
+                elif entry["expires_at"] - now < settings.CONTEXT_CACHE_REFRESH_SECONDS:
+                    client.caches.update(
+                        name=entry["name"],
+                        config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"),
+                    )
+                    entry = {"name": entry["name"], "expires_at": now + ttl}
+                    self._store(key, entry)
+                    metrics.incr("context_cache.refreshed")
+            except Exception as exc:
+                print(f"   ⚠️ Context cache unavailable for {model} ({exc}), sending prompt inline")
+                metrics.incr("context_cache.unavailable")
+                self._entries.pop(key, None)
+                self._unavailable[model] = (
+                    time.monotonic() + settings.CONTEXT_CACHE_RETRY_SECONDS
+                )
+                return None
+
+            return entry["name"]
+
+    def invalidate(self, model: str) -> None:
+        """Forget the entry for `model` (e.g. after the API reported it missing)."""
+        key = self.key(model)
+        with self._lock:
+            self._entries.pop(key, None)
+            try:
+                get_shared_state().cache_delete(key)
+            except Exception:
+                pass
+        metrics.incr("context_cache.invalidated")
+
+
+def is_cache_error(exc: Exception) -> bool:
+    """True if a generate_content error was caused by the referenced cache entry."""
+    message = str(exc).lower()
+    return "cachedcontent" in message or "cached content" in message or "cached_content" in message
@@ -0,0 +1,253 @@
+"""
+Combining MedicalOCR extractions.
+
+`merge_extractions` folds several partial extractions of the same patient
+(e.g. one per page chunk) into a single MedicalOCR-shaped dict.
+
+`diff_extractions` compares a new extraction with an existing patient record.
+List entries are matched by natural key (condition name + onset date, drug +
+start date, test name + lab date, study name + image date, ...), so the
+result is the delta per list: entries to add, entries to update with only the
+changed fields, and a count of unchanged ones. `merge_into` applies it. Both
+are linear in the size of the two records.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from text_normalize import normalize_name
+
+# MedicalOCR list locations: (section, list field or None for a top-level list)
+LIST_PATHS = [
+    ("history", "patientConditions"),
+    ("history", "patientMedications"),
+    ("history", "patientSurgeries"),
+    ("history", "patientAllergies"),
+    ("history", "patientSocialHistory"),
+    ("labs", "labs"),
+    ("imaging", None),
+    ("followups", None),
+    ("visits", "visits"),
+    ("notes", None),
+]
+
+
+# Natural key of the entries of each list. Entries without any key field
+# are matched by their full content.
+NATURAL_KEYS: Dict[Tuple[str, Optional[str]], Tuple[str, ...]] = {
+    ("history", "patientConditions"): ("conditionName", "onsetDate"),
+    ("history", "patientMedications"): ("drugName", "startDate"),
+    ("history", "patientSurgeries"): ("procedureName", "surgeryDate"),
+    ("history", "patientAllergies"): ("allergen",),
+    ("history", "patientSocialHistory"): ("category", "value"),
+    ("labs", "labs"): ("testName", "labDate"),
+    ("imaging", None): ("study_name", "image_date"),
+    ("followups", None): ("call_date",),
+    ("visits", "visits"): ("visit_date",),
+    # Notes are free text: an edited note is a new note
+    ("notes", None): ("title", "note_date", "content"),
+}
+
+
+def list_name(section: str, field: Optional[str]) -> str:
+    """Dotted name of a list location: "history.patientConditions", "imaging"."""
+    return f"{section}.{field}" if field else section
+
+
+def get_list(extraction: Dict[str, Any], section: str, field: Any) -> List[Any]:
+    value = extraction.get(section)
+    if field is not None:
+        value = (value or {}).get(field)
+    return value or []
+
+
+def _fingerprint(entry: Any) -> str:
+    return json.dumps(entry, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def merge_extractions(extractions: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge partial extractions: first non-empty patient fields, concatenated lists.
+
+    Entries that are exactly identical across parts are kept once; order
+    follows the order of `extractions`.
+    """
+    extractions = [e for e in extractions if e]
+    merged: Dict[str, Any] = {
+        "patient": {},
+        "history": {},
+        "labs": None,
+        "imaging": [],
+        "followups": [],
+        "visits": None,
+        "notes": [],
+    }
+
+    for extraction in extractions:
+        for key, value in (extraction.get("patient") or {}).items():
+            if merged["patient"].get(key) in (None, "") and value not in (None, ""):
+                merged["patient"][key] = value
+
+    for section, field in LIST_PATHS:
+        seen = set()
+        combined = []
+        for extraction in extractions:
+            for entry in get_list(extraction, section, field):
+                fingerprint = _fingerprint(entry)
+                if fingerprint not in seen:
+                    seen.add(fingerprint)
+                    combined.append(entry)
+
+        if field is None:
+            merged[section] = combined
+        elif section == "history":
+            merged["history"][field] = combined
+        elif combined or any(extraction.get(section) for extraction in extractions):
+            merged[section] = {field: combined}
+
+    if not merged["patient"].get("name"):
+        merged["patient"]["name"] = ""
+    return merged
+
+
+# =============================================================================
+# Keyed diff against an existing record
+# =============================================================================
+def _empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _key_part(field: str, value: Any) -> Any:
+    if _empty(value):
+        return None
+    if field.lower().endswith("date"):
+        # "2024-03-01" and "2024-03-01T00:00:00" (a database timestamp) are one day
+        return str(value)[:10]
+    if isinstance(value, str):
+        return normalize_name(value)
+    return _fingerprint(value)
+
+
+def natural_key(entry: Any, fields: Tuple[str, ...]) -> Any:
+    """Key an entry is matched by: its normalized key fields, else its content."""
+    if isinstance(entry, dict):
+        parts = [_key_part(field, entry.get(field)) for field in fields]
+        if any(part is not None for part in parts):
+            return tuple(parts)
+    return "=" + _fingerprint(entry)
+
+
+def keyed_entries(entries: List[Any], fields: Tuple[str, ...]) -> Dict[Tuple[Any, int], Any]:
+    """Entries by (natural key, occurrence): repeated keys pair up in order."""
+    keyed: Dict[Tuple[Any, int], Any] = {}
+    seen: Dict[Any, int] = {}
+    for entry in entries:
+        key = natural_key(entry, fields)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        keyed[(key, occurrence)] = entry
+    return keyed
+
+
+def _changes(
+    before: Dict[str, Any], after: Dict[str, Any], keys: Tuple[str, ...] = ()
+) -> Dict[str, Any]:
+    """Fields of `after` that add or change information (empty values never erase).
+
+    Key fields matched already; another spelling of them is not a change.
+    """
+    return {
+        field: value
+        for field, value in after.items()
+        if field not in keys
+        and not _empty(value)
+        and value != before.get(field)
+    }
+
+
+def diff_extractions(existing: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
+    """Delta that brings `existing` up to date with `incoming`.
+
+    {
+        "patient": {field: new value},
+        "lists": {"labs.labs": {"added": [...], "updated": [...], "unchanged": n}},
+        "summary": {"added": n, "updated": n, "unchanged": n},
+    }
+
+    An updated entry is {"index": position in the existing list, "key": its
+    natural key fields, "changes": {field: new value}}. Only lists with added
+    or updated entries are listed. An incoming snapshot is not complete, so
+    entries missing from it are never reported as removed.
+    """
+    existing = existing or {}
+    incoming = incoming or {}
+    summary = {"added": 0, "updated": 0, "unchanged": 0}
+    lists: Dict[str, Any] = {}
+
+    for (section, field), fields in NATURAL_KEYS.items():
+        current = get_list(existing, section, field)
+        positions = {id(entry): index for index, entry in enumerate(current)}
+        known = keyed_entries(current, fields)
+        added, updated, unchanged = [], [], 0
+        for key, entry in keyed_entries(get_list(incoming, section, field), fields).items():
+            before = known.get(key)
+            if before is None:
+                added.append(entry)
+                continue
+            changes = (
+                _changes(before, entry, fields)
+                if isinstance(before, dict) and isinstance(entry, dict)
+                else {}
+            )
+            if changes:
+                updated.append(
+                    {
+                        "index": positions[id(before)],
+                        "key": {name: before.get(name) for name in fields},
+                        "changes": changes,
+                    }
+                )
+            else:
+                unchanged += 1
+
+        summary["added"] += len(added)
+        summary["updated"] += len(updated)
+        summary["unchanged"] += unchanged
+        if added or updated:
+            lists[list_name(section, field)] = {
+                "added": added,
+                "updated": updated,
+                "unchanged": unchanged,
+            }
+
+    return {
+        "patient": _changes(existing.get("patient") or {}, incoming.get("patient") or {}),
+        "lists": lists,
+        "summary": summary,
+    }
+
+
+def apply_diff(existing: Dict[str, Any], diff: Dict[str, Any]) -> Dict[str, Any]:
+    """`existing` with a diff from `diff_extractions` applied (a new dict)."""
+    merged = json.loads(json.dumps(existing or {}, default=str))
+    merged["patient"] = {**(merged.get("patient") or {}), **diff["patient"]}
+    for section, field in LIST_PATHS:
+        delta = diff["lists"].get(list_name(section, field))
+        if not delta:
+            continue
+        entries = list(get_list(merged, section, field))
+        for update in delta["updated"]:
+            entries[update["index"]] = {**entries[update["index"]], **update["changes"]}
+        entries.extend(delta["added"])
+        if field is None:
+            merged[section] = entries
+        else:
+            merged[section] = {**(merged.get(section) or {}), field: entries}
+    return merged
+
+
+def merge_into(
+    existing: Dict[str, Any], incoming: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(updated record, diff) of merging `incoming` into `existing` by natural keys."""
+    diff = diff_extractions(existing, incoming)
+    return apply_diff(existing, diff), diff
@@ -0,0 +1,238 @@
+"""
+Negotiated response encodings.
+
+A full MedicalOCR extraction (operative notes, findings, follow-up logs) is
+often hundreds of KB of JSON. Responses are encoded by what the client asks for:
+
+- `Accept: application/msgpack` - MessagePack (needs msgpack), else JSON.
+  JSON is written by orjson when it is installed (several times faster than
+  the json module); the output is the same compact UTF-8 JSON either way.
+- `Accept-Encoding: br` / `gzip` - brotli (needs brotli) or gzip for bodies
+  of at least RESPONSE_COMPRESS_MIN_BYTES. SSE streams are compressed too:
+  the compressor is flushed after every event, so events are not delayed.
+
+Every dependency is optional: without it that choice is simply not offered.
+NegotiatedResponse is the app's default response class, so endpoints return
+dicts as before; sse_response streams are CompressedStreamingResponse.
+"""
+
+import gzip
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict, Mapping, Optional, Tuple
+
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from config import settings
+from metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack responses
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # optional: brotli compression
+    brotli = None
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/x-msgpack")
+
+
+# =============================================================================
+# Serialization
+# =============================================================================
+def dumps_json(content: Any) -> bytes:
+    """Compact UTF-8 JSON, identical to JSONResponse's, via orjson when available."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bit: the json module handles them
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dumps_msgpack(content: Any) -> bytes:
+    if msgpack is None:
+        raise ImportError("MessagePack responses need msgpack. Install with: pip install msgpack")
+    return msgpack.packb(content, use_bin_type=True)
+
+
+# =============================================================================
+# Negotiation
+# =============================================================================
+def _qualities(header: Optional[str]) -> Dict[str, float]:
+    """Accept / Accept-Encoding header -> {lower-case value: q}."""
+    qualities: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        value, _, params = item.strip().partition(";")
+        if not value:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        qualities[value.strip().lower()] = q
+    return qualities
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """"msgpack" if the client prefers it (and it is installed), else "json"."""
+    if msgpack is None or not accept:
+        return "json"
+    qualities = _qualities(accept)
+    msgpack_q = max(qualities.get(t, 0.0) for t in MSGPACK_TYPES)
+    json_q = max(qualities.get(t, 0.0) for t in (JSON_TYPE, "application/*", "*/*"))
+    return "msgpack" if msgpack_q > json_q else "json"
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """"br", "gzip" or None (identity), by the client's preference."""
+    if not settings.RESPONSE_COMPRESSION or not accept_encoding:
+        return None
+    qualities = _qualities(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    candidates = [("br", qualities.get("br", wildcard)), ("gzip", qualities.get("gzip", wildcard))]
+    if brotli is None:
+        candidates = candidates[1:]
+    # Ties go to the first candidate (brotli: smaller at similar speed)
+    name, q = max(candidates, key=lambda c: c[1])
+    return name if q > 0 else None
+
+
+def _request_headers(scope: Scope) -> Tuple[Optional[str], Optional[str]]:
+    """(Accept, Accept-Encoding) of an HTTP scope."""
+    accept = accept_encoding = None
+    for key, value in scope.get("headers", []):
+        if key == b"accept":
+            accept = value.decode("latin-1")
+        elif key == b"accept-encoding":
+            accept_encoding = value.decode("latin-1")
+    return accept, accept_encoding
+
+
+# =============================================================================
+# Compression
+# =============================================================================
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+    return body
+
+
+class StreamCompressor:
+    """Incremental gzip / brotli; `chunk` output is decodable right away."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=settings.RESPONSE_BROTLI_QUALITY)
+        else:
+            # wbits 31: gzip container
+            self._zlib = zlib.compressobj(settings.RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def _vary(headers: Mapping[str, str], *values: str) -> str:
+    existing = [v.strip() for v in headers.get("vary", "").split(",") if v.strip()]
+    return ", ".join(existing + [v for v in values if v not in existing])
+
+
+# =============================================================================
+# Responses
+# =============================================================================
+class NegotiatedResponse(Response):
+    """JSON or MessagePack, compressed or not, chosen from the request headers.
+
+    The body is rendered when the response is sent, because only then are
+    the request headers (the ASGI scope) known.
+    """
+
+    media_type = JSON_TYPE
+
+    def __init__(
+        self,
+        content: Any = None,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        background: Optional[BackgroundTask] = None,
+    ) -> None:
+        self.content = content
+        super().__init__(None, status_code, headers, media_type, background)
+
+    def encode(self, accept: Optional[str], accept_encoding: Optional[str]) -> None:
+        """Render `content` for these request headers (body and headers)."""
+        if self.status_code < 200 or self.status_code in (204, 304):
+            return  # no body allowed
+        body_format = negotiate_format(accept)
+        if body_format == "msgpack":
+            body, media_type = dumps_msgpack(self.content), MSGPACK_TYPE
+        else:
+            body, media_type = dumps_json(self.content), self.media_type
+        encoding = None
+        if len(body) >= settings.RESPONSE_COMPRESS_MIN_BYTES and "content-encoding" not in self.headers:
+            encoding = negotiate_encoding(accept_encoding)
+            body = compress(body, encoding)
+
+        # Set in place: FastAPI adds headers after creating the response
+        self.body = body
+        self.headers["content-length"] = str(len(body))
+        self.headers["content-type"] = media_type
+        if encoding:
+            self.headers["content-encoding"] = encoding
+        self.headers["vary"] = _vary(self.headers, "Accept", "Accept-Encoding")
+        metrics.incr(f"responses.{body_format}.{encoding or 'identity'}")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.encode(*_request_headers(scope))
+        await super().__call__(scope, receive, send)
+
+
+class CompressedStreamingResponse(StreamingResponse):
+    """StreamingResponse compressed by Accept-Encoding, flushed per chunk (SSE)."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        _, accept_encoding = _request_headers(scope)
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding:
+            self.headers["content-encoding"] = encoding
+            self.body_iterator = self._compressed(self.body_iterator, StreamCompressor(encoding))
+        self.headers["vary"] = _vary(self.headers, "Accept-Encoding")
+        metrics.incr(f"responses.stream.{encoding or 'identity'}")
+        await super().__call__(scope, receive, send)
+
+    async def _compressed(
+        self, chunks: AsyncIterator[Any], compressor: StreamCompressor
+    ) -> AsyncIterator[bytes]:
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self.charset)
+            yield compressor.chunk(chunk)
+        yield compressor.finish()
@@ -0,0 +1,236 @@
+"""
+Priority and fair-share admission for document analyses.
+
+Every analysis that needs Gemini runs inside `scheduler.slot(...)`. At most
+SCHEDULER_MAX_CONCURRENT analyses run per worker process; the rest wait in
+one queue per priority class:
+
+* interactive_stream - a doctor watching the SSE progress bar
+* interactive_sync   - a doctor waiting on /analyze
+* batch              - archive imports and other background work
+
+Higher classes are always admitted first, and batch work never occupies the
+last SCHEDULER_RESERVED_INTERACTIVE slots, so interactive latency stays flat
+while a large import is running. Within a class, the client (clinic) with the
+fewest running analyses goes next, so one busy clinic cannot starve another.
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from cancellation import AnalysisCancelled, CancelToken
+from config import settings
+from metrics import metrics
+
+# Highest priority first
+PRIORITY_CLASSES = ("interactive_stream", "interactive_sync", "batch")
+BATCH = "batch"
+
+
+class QueueFull(Exception):
+    """The queue of a priority class is at SCHEDULER_MAX_QUEUE."""
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        super().__init__(f"Too many queued {priority} analyses, try again later")
+
+
+class Saturated(QueueFull):
+    """More analyses per slot than READY_SATURATION_THRESHOLD are running or queued."""
+
+    def __init__(self, priority: str, saturation: float):
+        self.priority = priority
+        self.saturation = saturation
+        Exception.__init__(
+            self, f"Replica saturated ({saturation:.2f} analyses per slot), try again later"
+        )
+
+
+@dataclass
+class _Waiter:
+    priority: str
+    client_id: str
+    seq: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted_at: float = 0.0
+    granted: bool = False
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class AnalysisScheduler:
+    """Bounded concurrency with strict class priority and per-client fair share."""
+
+    def __init__(self, max_concurrent: int, reserved_interactive: int, max_queue: int) -> None:
+        self.max_concurrent = max(1, max_concurrent)
+        self.reserved_interactive = min(max(0, reserved_interactive), self.max_concurrent - 1)
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queues: Dict[str, List[_Waiter]] = {cls: [] for cls in PRIORITY_CLASSES}
+        self._running: Dict[str, int] = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._running_by_client: Dict[str, int] = {}
+        self._admitted: Dict[str, int] = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._waits: Dict[str, Deque[float]] = {
+            cls: deque(maxlen=500) for cls in PRIORITY_CLASSES
+        }
+        self._run_times: Dict[str, Deque[float]] = {
+            cls: deque(maxlen=500) for cls in PRIORITY_CLASSES
+        }
+
+    # -------------------------------------------------------------------------
+    # Admission
+    # -------------------------------------------------------------------------
+    def _has_capacity(self, priority: str) -> bool:
+        if sum(self._running.values()) >= self.max_concurrent:
+            return False
+        if priority == BATCH:
+            return self._running[BATCH] < self.max_concurrent - self.reserved_interactive
+        return True
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            if queue and self._has_capacity(priority):
+                # Fair share: fewest running analyses for the client, then FIFO
+                return min(
+                    queue, key=lambda w: (self._running_by_client.get(w.client_id, 0), w.seq)
+                )
+        return None
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiters. Caller holds the condition."""
+        waiter = self._next_waiter()
+        while waiter is not None:
+            self._queues[waiter.priority].remove(waiter)
+            waiter.granted = True
+            waiter.granted_at = time.monotonic()
+            self._running[waiter.priority] += 1
+            self._running_by_client[waiter.client_id] = (
+                self._running_by_client.get(waiter.client_id, 0) + 1
+            )
+            self._admitted[waiter.priority] += 1
+            self._waits[waiter.priority].append(time.monotonic() - waiter.enqueued_at)
+            waiter = self._next_waiter()
+        self._cond.notify_all()
+
+    def acquire(
+        self,
+        priority: str,
+        client_id: str,
+        cancel_token: Optional[CancelToken] = None,
+        on_queued: Optional[Callable[[int], None]] = None,
+    ) -> _Waiter:
+        """Block until a slot is granted. `on_queued(position)` runs if it has to wait."""
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority: {priority}. Allowed: {', '.join(PRIORITY_CLASSES)}")
+
+        with self._cond:
+            if len(self._queues[priority]) >= self.max_queue:
+                metrics.incr(f"scheduler.rejected.{priority}")
+                raise QueueFull(priority)
+            waiter = _Waiter(priority, client_id, next(self._seq))
+            self._queues[priority].append(waiter)
+            self._dispatch()
+
+            if not waiter.granted:
+                metrics.incr(f"scheduler.queued.{priority}")
+                if on_queued:
+                    on_queued(len(self._queues[priority]))
+            while not waiter.granted:
+                if cancel_token and cancel_token.cancelled:
+                    self._queues[priority].remove(waiter)
+                    raise AnalysisCancelled("queue", cancel_token.reason)
+                self._cond.wait(timeout=0.5)
+        return waiter
+
+    def release(self, waiter: _Waiter) -> None:
+        with self._cond:
+            self._run_times[waiter.priority].append(time.monotonic() - waiter.granted_at)
+            self._running[waiter.priority] -= 1
+            self._running_by_client[waiter.client_id] -= 1
+            if not self._running_by_client[waiter.client_id]:
+                del self._running_by_client[waiter.client_id]
+            self._dispatch()
+
+    @contextmanager
+    def slot(
+        self,
+        priority: str,
+        client_id: str,
+        cancel_token: Optional[CancelToken] = None,
+        on_queued: Optional[Callable[[int], None]] = None,
+    ) -> Iterator[None]:
+        """Run the body with a slot of `priority` held for `client_id`."""
+        waiter = self.acquire(priority, client_id, cancel_token, on_queued)
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    # -------------------------------------------------------------------------
+    # Introspection
+    # -------------------------------------------------------------------------
+    def in_flight(self) -> int:
+        with self._cond:
+            return sum(self._running.values())
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def saturation(self) -> float:
+        """(running + queued) analyses per slot; above 1 means work is waiting."""
+        return (self.in_flight() + self.queue_depth()) / self.max_concurrent
+
+    def latency_p95(self) -> Optional[float]:
+        """Recent p95 of wait + run time over all classes."""
+        with self._cond:
+            totals = [
+                wait + run
+                for priority in PRIORITY_CLASSES
+                for wait, run in zip(self._waits[priority], self._run_times[priority])
+            ]
+        return _percentile(totals, 95)
+
+    def snapshot(self) -> Dict[str, Any]:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+
+        with self._cond:
+            classes = {}
+            for priority in PRIORITY_CLASSES:
+                waits = list(self._waits[priority])
+                run_times = list(self._run_times[priority])
+                classes[priority] = {
+                    "queued": len(self._queues[priority]),
+                    "running": self._running[priority],
+                    "admitted": self._admitted[priority],
+                    "wait_p50_seconds": rounded(_percentile(waits, 50)),
+                    "wait_p95_seconds": rounded(_percentile(waits, 95)),
+                    "run_p95_seconds": rounded(_percentile(run_times, 95)),
+                }
+            return {
+                "max_concurrent": self.max_concurrent,
+                "reserved_interactive": self.reserved_interactive,
+                "in_flight": sum(self._running.values()),
+                "clients": dict(self._running_by_client),
+                "classes": classes,
+            }
+
+
+scheduler = AnalysisScheduler(
+    settings.SCHEDULER_MAX_CONCURRENT,
+    settings.SCHEDULER_RESERVED_INTERACTIVE,
+    settings.SCHEDULER_MAX_QUEUE,
+)
@@ -0,0 +1,98 @@
+"""
+Precomputed JSON schemas and validators for MedicalOCR and its sections.
+
+`model_json_schema()` walks the whole model tree every time it is called and
+TypeAdapters compile their validators on construction. The registry does both
+once, at import time, and the pipeline looks them up by name.
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List
+
+from pydantic import TypeAdapter, create_model
+
+from ocr_types.followup_type import FollowUpEntry
+from ocr_types.history_type import MedicalRecordExtraction
+from ocr_types.imaging_type import ImagingEntry
+from ocr_types.labs_type import LabsExtraction
+from ocr_types.medical_types import MedicalOCR
+from ocr_types.notes_type import NoteEntry
+from ocr_types.patient_type import Patient
+from ocr_types.visit_type import ClinicalVisits
+
+# MedicalOCR field name -> type of that section
+SECTION_TYPES: Dict[str, Any] = {
+    "patient": Patient,
+    "history": MedicalRecordExtraction,
+    "labs": LabsExtraction,
+    "imaging": List[ImagingEntry],
+    "followups": List[FollowUpEntry],
+    "visits": ClinicalVisits,
+    "notes": List[NoteEntry],
+}
+
+
+class SchemaRegistry:
+    """Name -> (JSON schema, TypeAdapter) lookup, computed once per type."""
+
+    def __init__(self) -> None:
+        self._schemas: Dict[str, Dict[str, Any]] = {}
+        self._adapters: Dict[str, TypeAdapter] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, tp: Any) -> None:
+        adapter = TypeAdapter(tp)
+        self._adapters[name] = adapter
+        self._schemas[name] = adapter.json_schema()
+
+    def subset(self, sections: Iterable[str]) -> str:
+        """Name of a MedicalOCR with only `sections`, registered on first use.
+
+        Fields keep their MedicalOCR definitions (descriptions, defaults), so
+        a subset extraction merges like a full one.
+        """
+        wanted = set(sections)
+        ordered = [name for name in SECTION_TYPES if name in wanted]
+        name = "medical_ocr:" + "+".join(ordered)
+        with self._lock:
+            if name not in self._adapters:
+                fields = MedicalOCR.model_fields
+                model = create_model(
+                    "MedicalOCRSections",
+                    **{section: (fields[section].annotation, fields[section]) for section in ordered},
+                )
+                self.register(name, model)
+        return name
+
+    def names(self) -> List[str]:
+        return list(self._schemas)
+
+    def schema(self, name: str) -> Dict[str, Any]:
+        """Cached JSON schema. Treat as read-only: it is shared by all requests."""
+        return self._schemas[name]
+
+    def adapter(self, name: str) -> TypeAdapter:
+        return self._adapters[name]
+
+    def validate_json(self, name: str, data: str) -> Any:
+        return self._adapters[name].validate_json(data)
+
+    def warm(self) -> None:
+        """Exercise every validator and serializer once (first calls are slower)."""
+        sample = MedicalOCR(
+            patient=Patient(name="Warmup"),
+            history=MedicalRecordExtraction(),
+            labs=LabsExtraction(),
+            visits=ClinicalVisits(),
+        )
+        dumped = sample.model_dump(mode="json")
+        self.validate_json("medical_ocr", sample.model_dump_json())
+        for name in SECTION_TYPES:
+            adapter = self._adapters[name]
+            adapter.dump_json(adapter.validate_python(dumped[name]))
+
+
+registry = SchemaRegistry()
+registry.register("medical_ocr", MedicalOCR)
+for _name, _tp in SECTION_TYPES.items():
+    registry.register(_name, _tp)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Check that deadlines and cancellation bound latency during generation.
+
+The model is simulated (evaluation.StubClient) with a first response chunk
+that takes --first-chunk seconds and cannot be interrupted, like a Gemini
+call still processing its input. An analysis with a --deadline-ms budget
+must return its partial result, and an analysis cancelled after --cancel-after
+seconds must raise AnalysisCancelled, without waiting for that chunk.
+Exits with status 1 if either overruns by more than --tolerance seconds.
+
+Run: python scripts/bench_deadline.py --first-chunk 8 --deadline-ms 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from cancellation import AnalysisCancelled, CancelToken  # noqa: E402
+from deadline import Deadline  # noqa: E402
+from evaluation import StubClient  # noqa: E402
+from medical_ocr_fast import analyze_document_streaming  # noqa: E402
+
+
+class SlowStubClient(StubClient):
+    """StubClient whose streamed responses start after `first_chunk` seconds."""
+
+    def __init__(self, first_chunk: float):
+        super().__init__()
+        self.first_chunk = first_chunk
+        self.models.generate_content_stream = self._slow_stream
+
+    def _slow_stream(self, model, contents, config):
+        time.sleep(self.first_chunk)
+        yield self._generate(model, contents, config)
+
+
+def make_pdf(path: str, pages: int) -> None:
+    import fitz
+
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Page {i + 1}: Hemoglobin 13.5 g/dl")
+    doc.save(path)
+    doc.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--first-chunk", type=float, default=8.0, help="Seconds until the first chunk")
+    parser.add_argument("--deadline-ms", type=int, default=2000)
+    parser.add_argument("--cancel-after", type=float, default=1.0, help="Seconds until the cancellation")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Allowed overrun in seconds")
+    args = parser.parse_args()
+
+    client = SlowStubClient(args.first_chunk)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = os.path.join(tmp, "document.pdf")
+        make_pdf(pdf, 2)
+
+        print(f"⏱️ Deadline {args.deadline_ms} ms, first chunk after {args.first_chunk:.1f}s")
+        start = time.perf_counter()
+        result = analyze_document_streaming(
+            pdf, strategy="images", hedge=False, client=client,
+            deadline=Deadline.from_ms(args.deadline_ms),
+        )
+        elapsed = time.perf_counter() - start
+        overran = elapsed > args.deadline_ms / 1000 + args.tolerance
+        failed |= overran
+        print(
+            f"   {'❌' if overran else '✅'} returned after {elapsed:.2f}s "
+            f"(success={result.get('success')}, partial={result.get('partial')})"
+        )
+
+        print(f"🛑 Cancel after {args.cancel_after:.1f}s, first chunk after {args.first_chunk:.1f}s")
+        token = CancelToken()
+        threading.Timer(args.cancel_after, token.cancel, args=("benchmark",)).start()
+        start = time.perf_counter()
+        try:
+            analyze_document_streaming(pdf, strategy="images", hedge=False, client=client, cancel_token=token)
+            outcome = "completed"
+        except AnalysisCancelled as exc:
+            outcome = f"cancelled during {exc.stage}"
+        elapsed = time.perf_counter() - start
+        overran = outcome == "completed" or elapsed > args.cancel_after + args.tolerance
+        failed |= overran
+        print(f"   {'❌' if overran else '✅'} {outcome} after {elapsed:.2f}s")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
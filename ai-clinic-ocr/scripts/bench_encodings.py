@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark response encodings on large synthetic extractions.
+
+Builds an /analyze result with --entries visits, operative notes, imaging
+findings, follow-up logs and labs (English and Arabic text) and measures
+serialization time and bytes on the wire for every combination offered by
+response_encoding: the json module (the former JSONResponse), orjson and
+MessagePack, each uncompressed, gzip and brotli. The SSE part compares a
+stream of progress events plus the result, as sent before (json.dumps per
+event, uncompressed) and now (per-event flushed compression).
+
+Run: python scripts/bench_encodings.py --entries 400
+"""
+
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import response_encoding  # noqa: E402
+from config import settings  # noqa: E402
+from response_encoding import StreamCompressor, compress, dumps_json  # noqa: E402
+
+WORDS = (
+    "patient tolerated procedure well no complications laparoscopic sleeve gastrectomy "
+    "stapler line reinforced drain inserted hemostasis secured mild tenderness epigastric "
+    "advised liquid diet protein supplements follow up two weeks wound clean dry "
+    "المريض تحسن ملحوظ لا يوجد ألم متابعة بعد أسبوعين الجرح نظيف"
+).split()
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_result(entries: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    date = lambda: f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"  # noqa: E731
+    extraction = {
+        "patient": {"name": "Ahmed Ali", "name_ar": "أحمد علي", "phone": "01012345678", "age": 41},
+        "history": {
+            "patientSurgeries": [
+                {"procedureName": "Sleeve gastrectomy", "surgeryDate": date(), "notes": text(rng, 120)}
+                for _ in range(max(1, entries // 20))
+            ],
+            "patientConditions": [
+                {"conditionName": rng.choice(["Hypertension", "Diabetes", "GERD"]), "notes": text(rng, 15)}
+                for _ in range(entries // 10)
+            ],
+        },
+        "labs": {
+            "labs": [
+                {
+                    "testName": rng.choice(["HbA1c", "Fasting glucose", "Hemoglobin", "ALT", "TSH"]),
+                    "labDate": date(),
+                    "results": {"value": f"{rng.uniform(1, 200):.1f}", "unit": "mg/dL",
+                                "reference_range": {"min": "70", "max": "110"}},
+                    "category": "Postoperative",
+                    "status": "Final",
+                    "notes": text(rng, 6),
+                }
+                for _ in range(entries * 2)
+            ]
+        },
+        "imaging": [
+            {"study_name": "Abdominal ultrasound", "image_date": date(),
+             "findings": [text(rng, 12) for _ in range(4)], "impression": text(rng, 20)}
+            for _ in range(entries // 4)
+        ],
+        "followups": [
+            {"call_date": date(), "medication_adherence": [text(rng, 4)], "symptoms": [text(rng, 5)],
+             "diet_activity": {"diet": text(rng, 6), "activity": text(rng, 6)}, "general_notes": text(rng, 30)}
+            for _ in range(entries)
+        ],
+        "visits": {"visits": [
+            {"visit_date": date(), "weight": round(rng.uniform(80, 140), 1), "notes": text(rng, 60)}
+            for _ in range(entries)
+        ]},
+        "notes": [{"title": "Operative note", "content": text(rng, 200), "note_date": date()}
+                  for _ in range(max(1, entries // 20))],
+    }
+    return {
+        "success": True, "file": "document.pdf", "model": settings.GEMINI_MODEL,
+        "extraction": extraction, "usage": {"input_tokens": 48211, "output_tokens": 30122},
+        "timing": {"total_seconds": 41.2}, "timestamp": "2024-06-01T10:00:00",
+    }
+
+
+def best_of(fn, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        timings.append(time.perf_counter() - start)
+    return value, min(timings)
+
+
+def json_module(content: dict) -> bytes:
+    """What JSONResponse did before: the json module."""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entries", type=int, default=400, help="Visits / follow-ups (labs: twice as many)")
+    parser.add_argument("--events", type=int, default=30, help="SSE progress events before the result")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    result = make_result(args.entries, args.seed)
+    serializers = {"json module": json_module}
+    if response_encoding.orjson is not None:
+        serializers["orjson"] = dumps_json
+    else:
+        print("⚠️  orjson not installed: dumps_json uses the json module")
+    if response_encoding.msgpack is not None:
+        serializers["msgpack"] = response_encoding.dumps_msgpack
+    else:
+        print("⚠️  msgpack not installed: skipping MessagePack")
+    encodings = [None, "gzip"] + (["br"] if response_encoding.brotli is not None else [])
+    if response_encoding.brotli is None:
+        print("⚠️  brotli not installed: skipping brotli")
+
+    baseline_bytes = len(json_module(result))
+    print(f"📦 Result with {args.entries} entries: {baseline_bytes / 1024:,.0f} KB of JSON\n")
+    print(f"{'Serializer':<13}{'Encoding':<10}{'Serialize':>11}{'Compress':>10}{'Total':>9}{'Bytes':>11}{'Ratio':>8}")
+    for name, serialize in serializers.items():
+        body, serialize_time = best_of(lambda: serialize(result), args.repeat)
+        for encoding in encodings:
+            wire, compress_time = best_of(lambda: compress(body, encoding), args.repeat)
+            print(
+                f"{name:<13}{encoding or 'identity':<10}{serialize_time * 1000:>9.2f}ms"
+                f"{compress_time * 1000:>8.2f}ms{(serialize_time + compress_time) * 1000:>7.1f}ms"
+                f"{len(wire):>11,}{len(wire) / baseline_bytes:>8.1%}"
+            )
+
+    # SSE: progress events then the result event, as /analyze/stream sends them
+    events = [{"percent": p, "message": "analyzing document"} for p in range(0, 100, max(1, 100 // args.events))]
+    events.append(result)
+
+    def sse_before() -> bytes:
+        return b"".join(f"event: progress\ndata: {json.dumps(e)}\n\n".encode() for e in events)
+
+    def sse_now(encoding):
+        def run() -> bytes:
+            compressor = StreamCompressor(encoding) if encoding else None
+            out = []
+            for e in events:
+                chunk = f"event: progress\ndata: {dumps_json(e).decode()}\n\n".encode()
+                out.append(compressor.chunk(chunk) if compressor else chunk)
+            if compressor:
+                out.append(compressor.finish())
+            return b"".join(out)
+
+        return run
+
+    print(f"\n📡 SSE stream ({len(events)} events)")
+    before, before_time = best_of(sse_before, args.repeat)
+    print(f"   {'before (json.dumps)':<26}{before_time * 1000:>8.2f}ms{len(before):>11,} bytes")
+    for encoding in encodings:
+        wire, elapsed = best_of(sse_now(encoding), args.repeat)
+        print(f"   {'now, ' + (encoding or 'identity'):<26}{elapsed * 1000:>8.2f}ms{len(wire):>11,} bytes")
+    # Sanity check: a gzip stream flushed per event decodes to the same events
+    assert gzip.decompress(sse_now("gzip")()) == sse_now(None)()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark lab normalization and aggregation on synthetic extracted labs.
+
+Generates --labs lab results of --patients patients with values, units and
+reference ranges written the way Gemini returns them ("5,2", "<0.5", "mg/dl",
+"mmol/L", {"min": "70", "max": "110"}) and compares two ways to get the
+per-test summary (mean, high / low counts, patients) across all patients:
+
+- row by row: parse, convert and aggregate each result in Python
+- lab_table: build the columnar LabTable once, then summarize with NumPy
+
+Run: python scripts/bench_lab_table.py --labs 500000 --patients 20000
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lab_table import (  # noqa: E402
+    CANONICAL_UNITS,
+    CONVERSIONS,
+    build_lab_table,
+    canonical_test,
+    canonical_unit,
+)
+
+# (test name spellings, units with their typical value range, reference range)
+TESTS = [
+    (["FBS", "Fasting blood sugar", "fasting glucose"], [("mg/dl", 70, 250), ("mmol/L", 3.9, 14)], ("70", "110")),
+    (["HbA1c", "A1c"], [("%", 4.5, 12), ("mmol/mol", 26, 108)], ("4", "5.6")),
+    (["Hb", "Hemoglobin", "HGB"], [("g/dl", 8, 17), ("g/L", 80, 170)], ("12", "16")),
+    (["Creatinine", "S. Creatinine"], [("mg/dl", 0.5, 3), ("umol/L", 44, 265)], ("0.6", "1.2")),
+    (["ALT", "SGPT"], [("U/L", 8, 120)], ("0", "41")),
+    (["CRP"], [("mg/L", 0.3, 80)], ("0", "5")),
+    (["TSH"], [("uIU/mL", 0.1, 9)], ("0.4", "4.2")),
+    (["Platelets", "PLT"], [("x10^3/uL", 90, 450)], ("150", "450")),
+]
+
+
+def make_lab(rng: random.Random) -> dict:
+    names, units, (low, high) = rng.choice(TESTS)
+    unit, lo, hi = rng.choice(units)
+    value = round(rng.uniform(lo, hi), 1)
+    text = str(value)
+    roll = rng.random()
+    if roll < 0.1:
+        text = text.replace(".", ",")
+    elif roll < 0.13:
+        text = f"<{value}"
+    elif roll < 0.15:
+        text = "Negative"
+    return {
+        "testName": rng.choice(names),
+        "labDate": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "results": {
+            "value": text,
+            "unit": rng.choice([unit, unit.lower(), unit.upper()]),
+            "reference_range": {"min": low, "max": high},
+        },
+    }
+
+
+_VALUE = re.compile(r"^\s*([<>])?\s*([-+]?\d+(?:[.,]\d+)?)")
+
+
+def row_by_row(records: list) -> dict:
+    """Baseline: per-result parsing, conversion and aggregation in Python."""
+    groups: dict = defaultdict(lambda: {"n": 0, "sum": 0.0, "high": 0, "low": 0, "patients": set()})
+    for record_id, labs in records:
+        for lab in labs:
+            results = lab["results"]
+            test, analyte = canonical_test(lab["testName"])
+            unit = canonical_unit(results["unit"])
+            match = _VALUE.match(results["value"])
+            value = float(match[2].replace(",", ".")) if match else None
+            low = float(results["reference_range"]["min"])
+            high = float(results["reference_range"]["max"])
+            factor, offset = CONVERSIONS.get((analyte, unit), (1.0, 0.0))
+            if (analyte, unit) in CONVERSIONS:
+                unit = CANONICAL_UNITS[analyte]
+            group = groups[(test, unit)]
+            group["patients"].add(record_id)
+            if value is not None:
+                value = value * factor + offset
+                if not match[1]:
+                    # Censored results are not averaged
+                    group["n"] += 1
+                    group["sum"] += value
+                group["high"] += value > high * factor + offset
+                group["low"] += value < low * factor + offset
+    return groups
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--labs", type=int, default=500_000, help="Lab results")
+    parser.add_argument("--patients", type=int, default=20_000, help="Patients (records)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"🧪 Generating {args.labs:,} lab results of {args.patients:,} patients...")
+    per_patient: dict = defaultdict(list)
+    for _ in range(args.labs):
+        per_patient[rng.randrange(args.patients)].append(make_lab(rng))
+    records = sorted(per_patient.items())
+
+    start = time.perf_counter()
+    baseline = row_by_row(records)
+    naive = time.perf_counter() - start
+    print(f"   Row by row: {naive:.2f}s for every summary ({len(baseline)} test/unit groups)")
+
+    start = time.perf_counter()
+    table = build_lab_table(records)
+    built = time.perf_counter() - start
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        summary = table.summary()
+        timings.append(time.perf_counter() - start)
+    print(f"   LabTable:   built once in {built:.2f}s, summary in {min(timings) * 1000:.1f}ms ({len(summary)} groups)")
+
+    start = time.perf_counter()
+    glucose = table.filter(table.equals("test", "Fasting glucose"))
+    high = int(glucose.equals("flag", "H").sum())
+    print(
+        f"   Ad-hoc query (high fasting glucose): {high:,} of {len(glucose):,} "
+        f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
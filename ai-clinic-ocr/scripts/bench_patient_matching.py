@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Benchmark duplicate-patient matching on synthetic Egyptian patients.
+
+Builds a PatientIndex of --patients synthetic patients (Arabic name, one of
+several English spellings, phones in mixed formats, dob) and queries it with
+re-extractions of known patients, written differently: another
+transliteration, Arabic letter variants, another phone format, missing fields.
+Reports build time, query latency and how often the right patient is ranked
+first. For comparison a full scan with fuzzy string matching is timed on a
+slice of the same data.
+
+Run: python scripts/bench_patient_matching.py --patients 300000 --queries 2000
+"""
+
+import argparse
+import difflib
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from patient_matching import PatientIndex  # noqa: E402
+
+# (Arabic, English spellings)
+FIRST_NAMES = [
+    ("محمد", ["Mohamed", "Mohammed", "Muhammad", "Mohamad"]),
+    ("أحمد", ["Ahmed", "Ahmad"]),
+    ("محمود", ["Mahmoud", "Mahmud"]),
+    ("مصطفى", ["Mostafa", "Moustafa", "Mustafa"]),
+    ("خالد", ["Khaled", "Khalid"]),
+    ("يوسف", ["Youssef", "Yousef", "Yusuf"]),
+    ("عمرو", ["Amr", "Amro"]),
+    ("حسن", ["Hassan", "Hasan"]),
+    ("حسين", ["Hussein", "Hossein", "Hussien"]),
+    ("إبراهيم", ["Ibrahim", "Ebrahim"]),
+    ("عبد الرحمن", ["Abdelrahman", "Abdel Rahman", "Abdulrahman"]),
+    ("عبد الله", ["Abdullah", "Abdallah"]),
+    ("طارق", ["Tarek", "Tariq"]),
+    ("شريف", ["Sherif", "Sharif"]),
+    ("كريم", ["Karim", "Kareem"]),
+    ("وليد", ["Walid", "Waleed"]),
+    ("سامح", ["Sameh"]),
+    ("جمال", ["Gamal", "Jamal"]),
+    ("فاطمة", ["Fatma", "Fatima", "Fatmah"]),
+    ("مريم", ["Mariam", "Maryam"]),
+    ("نورا", ["Noura", "Nora"]),
+    ("هدى", ["Hoda", "Huda"]),
+    ("منى", ["Mona", "Muna"]),
+    ("إيمان", ["Eman", "Iman"]),
+    ("شيماء", ["Shaimaa", "Shaima"]),
+    ("ياسمين", ["Yasmin", "Yasmine"]),
+    ("سارة", ["Sara", "Sarah"]),
+    ("رانيا", ["Rania", "Ranya"]),
+    ("دينا", ["Dina", "Deena"]),
+    ("هبة", ["Heba", "Hiba"]),
+]
+FAMILY_NAMES = [
+    ("السيد", ["El Sayed", "Elsayed", "Al Sayed"]),
+    ("عبد العزيز", ["Abdel Aziz", "Abdelaziz"]),
+    ("الشريف", ["El Sherif", "Elsherif"]),
+    ("سليمان", ["Soliman", "Suleiman"]),
+    ("فاروق", ["Farouk", "Farouq"]),
+    ("رمضان", ["Ramadan", "Ramdan"]),
+    ("عثمان", ["Osman", "Othman"]),
+    ("منصور", ["Mansour", "Mansur"]),
+    ("الشافعي", ["El Shafei", "Elshafey"]),
+    ("زكي", ["Zaki", "Zaky"]),
+    ("بدوي", ["Badawy", "Badawi"]),
+    ("قاسم", ["Kassem", "Qasem"]),
+    ("نصر", ["Nasr", "Naser"]),
+    ("غنيم", ["Ghoneim", "Ghonim"]),
+]
+ARABIC_VARIANTS = str.maketrans({"أ": "ا", "إ": "ا", "ى": "ي", "ة": "ه"})
+ARABIC_DIGITS = str.maketrans("0123456789", "٠١٢٣٤٥٦٧٨٩")
+
+
+def phone_formats(local: str, rng: random.Random) -> str:
+    """The same mobile number as clinics write it."""
+    return rng.choice(
+        [
+            local,
+            f"+20 {local[1:4]} {local[4:7]} {local[7:]}",
+            f"0020{local[1:]}",
+            local[1:],
+            f"{local[:4]}-{local[4:]}",
+            local.translate(ARABIC_DIGITS),
+        ]
+    )
+
+
+def make_patient(rng: random.Random) -> dict:
+    parts = [rng.choice(FIRST_NAMES), rng.choice(FIRST_NAMES), rng.choice(FIRST_NAMES + FAMILY_NAMES)]
+    if rng.random() < 0.5:
+        parts.append(rng.choice(FAMILY_NAMES))
+    phone = "01" + rng.choice("0125") + "".join(rng.choice("0123456789") for _ in range(8))
+    dob = date(1940, 1, 1) + timedelta(days=rng.randrange(30000))
+    return {
+        "parts": parts,
+        "phone": phone,
+        "dob": dob.isoformat(),
+    }
+
+
+def render(truth: dict, rng: random.Random, variant: bool) -> dict:
+    """Patient fields as one extraction would read them."""
+    english = " ".join(rng.choice(spellings) for _, spellings in truth["parts"])
+    arabic = " ".join(arabic for arabic, _ in truth["parts"])
+    patient = {"name": english, "name_ar": arabic, "phone": truth["phone"], "dob": truth["dob"]}
+    if not variant:
+        return patient
+    patient["phone"] = phone_formats(truth["phone"], rng)
+    patient["name_ar"] = arabic.translate(ARABIC_VARIANTS)
+    # Missing fields, as on a lab sheet or a handwritten form
+    dropped = rng.choice(["none", "none", "phone", "dob", "name_ar", "name"])
+    if dropped != "none":
+        patient[dropped] = None
+    if rng.random() < 0.3 and patient["name"]:
+        # Only first name + father on the document
+        patient["name"] = " ".join(patient["name"].split()[:2])
+    return patient
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def naive_scan(records: list, query: dict) -> int:
+    """Baseline: fuzzy-compare the query with every record."""
+    best, best_id = 0.0, -1
+    for patient_id, patient in records:
+        score = difflib.SequenceMatcher(None, query.get("name") or "", patient["name"]).ratio()
+        if query.get("phone") and query.get("phone") == patient["phone"]:
+            score += 1
+        if score > best:
+            best, best_id = score, patient_id
+    return best_id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--patients", type=int, default=300_000, help="Indexed patients")
+    parser.add_argument("--queries", type=int, default=2000, help="Re-extractions to match")
+    parser.add_argument("--scan-slice", type=int, default=20_000, help="Records for the full-scan baseline")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"🧪 Generating {args.patients} synthetic patients...")
+    truths = [make_patient(rng) for _ in range(args.patients)]
+    records = [(idx, render(truth, rng, variant=False)) for idx, truth in enumerate(truths)]
+
+    index = PatientIndex()
+    start = time.perf_counter()
+    index.add_many(records)
+    build = time.perf_counter() - start
+    stats = index.stats()
+    print(
+        f"   Index built in {build:.1f}s ({args.patients / build:,.0f} patients/s): "
+        f"{stats['blocks']:,} blocks, largest {stats['largest_block']}, "
+        f"{stats['oversized_blocks']} skipped as unselective"
+    )
+
+    latencies, hits, found = [], 0, 0
+    for _ in range(args.queries):
+        patient_id = rng.randrange(args.patients)
+        query = render(truths[patient_id], rng, variant=True)
+        start = time.perf_counter()
+        matches = index.match(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if matches and matches[0]["patient_id"] == patient_id:
+            hits += 1
+        if any(m["patient_id"] == patient_id for m in matches):
+            found += 1
+
+    print(
+        f"   Indexed match: p50 {statistics.median(latencies):.3f}ms"
+        f"   p95 {percentile(latencies, 95):.3f}ms   p99 {percentile(latencies, 99):.3f}ms"
+    )
+    print(
+        f"   Right patient ranked first {hits / args.queries:.1%}, "
+        f"among candidates {found / args.queries:.1%}"
+    )
+
+    scan_records = [(idx, patient) for idx, patient in records[: args.scan_slice]]
+    scan_queries = 20
+    start = time.perf_counter()
+    for _ in range(scan_queries):
+        patient_id = rng.randrange(len(scan_records))
+        naive_scan(scan_records, render(truths[patient_id], rng, variant=True))
+    per_query = (time.perf_counter() - start) / scan_queries * 1000
+    extrapolated = per_query * args.patients / len(scan_records)
+    print(
+        f"   Full fuzzy scan of {len(scan_records):,} records: {per_query:.0f}ms per query "
+        f"(~{extrapolated / 1000:.1f}s for {args.patients:,})"
+    )
+
+
+if __name__ == "__main__":
+    main()
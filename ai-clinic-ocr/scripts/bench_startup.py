@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start cost of the OCR service: import time and RSS of `api:app`.
+
+Each run imports the app in a fresh interpreter. With --max-seconds and/or
+--max-rss-mb the script exits non-zero when the median exceeds the limit, so
+CI catches cold-start regressions (e.g. a heavy import on the startup path).
+
+Run: python scripts/bench_startup.py --runs 5 --top 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).parent.parent
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+from api import app
+elapsed = time.perf_counter() - start
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mb": rss_mb,
+    "modules": len(sys.modules),
+    "pymupdf_loaded": "fitz" in sys.modules,
+    "paddle_loaded": "paddle" in sys.modules or "paddleocr" in sys.modules,
+}))
+"""
+
+
+def probe_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=SERVICE_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def top_imports(limit: int) -> list:
+    """Slowest modules by cumulative import time (python -X importtime)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api"],
+        cwd=SERVICE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        if name.strip() != "api":
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--top", type=int, default=0, help="Show the N slowest imports")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail above this median import time")
+    parser.add_argument("--max-rss-mb", type=float, default=None, help="Fail above this median RSS")
+    args = parser.parse_args()
+
+    print("🚦 Measuring cold start of api:app...")
+    runs = [probe_once() for _ in range(args.runs)]
+    seconds = statistics.median(r["seconds"] for r in runs)
+    rss_mb = statistics.median(r["rss_mb"] for r in runs)
+
+    print(f"   Import time: {seconds:.3f}s median (min {min(r['seconds'] for r in runs):.3f}s)")
+    print(f"   RSS:         {rss_mb:.1f} MB median")
+    print(f"   Modules:     {runs[-1]['modules']}")
+    print(f"   PyMuPDF loaded at import: {runs[-1]['pymupdf_loaded']}")
+    print(f"   Paddle loaded at import:  {runs[-1]['paddle_loaded']}")
+
+    if args.top:
+        print(f"\n🐢 Slowest {args.top} imports (cumulative):")
+        for cumulative_us, name in top_imports(args.top):
+            print(f"   {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if args.max_seconds is not None and seconds > args.max_seconds:
+        failures.append(f"import time {seconds:.3f}s > {args.max_seconds}s")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB > {args.max_rss_mb} MB")
+    if runs[-1]["paddle_loaded"]:
+        failures.append("Paddle is imported on the startup path")
+
+    if failures:
+        print("\n❌ Cold start regression:")
+        for failure in failures:
+            print(f"   - {failure}")
+        sys.exit(1)
+    print("\n✅ Cold start within limits")
+
+
+if __name__ == "__main__":
+    main()
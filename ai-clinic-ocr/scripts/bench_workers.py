@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark throughput of the Python-side pipeline work by worker process count.
+
+Each job does what a worker does around a Gemini call, minus the network:
+render a synthetic multi-page PDF to JPEG parts, validate a large MedicalOCR
+JSON payload, and go through the shared SQLite state (rate budget + result
+cache). Jobs are spread over N processes sharing one state database, like
+`uvicorn api:app --workers N`.
+
+Run: python scripts/bench_workers.py --workers 1,2,4 --jobs 32
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def make_pdf(path: str, pages: int) -> None:
+    import fitz
+
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        for line in range(40):
+            page.insert_text(
+                (50, 60 + line * 18), f"Page {i + 1} line {line}: Hemoglobin 13.5 g/dl"
+            )
+    doc.save(path)
+    doc.close()
+
+
+def make_payload(entries: int) -> str:
+    return json.dumps(
+        {
+            "patient": {"name": "Benchmark Patient", "phone": "01000000000"},
+            "history": {
+                "patientConditions": [
+                    {"conditionName": f"Condition {i}", "notes": "x" * 200}
+                    for i in range(entries)
+                ],
+                "patientMedications": [
+                    {"drugName": f"Drug {i}", "dosage": "10mg"} for i in range(entries)
+                ],
+            },
+            "labs": {
+                "labs": [
+                    {"testName": f"Test {i}", "results": {"value": "5.2", "unit": "mg/dL"}}
+                    for i in range(entries)
+                ]
+            },
+        }
+    )
+
+
+def init_worker(state_path: str) -> None:
+    os.environ["SHARED_STATE_PATH"] = state_path
+    os.environ.setdefault("GEMINI_REQUESTS_PER_MINUTE", "600000")
+
+
+def run_job(args: tuple) -> float:
+    job_id, pdf_path, payload = args
+    from medical_ocr_fast import render_pdf_pages
+    from ocr_types.medical_types import MedicalOCR
+    from shared_state import acquire_gemini_budget, get_shared_state
+
+    start = time.perf_counter()
+    render_pdf_pages(pdf_path)
+    acquire_gemini_budget("benchmark")
+    extraction = MedicalOCR.model_validate_json(payload).model_dump(mode="json")
+    get_shared_state().cache_put(
+        f"bench:{os.getpid()}:{job_id}", {"success": True, "extraction": extraction}, 60
+    )
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--jobs", type=int, default=32, help="Jobs per run")
+    parser.add_argument("--pages", type=int, default=4, help="Pages per synthetic PDF")
+    parser.add_argument("--entries", type=int, default=200, help="List entries per section")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "bench.pdf")
+        make_pdf(pdf_path, args.pages)
+        payload = make_payload(args.entries)
+
+        print(f"🏁 {args.jobs} jobs, {args.pages} pages, {args.entries} entries/section")
+        print(f"{'workers':>8} {'seconds':>9} {'jobs/s':>8} {'speedup':>8}")
+
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(",")]:
+            state_path = os.path.join(tmp, f"state_{workers}.db")
+            jobs = [(i, pdf_path, payload) for i in range(args.jobs)]
+            with Pool(workers, initializer=init_worker, initargs=(state_path,)) as pool:
+                # Warm every process (imports) before timing
+                pool.map(run_job, jobs[:workers], chunksize=1)
+                start = time.perf_counter()
+                pool.map(run_job, jobs, chunksize=1)
+                elapsed = time.perf_counter() - start
+
+            throughput = args.jobs / elapsed
+            baseline = baseline or throughput
+            print(f"{workers:>8} {elapsed:>9.2f} {throughput:>8.1f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare two sets of extractions field by field (model or SDK regressions).
+
+OLD and NEW are each a directory of saved results (`*_fast.json`) or an
+extraction store database. Documents are paired by content hash; agreement
+is reported per section and per field, with the documents that changed most.
+See extraction_diff for how facts are compared.
+
+Run: python scripts/diff_extractions.py output/flash-lite/ output/flash/
+     python scripts/diff_extractions.py data/extractions.db data/extractions.db \\
+         --old-model gemini-2.5-flash-lite --new-model gemini-2.5-flash --output diff.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from extraction_diff import compare_sources, open_source  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("old", help="Reference results: directory of *_fast.json or extraction store")
+    parser.add_argument("new", help="Results to check: directory of *_fast.json or extraction store")
+    parser.add_argument("--old-model", help="Only extractions of this model (extraction store)")
+    parser.add_argument("--new-model", help="Only extractions of this model (extraction store)")
+    parser.add_argument("--fields", type=int, default=15, help="Least-agreeing fields shown")
+    parser.add_argument("--min-facts", type=int, default=5, help="Fields with fewer facts are not listed")
+    parser.add_argument("--worst", type=int, default=10, help="Least-agreeing documents kept")
+    parser.add_argument("--output", help="Save the full report as JSON")
+    args = parser.parse_args()
+
+    try:
+        old = open_source(args.old, args.old_model)
+        new = open_source(args.new, args.new_model)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    report = compare_sources(old, new, worst=args.worst, min_facts=args.min_facts)
+    elapsed = time.perf_counter() - start
+    documents = report["documents"]
+    print(f"🔍 {report['old']}  →  {report['new']}")
+    print(
+        f"   {documents['compared']:,} documents compared in {elapsed:.1f}s: "
+        f"{documents['identical']:,} identical, {documents['compared'] - documents['identical']:,} changed"
+    )
+    print(
+        f"   only old {documents['only_old']:,}, only new {documents['only_new']:,}, "
+        f"duplicates {documents['duplicates']:,}"
+    )
+    for side in ("old", "new"):
+        if documents[f"skipped_{side}"]:
+            skipped = ", ".join(f"{reason} {count}" for reason, count in documents[f"skipped_{side}"].items())
+            print(f"   ⏭️  skipped {side}: {skipped}")
+
+    print(f"\n{'Section':<40}{'F1':>7}{'Kept':>7}{'Conf.':>7}{'Old facts':>11}{'New facts':>11}")
+    for name, row in [("overall", report["overall"]), *report["sections"].items()]:
+        if row["expected"] or row["predicted"] or name == "overall":
+            print(
+                f"{name:<40}{row['f1']:>7.3f}{row['recall']:>7.3f}{row['precision']:>7.3f}"
+                f"{row['expected']:>11,}{row['predicted']:>11,}"
+            )
+    print("Kept: share of old facts the new results reproduce. Conf.: share of new facts the old had.")
+
+    changed = [(path, row) for path, row in report["fields"].items() if row["f1"] < 1.0]
+    if changed:
+        print(f"\n{'Least-agreeing fields':<40}{'F1':>7}{'Kept':>7}{'Conf.':>7}{'Old facts':>11}{'New facts':>11}")
+        for path, row in changed[: args.fields]:
+            print(
+                f"{path[:39]:<40}{row['f1']:>7.3f}{row['recall']:>7.3f}{row['precision']:>7.3f}"
+                f"{row['expected']:>11,}{row['predicted']:>11,}"
+            )
+
+    if report["worst"]:
+        print("\n📉 Least-agreeing documents:")
+        for entry in report["worst"]:
+            sections = ", ".join(f"{name} {f1:.2f}" for name, f1 in entry["sections"].items())
+            name = Path(str(entry["new"]["file"] or entry["old"]["file"] or entry["sha256"][:12])).name
+            print(f"   {entry['f1']:.3f}  {name}  ({sections})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Saved report to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Score pipeline variants on a labelled document set, offline.
+
+Every --variant (model, strategy, dpi, schema, chunk_pages) is run over the
+documents of DATASET that have a `<stem>.truth.json`, and reported with its
+field-level precision / recall / F1, tokens, cost, latency and bytes sent
+per document. Variants on the Pareto front (no other variant has better or
+equal quality, cost and latency) are starred.
+
+Model responses come from --recordings (replayed, keyed by request) or from
+--stub (the ground truth itself: measures cost and schema coverage only).
+With --record, responses missing from --recordings are recorded through
+Gemini (GEMINI_API_KEY) first; later runs need no network.
+
+Run: python scripts/evaluate_pipeline.py eval_set/ --recordings eval_set/recordings \\
+         --variant strategy=images,dpi=144 --variant strategy=images,dpi=96 \\
+         --variant strategy=text,schema=core --output evaluation.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from evaluation import (  # noqa: E402
+    RecordedClient,
+    StubClient,
+    Variant,
+    evaluate_variant,
+    load_dataset,
+    pareto_front,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("dataset", help="Directory of documents with <stem>.truth.json ground truth")
+    parser.add_argument(
+        "--variant",
+        action="append",
+        default=[],
+        help='e.g. "model=gemini-2.5-flash,strategy=images,dpi=96,schema=core,chunk_pages=5" (repeatable)',
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--recordings", help="Directory of recorded model responses")
+    source.add_argument("--stub", action="store_true", help="Answer with the ground truth (cost only)")
+    parser.add_argument("--record", action="store_true", help="Record missing responses through Gemini")
+    parser.add_argument(
+        "--replay-latency", action="store_true", help="Replayed calls take their recorded time"
+    )
+    parser.add_argument("--output", help="Save the full report (per document and section) as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args()
+    if args.record and not args.recordings:
+        parser.error("--record needs --recordings")
+
+    try:
+        variants = [Variant.parse(spec) for spec in args.variant or [""]]
+    except ValueError as e:
+        parser.error(str(e))
+    documents = load_dataset(args.dataset)
+    if not documents:
+        parser.error(f"No documents with *.truth.json in {args.dataset}")
+
+    if args.stub:
+        client = StubClient()
+    else:
+        real = None
+        if args.record:
+            from medical_ocr_fast import _make_client
+
+            real = _make_client(None)
+        client = RecordedClient(args.recordings, real, replay_latency=args.replay_latency)
+
+    print(f"📚 {len(documents)} documents, {len(variants)} variants\n")
+    reports = []
+    for variant in variants:
+        report = evaluate_variant(variant, documents, client, verbose=args.verbose)
+        reports.append(report)
+        for failure in report["failures"]:
+            print(f"   ❌ {variant.name}: {failure['document']}: {failure['error']}")
+    pareto_front(reports)
+
+    print(
+        f"{'':2}{'Variant':<40}{'F1':>7}{'Prec':>7}{'Recall':>7}{'Tokens':>9}"
+        f"{'USD':>10}{'Latency':>9}{'KB sent':>9}{'Failed':>7}"
+    )
+    for report in sorted(reports, key=lambda r: -r["f1"]):
+        tokens = report["prompt_tokens"] + report["output_tokens"]
+        print(
+            f"{'★ ' if report['pareto'] else '  '}{report['variant']['name'][:39]:<40}"
+            f"{report['f1']:>7.3f}{report['precision']:>7.3f}{report['recall']:>7.3f}{tokens:>9,}"
+            f"{report['cost_usd']:>10.5f}{report['latency_seconds']:>8.2f}s"
+            f"{report['bytes_sent'] / 1024:>9,.0f}{report['failed']:>7}"
+        )
+    print("\n★ Pareto-optimal (quality, cost, latency). Tokens, USD, latency and KB are per document.")
+    incomplete = [r["variant"]["name"] for r in reports if r["missing_recordings"]]
+    if incomplete:
+        print(f"⚠️  Missing recordings (record with --record): {', '.join(incomplete)}")
+    if isinstance(client, RecordedClient) and client.recorded:
+        print(f"🎙️  Recorded {client.recorded} new responses to {args.recordings}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"documents": len(documents), "variants": reports}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Saved report to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Export extracted lab results as a columnar table.
+
+Reads the labs of the extraction store (default) or of saved analysis results,
+normalizes values, units and reference ranges (lab_table.build_lab_table) and
+writes them as Parquet (needs pyarrow) or compressed NumPy (.npz). Prints a
+per-test summary across all patients.
+
+Run: python scripts/export_labs.py --output output/labs.parquet
+     python scripts/export_labs.py --results "output/**/*_fast.json" --output labs.npz
+"""
+
+import argparse
+import glob
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lab_table import build_lab_table, labs_from_results, labs_from_store  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--results", nargs="+", help="*_fast.json files or globs (default: the extraction store)")
+    parser.add_argument("--output", default="output/labs.npz", help="Target .parquet or .npz file")
+    parser.add_argument("--no-convert", action="store_true", help="Keep the extracted units")
+    parser.add_argument("--top", type=int, default=20, help="Tests shown in the summary")
+    args = parser.parse_args()
+
+    if args.results:
+        paths = sorted({Path(p) for pattern in args.results for p in glob.glob(pattern, recursive=True)})
+        print(f"🧪 Reading labs of {len(paths)} result files...")
+        source = labs_from_results(paths)
+    else:
+        print("🧪 Reading labs from the extraction store...")
+        source = labs_from_store()
+
+    start = time.perf_counter()
+    table = build_lab_table(source, convert=not args.no_convert)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    summary = table.summary()
+    aggregated = time.perf_counter() - start
+    print(
+        f"   {len(table):,} results of {len(set(table['record'].tolist())):,} records: "
+        f"built in {built * 1000:.0f}ms, summarized in {aggregated * 1000:.1f}ms"
+    )
+
+    print(f"\n{'Test':<28}{'Unit':<10}{'Results':>9}{'Patients':>10}{'Mean':>10}{'Censored':>10}{'High':>7}{'Low':>7}")
+    for row in summary[: args.top]:
+        mean = f"{row['mean']:.2f}" if row["mean"] is not None else "-"
+        print(
+            f"{row['test'][:27]:<28}{row['unit'][:9]:<10}{row['results']:>9}{row['patients']:>10}"
+            f"{mean:>10}{row['censored']:>10}{row['high']:>7}{row['low']:>7}"
+        )
+
+    try:
+        path = table.save(args.output)
+    except ImportError as e:
+        print(f"⚠️  {e}")
+        path = table.save(str(Path(args.output).with_suffix(".npz")))
+    print(f"\n💾 Saved to: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Cross-process shared state for multi-worker serving.
+
+When the service runs several uvicorn worker processes in one container, each
+process has its own memory. This module coordinates them through a single
+SQLite database on local disk (WAL mode, `BEGIN IMMEDIATE` for writes):
+
+- Result cache: finished extractions keyed by document hash + model.
+- In-flight deduplication: the first worker to claim a key runs the analysis,
+  other workers wait for its cached result instead of calling Gemini again.
+- Rate budget: a token bucket for Gemini requests shared by all workers, so
+  adding processes does not multiply API bursts.
+- Stream events: the events of every /analyze/stream analysis, so a client
+  can resume it through any worker (see stream_buffer).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cancellation import CancelToken
+from config import settings
+from metrics import metrics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inflight (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS streams (
+    analysis_id TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    -- A client of another worker follows the stream until then
+    attached_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS stream_events (
+    analysis_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (analysis_id, seq)
+) WITHOUT ROWID;
+"""
+
+# A running stream whose worker died is forgotten after this long
+RUNNING_STREAM_TTL_SECONDS = 24 * 3600
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file in chunks without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SharedState:
+    """SQLite-backed cache, lease table and rate bucket shared across processes."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # -------------------------------------------------------------------------
+    # Result cache
+    # -------------------------------------------------------------------------
+    def cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT value FROM result_cache WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cache_put(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO result_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl_seconds),
+        )
+        conn.execute("DELETE FROM result_cache WHERE expires_at <= ?", (now,))
+
+    def cache_delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM result_cache WHERE key = ?", (key,))
+
+    # -------------------------------------------------------------------------
+    # In-flight deduplication
+    # -------------------------------------------------------------------------
+    def new_owner(self) -> str:
+        """Lease owner token of one computation (unique across threads and processes)."""
+        return f"{self.owner}-{uuid.uuid4().hex[:8]}"
+
+    def claim(self, key: str, lease_seconds: float, owner: str) -> bool:
+        """Try to make `owner` responsible for `key` (it may renew its own lease)."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT owner, expires_at FROM inflight WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO inflight (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, now + lease_seconds),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, key: str, owner: str) -> None:
+        self._conn().execute(
+            "DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner)
+        )
+
+    def _renew_lease(self, key: str, lease_seconds: float, owner: str, done: threading.Event) -> None:
+        """Extend the lease every lease_seconds / 3 until `done`, so long analyses keep it."""
+        while not done.wait(lease_seconds / 3):
+            try:
+                if not self.claim(key, lease_seconds, owner):
+                    return
+            except sqlite3.Error as exc:
+                print(f"   ⚠️ Could not renew the lease of {key}: {exc}")
+
+    def run_once(
+        self,
+        key: str,
+        compute: Callable[[], Dict[str, Any]],
+        ttl_seconds: float,
+        lease_seconds: float = 300,
+        poll_seconds: float = 0.5,
+        cancel_token: Optional[CancelToken] = None,
+    ) -> Dict[str, Any]:
+        """Return the cached result for `key`, computing it at most once across workers.
+
+        Only successful results are cached. If the worker holding the lease
+        fails, is cancelled or dies, a waiting worker claims the key and
+        computes it itself. Each call is its own lease owner, so two threads
+        of one worker do not both compute the key either. The lease is renewed
+        while `compute` runs, however long it takes.
+        """
+        owner = self.new_owner()
+        while True:
+            cached = self.cache_get(key)
+            if cached is not None:
+                metrics.incr("shared_state.cache_hit")
+                cached["cached"] = True
+                return cached
+
+            if self.claim(key, lease_seconds, owner):
+                metrics.incr("shared_state.cache_miss")
+                done = threading.Event()
+                threading.Thread(
+                    target=self._renew_lease,
+                    args=(key, lease_seconds, owner, done),
+                    name="lease-heartbeat",
+                    daemon=True,
+                ).start()
+                try:
+                    result = compute()
+                    if result.get("success") and ttl_seconds > 0:
+                        self.cache_put(key, result, ttl_seconds)
+                    return result
+                finally:
+                    done.set()
+                    self.release(key, owner)
+
+            metrics.incr("shared_state.dedup_wait")
+            if cancel_token:
+                cancel_token.sleep(poll_seconds, "dedup_wait")
+            else:
+                time.sleep(poll_seconds)
+
+    # -------------------------------------------------------------------------
+    # Shared rate budget (token bucket)
+    # -------------------------------------------------------------------------
+    def try_acquire(self, bucket: str, per_minute: float, burst: float) -> float:
+        """Take one token from `bucket`. Returns 0 on success, else seconds to wait."""
+        conn = self._conn()
+        now = time.time()
+        rate = per_minute / 60.0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (bucket,)
+            ).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (bucket, tokens, now),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire(
+        self,
+        bucket: str,
+        per_minute: float,
+        burst: float,
+        cancel_token: Optional[CancelToken] = None,
+    ) -> float:
+        """Block until a token is available. Returns total seconds waited."""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(bucket, per_minute, burst)
+            if wait <= 0:
+                if waited:
+                    metrics.incr("shared_state.rate_limited")
+                return waited
+            wait = min(wait, 1.0)
+            if cancel_token:
+                cancel_token.sleep(wait, "rate_limit")
+            else:
+                time.sleep(wait)
+            waited += wait
+
+
+    # -------------------------------------------------------------------------
+    # Stream events
+    # -------------------------------------------------------------------------
+    def stream_publish(
+        self,
+        analysis_id: str,
+        seq: int,
+        event: str,
+        data: Dict[str, Any],
+        final: bool,
+        retention_seconds: float,
+    ) -> None:
+        """Store one event; after the final one the stream expires in `retention_seconds`."""
+        conn = self._conn()
+        now = time.time()
+        expires_at = now + (retention_seconds if final else RUNNING_STREAM_TTL_SECONDS)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO stream_events (analysis_id, seq, event, data) "
+                "VALUES (?, ?, ?, ?)",
+                (analysis_id, seq, event, json.dumps(data, ensure_ascii=False, default=str)),
+            )
+            conn.execute(
+                "INSERT INTO streams (analysis_id, expires_at) VALUES (?, ?) "
+                "ON CONFLICT (analysis_id) DO UPDATE SET expires_at = excluded.expires_at",
+                (analysis_id, expires_at),
+            )
+            if final:
+                expired = [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT analysis_id FROM streams WHERE expires_at <= ?", (now,)
+                    )
+                ]
+                for expired_id in expired:
+                    conn.execute("DELETE FROM stream_events WHERE analysis_id = ?", (expired_id,))
+                    conn.execute("DELETE FROM streams WHERE analysis_id = ?", (expired_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stream_exists(self, analysis_id: str) -> bool:
+        """True for a running stream or one within its retention window."""
+        return self._conn().execute(
+            "SELECT 1 FROM streams WHERE analysis_id = ? AND expires_at > ?",
+            (analysis_id, time.time()),
+        ).fetchone() is not None
+
+    def stream_events(
+        self, analysis_id: str, after_seq: int = 0
+    ) -> Optional[List[Tuple[int, str, Any]]]:
+        """(seq, event, data) after `after_seq`; None if the stream is unknown or expired."""
+        if not self.stream_exists(analysis_id):
+            return None
+        rows = self._conn().execute(
+            "SELECT seq, event, data FROM stream_events "
+            "WHERE analysis_id = ? AND seq > ? ORDER BY seq",
+            (analysis_id, after_seq),
+        ).fetchall()
+        return [(seq, event, json.loads(data)) for seq, event, data in rows]
+
+    def stream_attach(self, analysis_id: str, seconds: float) -> None:
+        """Tell the stream's worker that a client elsewhere follows it for `seconds`."""
+        self._conn().execute(
+            "UPDATE streams SET attached_until = ? WHERE analysis_id = ?",
+            (time.time() + seconds, analysis_id),
+        )
+
+    def stream_attached(self, analysis_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT attached_until FROM streams WHERE analysis_id = ?", (analysis_id,)
+        ).fetchone()
+        return bool(row) and row[0] > time.time()
+
+
+_shared_state: Optional[SharedState] = None
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedState:
+    """Process-wide SharedState opened lazily at SHARED_STATE_PATH."""
+    global _shared_state
+    with _shared_state_lock:
+        if _shared_state is None:
+            _shared_state = SharedState(settings.SHARED_STATE_PATH)
+        return _shared_state
+
+
+def acquire_gemini_budget(model: str, cancel_token: Optional[CancelToken] = None) -> None:
+    """Wait for the shared Gemini request budget (no-op when unlimited)."""
+    if settings.GEMINI_REQUESTS_PER_MINUTE <= 0:
+        return
+    get_shared_state().acquire(
+        f"gemini:{model}",
+        settings.GEMINI_REQUESTS_PER_MINUTE,
+        settings.GEMINI_BURST,
+        cancel_token=cancel_token,
+    )
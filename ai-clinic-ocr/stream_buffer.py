@@ -0,0 +1,261 @@
+"""
+Resumable Server-Sent Event streams for /analyze/stream.
+
+Every streamed analysis gets an AnalysisStream that keeps all of its events
+(with increasing ids) for STREAM_RETENTION_SECONDS after the final event. A
+client whose connection dropped reconnects with the last id it saw
+(`Last-Event-ID`, or `GET /analyze/stream/{analysis_id}`) and gets the missed
+progress and the result replayed without a new Gemini call.
+
+Event ids are "<analysis_id>:<seq>", so `Last-Event-ID` alone identifies the
+analysis. The work is only cancelled once nobody has been attached for
+STREAM_RESUME_GRACE_SECONDS.
+
+Events are buffered in the memory of the analysing worker and copied to the
+shared state (SQLite, see shared_state). A reconnect that lands on another
+worker, or on another replica sharing SHARED_STATE_PATH, follows the
+analysis from there (SharedStream) and keeps it from being cancelled.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from cancellation import CancelToken
+from config import settings
+from metrics import metrics
+from shared_state import get_shared_state
+
+FINAL_EVENTS = ("result", "error")
+# How often a SharedStream looks for new events of another worker's analysis
+SHARED_POLL_SECONDS = 1.0
+
+
+@dataclass
+class StreamEvent:
+    seq: int
+    event: str
+    data: Dict[str, Any]
+
+    @property
+    def final(self) -> bool:
+        return self.event in FINAL_EVENTS
+
+
+def parse_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """("<analysis_id>:<seq>" | "<seq>") -> (analysis_id or None, seq)."""
+    if not value:
+        return None, 0
+    analysis_id, _, seq = value.strip().rpartition(":")
+    try:
+        return analysis_id or None, max(0, int(seq))
+    except ValueError:
+        return None, 0
+
+
+class AnalysisStream:
+    """Event buffer of one analysis; written by the worker thread, read by any number of connections."""
+
+    def __init__(self, analysis_id: str, cancel_token: CancelToken) -> None:
+        self.analysis_id = analysis_id
+        self.cancel_token = cancel_token
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._events: List[StreamEvent] = []
+        self._wakeups: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self._attached = 0
+        self._grace_timer: Optional[threading.Timer] = None
+        # Keeps events in the shared state in seq order
+        self._share_lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def event_id(self, event: StreamEvent) -> str:
+        return f"{self.analysis_id}:{event.seq}"
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        """Append an event (thread-safe), share it and wake up every attached connection."""
+        with self._share_lock:
+            with self._lock:
+                if self.finished:
+                    return
+                item = StreamEvent(len(self._events) + 1, event, data)
+                self._events.append(item)
+                if item.final:
+                    self.finished_at = time.monotonic()
+                    if self._grace_timer:
+                        self._grace_timer.cancel()
+                wakeups = list(self._wakeups)
+            self._share(item)
+        for loop, wakeup in wakeups:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # Event loop already closed (server shutting down)
+                pass
+
+    def _share(self, item: StreamEvent) -> None:
+        try:
+            get_shared_state().stream_publish(
+                self.analysis_id, item.seq, item.event, item.data, item.final,
+                settings.STREAM_RETENTION_SECONDS,
+            )
+        except Exception as exc:
+            # Resuming through this worker still works
+            metrics.incr("stream.share_failed")
+            print(f"   ⚠️ Could not share stream event {self.event_id(item)}: {exc}")
+
+    def events_after(self, seq: int) -> List[StreamEvent]:
+        with self._lock:
+            return self._events[seq:]
+
+    # -------------------------------------------------------------------------
+    # Connections
+    # -------------------------------------------------------------------------
+    def _attach(self, wakeup: Tuple[asyncio.AbstractEventLoop, asyncio.Event]) -> None:
+        with self._lock:
+            self._wakeups.append(wakeup)
+            self._attached += 1
+            if self._grace_timer:
+                self._grace_timer.cancel()
+                self._grace_timer = None
+
+    def _detach(self, wakeup: Tuple[asyncio.AbstractEventLoop, asyncio.Event]) -> None:
+        with self._lock:
+            self._wakeups.remove(wakeup)
+            self._attached -= 1
+            if self._attached or self.finished:
+                return
+            metrics.incr("stream.detached")
+            self._start_grace_timer()
+
+    def _start_grace_timer(self) -> None:
+        """Keep working for a while in case the client comes back (called with the lock held)."""
+        self._grace_timer = threading.Timer(
+            settings.STREAM_RESUME_GRACE_SECONDS, self._cancel_if_abandoned
+        )
+        self._grace_timer.daemon = True
+        self._grace_timer.start()
+
+    def _cancel_if_abandoned(self) -> None:
+        try:
+            # The client came back through another worker
+            elsewhere = get_shared_state().stream_attached(self.analysis_id)
+        except Exception:
+            elsewhere = False
+        with self._lock:
+            if self._attached or self.finished:
+                return
+            if elsewhere:
+                self._start_grace_timer()
+                return
+        metrics.incr("analysis.client_disconnected")
+        self.cancel_token.cancel("client disconnected")
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncIterator[Optional[StreamEvent]]:
+        """Events after `after_seq` up to the final one; None means "send a heartbeat"."""
+        wakeup = (asyncio.get_running_loop(), asyncio.Event())
+        self._attach(wakeup)
+        try:
+            while True:
+                wakeup[1].clear()
+                for item in self.events_after(after_seq):
+                    yield item
+                    after_seq = item.seq
+                    if item.final:
+                        return
+                try:
+                    await asyncio.wait_for(
+                        wakeup[1].wait(), timeout=settings.STREAM_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._detach(wakeup)
+
+
+class SharedStream:
+    """A stream of another worker process or replica, read from the shared state.
+
+    Follows the analysis to its final event, and tells its worker that a
+    client is still attached so the analysis is not cancelled as abandoned.
+    """
+
+    def __init__(self, analysis_id: str) -> None:
+        self.analysis_id = analysis_id
+
+    def event_id(self, event: StreamEvent) -> str:
+        return f"{self.analysis_id}:{event.seq}"
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncIterator[Optional[StreamEvent]]:
+        """Events after `after_seq` up to the final one; None means "send a heartbeat"."""
+        state = get_shared_state()
+        idle = 0.0
+        while True:
+            await asyncio.to_thread(
+                state.stream_attach, self.analysis_id, settings.STREAM_RESUME_GRACE_SECONDS
+            )
+            events = await asyncio.to_thread(state.stream_events, self.analysis_id, after_seq)
+            if events is None:
+                # Expired, or its worker died before the final event
+                yield StreamEvent(after_seq + 1, "error", {"error": "Analysis expired"})
+                return
+            for seq, event, data in events:
+                item = StreamEvent(seq, event, data)
+                yield item
+                after_seq = seq
+                if item.final:
+                    return
+            idle = 0.0 if events else idle + SHARED_POLL_SECONDS
+            if idle >= settings.STREAM_HEARTBEAT_SECONDS:
+                idle = 0.0
+                yield None
+            await asyncio.sleep(SHARED_POLL_SECONDS)
+
+
+class StreamRegistry:
+    """Streams by analysis id; finished ones are dropped after the retention window."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._streams: Dict[str, AnalysisStream] = {}
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - settings.STREAM_RETENTION_SECONDS
+        for analysis_id, stream in list(self._streams.items()):
+            if stream.finished and stream.finished_at < cutoff:
+                del self._streams[analysis_id]
+
+    def create(self, cancel_token: CancelToken) -> AnalysisStream:
+        stream = AnalysisStream(uuid.uuid4().hex, cancel_token)
+        with self._lock:
+            self._prune()
+            self._streams[stream.analysis_id] = stream
+        return stream
+
+    def get(self, analysis_id: str) -> Optional[AnalysisStream]:
+        with self._lock:
+            self._prune()
+            return self._streams.get(analysis_id)
+
+    def find(self, analysis_id: str) -> Optional[Union[AnalysisStream, SharedStream]]:
+        """The stream of this worker, else a SharedStream if another worker has it."""
+        stream = self.get(analysis_id)
+        if stream is not None:
+            return stream
+        if not get_shared_state().stream_exists(analysis_id):
+            return None
+        return SharedStream(analysis_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._streams)
+
+
+streams = StreamRegistry()
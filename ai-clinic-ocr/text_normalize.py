@@ -0,0 +1,304 @@
+"""
+Normalization of patient names and phone numbers.
+
+Used for indexed lookups in the extraction store and for duplicate-patient
+matching, so that the spellings a clinic actually sees end up on the same
+key:
+
+- phones: "+20 100 123 4567", "0020-1001234567", "1001234567" and
+  "٠١٠٠١٢٣٤٥٦٧" are all "01001234567"
+- Arabic: diacritics and tatweel removed, alef / ya / ta marbuta variants
+  folded ("أحمد" = "احمد", "مصطفى" = "مصطفي", "فاطمة" = "فاطمه")
+- names across scripts: `name_skeleton` reduces both "Mohamed" / "Muhammad"
+  and "محمد" to "mhmd"
+
+The skeleton is coarse on purpose: it is a blocking key, and also reduces
+"Mahmoud" / "محمود" to "mhmd". Whether two first names are the same is
+decided on `given_name`, which keeps the vowels (see same_given_name).
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Harakat, superscript alef and tatweel
+_ARABIC_DIACRITICS = re.compile("[\u064b-\u0652\u0670\u0640]")
+
+_ARABIC_FOLD = str.maketrans(
+    {
+        "أ": "ا",
+        "إ": "ا",
+        "آ": "ا",
+        "ٱ": "ا",
+        "ى": "ي",
+        "ئ": "ي",
+        "ؤ": "و",
+        "ة": "ه",
+    }
+)
+
+# Arabic letter -> Latin consonant as Egyptian names are usually transliterated.
+# Long vowels (ا و ي), ع and ء carry no consonant in Latin spellings.
+_ARABIC_TO_LATIN = str.maketrans(
+    {
+        "ا": "", "و": "", "ي": "", "ع": "", "ء": "",
+        "ب": "b", "ت": "t", "ث": "t", "ج": "g", "ح": "h", "خ": "k",
+        "د": "d", "ذ": "z", "ر": "r", "ز": "z", "س": "s", "ش": "s",
+        "ص": "s", "ض": "d", "ط": "t", "ظ": "z", "غ": "g", "ف": "f",
+        "ق": "k", "ك": "k", "ل": "l", "م": "m", "ن": "n", "ه": "h",
+    }
+)
+
+# Latin digraphs and letters folded onto the same consonants
+_LATIN_DIGRAPHS = (("kh", "k"), ("sh", "s"), ("th", "t"), ("dh", "z"), ("gh", "g"), ("ph", "f"))
+_LATIN_LETTERS = str.maketrans({"q": "k", "c": "k", "j": "g", "x": "ks", "v": "f"})
+_LATIN_VOWELS = re.compile("[aeiouyw']")
+_REPEATS = re.compile(r"(.)\1+")
+
+# Particles that are written attached or detached ("El Sayed" / "Elsayed")
+_ARABIC_ARTICLE = "ال"
+_LATIN_ARTICLES = ("el", "al")
+
+# "Abd" compounds, attached or not: "Abdelrahman", "Abdul Rahman", "عبدالرحمن"
+_LATIN_ABD = re.compile("^abd(?:el|ul|al|u|e|a)?(?=.)")
+_ARABIC_ABD = "عبد"
+
+
+def _is_arabic(text: str) -> bool:
+    return any("\u0600" <= ch <= "\u06ff" for ch in text)
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Digits only, in the local Egyptian format (trunk 0, no country code).
+
+    Arabic-Indic digits are converted; the country code is dropped from
+    mobile and landline numbers alike, and a mobile number written without
+    its leading 0 ("1001234567") gets it back.
+    """
+    if not phone:
+        return None
+    digits = "".join(str(unicodedata.digit(ch)) for ch in phone if ch.isdigit())
+    if digits.startswith("0020"):
+        digits = "0" + digits[4:]
+    elif digits.startswith("20") and len(digits) in (11, 12):
+        # Country code before a national number: 10-digit mobile or
+        # 9-digit landline ("+20 2 2345 6789" is Cairo 02 2345 6789)
+        digits = "0" + digits[2:]
+    elif digits.startswith("1") and len(digits) == 10:
+        digits = "0" + digits
+    return digits or None
+
+
+def normalize_arabic(text: str) -> str:
+    """Remove diacritics and tatweel and fold alef / ya / ta marbuta variants."""
+    return _ARABIC_DIACRITICS.sub("", text).translate(_ARABIC_FOLD)
+
+
+def normalize_name(name: Optional[str]) -> Optional[str]:
+    """Case-folded name with collapsed whitespace and normalized Arabic letters."""
+    if not name:
+        return None
+    name = normalize_arabic(unicodedata.normalize("NFKC", name))
+    return " ".join(name.casefold().split()) or None
+
+
+def _arabic_stem(token: str) -> str:
+    """Token without article and final ه."""
+    if token.startswith(_ARABIC_ARTICLE) and len(token) > 3:
+        token = token[len(_ARABIC_ARTICLE):]
+    # Final ه (and ta marbuta, folded to it) is written as a vowel in
+    # Latin spellings: "Fatma", "Taha", "Abdullah"
+    if token.endswith("ه") and len(token) > 1:
+        return token[:-1]
+    return token
+
+
+def _latin_stem(token: str) -> str:
+    """Token without article, with Latin spelling variants folded."""
+    for article in _LATIN_ARTICLES:
+        if token.startswith(article) and len(token) > len(article) + 2:
+            token = token[len(article):]
+            break
+    # "Fatmah" / "Fatma": a final h after a vowel is not pronounced
+    token = re.sub("([aeiou])h$", r"\1", token)
+    for digraph, letter in _LATIN_DIGRAPHS:
+        token = token.replace(digraph, letter)
+    return token.translate(_LATIN_LETTERS)
+
+
+@lru_cache(maxsize=65536)
+def _token_skeleton(token: str) -> str:
+    if _is_arabic(token):
+        skeleton = _arabic_stem(token).translate(_ARABIC_TO_LATIN)
+    else:
+        skeleton = _LATIN_VOWELS.sub("", _latin_stem(token))
+    return _REPEATS.sub(r"\1", skeleton)
+
+
+def name_skeleton(name: Optional[str]) -> List[str]:
+    """Consonant skeleton per name token, comparable across Arabic and Latin script.
+
+    "Mohamed El-Sayed" and "محمد السيد" both give ["mhmd", "sd"]. Articles
+    standing alone ("El Sayed") are dropped, so they match the attached form.
+    """
+    normalized = normalize_name(name)
+    if not normalized:
+        return []
+    tokens = re.split(r"[\s\-_.,]+", normalized)
+    skeletons = []
+    for token in tokens:
+        if not token or token in _LATIN_ARTICLES or token == _ARABIC_ARTICLE:
+            continue
+        if token in ("abdel", "abdul", "abdal"):
+            token = "abd"
+        abd = _LATIN_ABD.match(token)
+        if abd or (token.startswith(_ARABIC_ABD) and token != _ARABIC_ABD):
+            skeletons.append("bd")
+            token = token[abd.end() if abd else len(_ARABIC_ABD):]
+        skeleton = _token_skeleton(token)
+        if skeleton:
+            skeletons.append(skeleton)
+    return skeletons
+
+
+
+
+# =============================================================================
+# First names
+# =============================================================================
+# Vowels of a name slot: a Latin vowel run or the long vowels (ا و ي) between
+# two consonants in Arabic. "e" spells both a fatha and a kasra ("Mohamed",
+# "Khaled" / "Khalid").
+_ARABIC_VOWELS = {"ا": "a", "و": "u", "ي": "i"}
+_ARABIC_SILENT = set("اويعء")
+_LATIN_SLOT = re.compile("[aeiouyw']")
+
+
+@lru_cache(maxsize=4096)
+def _latin_vowel(run: str) -> Tuple[str, bool]:
+    """(vowel classes, long) of a Latin vowel run; ("", False) for no vowel."""
+    core = re.sub("[yw']", "", run)
+    if not core:
+        return ("i" if "y" in run else "u" if "w" in run else ""), False
+    if set(core) <= set("ou"):
+        classes = "u"
+    elif "i" in core or "y" in run or "ee" in core:
+        classes = "i"
+    elif core == "e":
+        classes = "ai"
+    else:
+        classes = "a"
+    return classes, len(core) > 1
+
+
+@lru_cache(maxsize=4096)
+def _arabic_vowel(run: str) -> Tuple[str, bool]:
+    classes = "".join(_ARABIC_VOWELS[ch] for ch in run if ch in _ARABIC_VOWELS)
+    return classes, bool(classes)
+
+
+@lru_cache(maxsize=65536)
+def _slots(token: str, arabic: bool) -> Tuple[str, Tuple[str, ...]]:
+    """Consonants of a first name and the vowel run before, between and after them.
+
+    A consonant written twice with at most a short vowel between ("Mamdouh",
+    "Mohammed") is one consonant, as in the skeleton.
+    """
+    silent = _ARABIC_SILENT if arabic else None
+    consonants, slots = "", [""]
+    for ch in token:
+        if (ch in silent) if arabic else _LATIN_SLOT.match(ch):
+            slots[-1] += ch
+            continue
+        letter = ch.translate(_ARABIC_TO_LATIN) if arabic else ch
+        vowel = (_arabic_vowel if arabic else _latin_vowel)(slots[-1])
+        if consonants.endswith(letter) and not vowel[1]:
+            continue
+        consonants += letter
+        slots.append("")
+    return consonants, tuple(slots)
+
+
+def given_name(name: Optional[str]) -> Optional[Tuple[str, str, Tuple[str, ...]]]:
+    """First name as (script, consonants, vowel slots), for same_given_name.
+
+    "Abd" compounds are one first name: "Abdel Rahman" = "Abdelrahman".
+    """
+    normalized = normalize_name(name)
+    if not normalized:
+        return None
+    tokens = [
+        token
+        for token in re.split(r"[\s\-_.,]+", normalized)
+        if token and token not in _LATIN_ARTICLES and token != _ARABIC_ARTICLE
+    ]
+    if not tokens:
+        return None
+    first, prefix = tokens[0], ""
+    abd = _LATIN_ABD.match(first)
+    if first in ("abd", "abdel", "abdul", "abdal", _ARABIC_ABD) and len(tokens) > 1:
+        first, prefix = tokens[1], "bd|"
+    elif abd or (first.startswith(_ARABIC_ABD) and first != _ARABIC_ABD):
+        first, prefix = first[abd.end() if abd else len(_ARABIC_ABD):], "bd|"
+    arabic = _is_arabic(first)
+    if not arabic and re.search("[^aeiouy]e$", first):
+        first = first[:-1]  # silent e: "Yasmine", "Nadine"
+    consonants, slots = _slots(_arabic_stem(first) if arabic else _latin_stem(first), arabic)
+    return ("ar" if arabic else "latin"), prefix + consonants, slots
+
+
+def _latin_slot_cost(a: str, b: str) -> float:
+    (va, long_a), (vb, long_b) = _latin_vowel(a), _latin_vowel(b)
+    if not va or not vb:
+        # A short a / o / u spelled or not ("Amr" / "Amro"); an i ("Amr" /
+        # "Amir") or a long vowel is usually a written ي / و / ا
+        return 0.0 if va == vb else 1.0 if long_a or long_b or "i" in va + vb else 0.5
+    return 0.0 if set(va) & set(vb) else 1.0
+
+
+def _cross_slot_cost(latin: str, arabic: str) -> float:
+    (vl, long_l), (va, _) = _latin_vowel(latin), _arabic_vowel(arabic)
+    if not va:
+        # Arabic does not write short vowels, Latin ones may be anything
+        return 1.0 if long_l else 0.0
+    return 0.0 if set(vl) & set(va) else 1.0
+
+
+def _initial_cost(latin: str, arabic: str) -> float:
+    # Initial y / w and ي / و are consonants; a vowel-initial Arabic name
+    # starts with ا or ع, whose vowel quality Latin spellings do not keep
+    lead_l = latin[:1] if latin[:1] in ("y", "w") else ""
+    lead_a = arabic[:1] if arabic[:1] in ("ي", "و") else ""
+    if bool(lead_l) != bool(lead_a):
+        return 1.0
+    if lead_l:
+        return _cross_slot_cost(latin[1:], arabic[1:])
+    return 0.0 if bool(latin) == bool(arabic) else 1.0
+
+
+@lru_cache(maxsize=65536)
+def same_given_name(
+    a: Optional[Tuple[str, str, Tuple[str, ...]]], b: Optional[Tuple[str, str, Tuple[str, ...]]]
+) -> bool:
+    """Whether two `given_name`s are the same first name.
+
+    Unlike the skeleton, vowels count: two Latin spellings may differ in one
+    short vowel ("Amr" / "Amro") but not in a vowel's quality ("Omar" /
+    "Amr", "Hassan" / "Hussein"), an i ("Amr" / "Amir", so also "Fatma" /
+    "Fatima") or a long vowel ("Mahmoud" / "Mohamed"). Against Arabic, the long vowels Arabic writes
+    must be spelled and vice versa ("Mahmoud" = "محمود" != "محمد"); the
+    final vowel is not compared across scripts ("Mostafa" / "مصطفى").
+    """
+    if a is None or b is None or a[1] != b[1]:
+        return False
+    if a[0] == b[0] == "ar":
+        return a[2] == b[2]
+    if a[0] == b[0]:
+        cost = sum(_latin_slot_cost(x, y) for x, y in zip(a[2], b[2]))
+        return cost < 1.0
+    latin, arabic = (a[2], b[2]) if a[0] == "latin" else (b[2], a[2])
+    cost = _initial_cost(latin[0], arabic[0]) + sum(
+        _cross_slot_cost(x, y) for x, y in zip(latin[1:-1], arabic[1:-1])
+    )
+    return cost < 1.0
@@ -0,0 +1,129 @@
+"""
+Startup warm-up of every heavy component of the analysis pipeline.
+
+Without it the first upload after a deploy or autoscale event pays for
+validator compilation, MuPDF initialisation and Gen AI client construction.
+`run_warmup()` is started from the FastAPI lifespan; `warmup_state` backs
+the `/ready` endpoint, which only reports ready once warm-up has finished.
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+
+
+class WarmupState:
+    """Progress of the warm-up, readable from any thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.status = "pending"  # pending -> running -> ready | failed
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.components: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def set_status(self, status: str) -> None:
+        with self._lock:
+            self.status = status
+            stamp = datetime.now().isoformat()
+            if status == "running":
+                self.started_at = stamp
+            elif status in ("ready", "failed"):
+                self.finished_at = stamp
+
+    def record(self, name: str, seconds: float, error: Optional[str] = None) -> None:
+        with self._lock:
+            entry: Dict[str, Any] = {"seconds": round(seconds, 3), "ok": error is None}
+            if error:
+                entry["error"] = error
+            self.components[name] = entry
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "status": self.status,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "components": dict(self.components),
+            }
+
+
+warmup_state = WarmupState()
+
+
+def _warm_schemas() -> None:
+    from schema_registry import registry
+
+    registry.warm()
+
+
+def _warm_pdf_renderer() -> None:
+    from engines import load_pymupdf
+
+    fitz = load_pymupdf()
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    page.insert_text((20, 40), "warmup")
+    page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0)).tobytes("jpeg")
+    page.get_text()
+    doc.close()
+
+
+def _warm_genai_client() -> None:
+    import medical_ocr_fast
+
+    if medical_ocr_fast.GEMINI_API_KEY:
+        medical_ocr_fast._make_client(None)
+
+
+def _warm_context_cache() -> None:
+    import medical_ocr_fast
+
+    if medical_ocr_fast.GEMINI_API_KEY:
+        client = medical_ocr_fast._make_client(None)
+        medical_ocr_fast.prompt_cache.get(client, settings.GEMINI_MODEL)
+
+
+def _warm_patient_index() -> None:
+    from patient_matching import get_patient_index
+
+    get_patient_index()
+
+
+def warmup_steps() -> List[Tuple[str, Callable[[], None]]]:
+    steps = [
+        ("schemas", _warm_schemas),
+        ("pdf_renderer", _warm_pdf_renderer),
+        ("genai_client", _warm_genai_client),
+    ]
+    if settings.EXTRACTION_STORE_ENABLED and settings.PATIENT_MATCHING_ENABLED:
+        steps.append(("patient_index", _warm_patient_index))
+    if settings.WARMUP_NETWORK:
+        steps.append(("context_cache", _warm_context_cache))
+    return steps
+
+
+def run_warmup() -> Dict[str, Any]:
+    """Touch every heavy component once. Optional components may fail softly."""
+    warmup_state.set_status("running")
+    failed = False
+    for name, step in warmup_steps():
+        start = time.perf_counter()
+        try:
+            step()
+            warmup_state.record(name, time.perf_counter() - start)
+        except Exception as exc:
+            print(f"   ⚠️ Warm-up step {name} failed: {exc}")
+            warmup_state.record(name, time.perf_counter() - start, error=str(exc))
+            # Network warm-up is best effort; local components must work
+            failed = failed or name != "context_cache"
+
+    warmup_state.set_status("failed" if failed else "ready")
+    return warmup_state.snapshot()